@@ -0,0 +1,217 @@
+# bench_e2e.py
+#
+# Offline end-to-end benchmark: DemoAgent and run_inference driven headlessly by a
+# scripted LLM replaying recorded CodeAct transcripts (benchmarks/transcripts/*.json).
+# No API key or network is needed. Reports per-turn latency (p50/p95), time to first
+# token, executor overhead, memory serialization cost and peak memory.
+#
+#   python benchmarks/bench_e2e.py --output e2e.json
+#   python benchmarks/bench_e2e.py --baseline e2e.json       # exits 1 on regression
+#   python benchmarks/bench_e2e.py --delta-delay 0.005       # simulate a streaming model
+
+from typing import Dict, List
+import statistics
+import tracemalloc
+import argparse
+import resource
+import asyncio
+import time
+import json
+import sys
+import os
+
+# Offline settings: dummy credentials, in-memory city cache
+os.environ.setdefault("AGENT_NAME", "globalKyc")
+os.environ.setdefault("LLM", "scripted")
+os.environ.setdefault("GROK_API_KEY", "benchmark")
+os.environ["CITY_CACHE_PATH"] = ":memory:"
+
+# Add the parent directory (project root) to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from llama_index.core.workflow import Context
+
+from benchmarks.scripted_llm import ScriptedLLM, load_transcripts
+from src.city_lookup import get_city_lookup
+from src.conversation_memory import ConversationMemory
+from src.inference import run_inference
+import src.demo_agent as demo_agent
+
+DEFAULT_TRANSCRIPTS = os.path.join(os.path.dirname(__file__), "transcripts", "codeact.json")
+
+# Offline population table for the zone lookups of the leasing tools
+CITIES = [
+    ("Santo Domingo", "DO", 965040),
+    ("Santiago", "DO", 691262),
+    ("La Romana", "DO", 139671),
+    ("Bani", "DO", 48000),
+    ("Jarabacoa", "DO", 29000),
+]
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile (q in 0..100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(q / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "mean": statistics.fmean(values) if values else 0.0,
+        "n": len(values),
+    }
+
+
+class ExecutorProbe:
+    """Wraps an executor's `run` to time each execution from the agent's side."""
+
+    def __init__(self, executor):
+        self.executor = executor
+        self.run = executor.run
+        self.executions: List[Dict[str, float]] = []
+        executor.run = self._run
+
+    def _run(self, code):
+        start = time.perf_counter()
+        result = self.run(code)
+        wall = time.perf_counter() - start
+        exec_s = result.timings.get("exec", 0.0)
+        self.executions.append({"wall": wall, "exec": exec_s, "overhead": wall - exec_s})
+        return result
+
+
+async def run_conversation(llm: ScriptedLLM, conversation: dict) -> List[Dict]:
+    """Replay one conversation on a fresh agent; returns per-turn measurements."""
+    llm.load([r for turn in conversation["turns"] for r in turn["responses"]])
+    agent = demo_agent.DemoAgent()
+    memory = ConversationMemory()
+    probe = ExecutorProbe(agent.code_executor)
+
+    turns = []
+    for turn in conversation["turns"]:
+        executed = len(probe.executions)
+        chunks, metrics = await run_inference(agent, turn["query"], Context(agent._agent), memory=memory)
+        runs = probe.executions[executed:]
+        turns.append({
+            "latency": metrics["total"],
+            "ttft": metrics["ttft"] or 0.0,
+            "exec": sum(r["exec"] for r in runs),
+            "executor_overhead": sum(r["overhead"] for r in runs),
+            "executions": len(runs),
+            "serialize": memory.stats[-1]["serialize_time"],
+            "delta_bytes": memory.stats[-1]["delta_bytes"],
+            "chunks": len(chunks),
+        })
+
+    if llm.calls != len(llm.responses):
+        raise RuntimeError(
+            f"{conversation['name']}: agent made {llm.calls} LLM calls, script has {len(llm.responses)}"
+        )
+    agent.close()
+    return turns
+
+
+def run(args) -> Dict:
+    llm = ScriptedLLM(
+        delta_chars=args.delta_chars,
+        first_token_delay=args.first_token_delay,
+        delta_delay=args.delta_delay,
+    )
+    demo_agent.llm = llm
+    get_city_lookup().preload(CITIES)
+    conversations = load_transcripts(args.transcripts)
+
+    async def main():
+        # Warm-up: imports, tool schemas, compile cache
+        for conversation in conversations:
+            await run_conversation(llm, conversation)
+
+        if args.trace_memory:
+            tracemalloc.start()
+        turns = []
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for conversation in conversations:
+                turns.extend(await run_conversation(llm, conversation))
+        wall = time.perf_counter() - start
+        traced_peak = tracemalloc.get_traced_memory()[1] if args.trace_memory else None
+        tracemalloc.stop()
+        return turns, wall, traced_peak
+
+    turns, wall, traced_peak = asyncio.run(main())
+
+    # Linux reports ru_maxrss in KB, macOS in bytes
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss = maxrss if sys.platform == "darwin" else maxrss * 1024
+
+    return {
+        "turns": len(turns),
+        "wall_s": wall,
+        "latency_s": summarize([t["latency"] for t in turns]),
+        "ttft_s": summarize([t["ttft"] for t in turns]),
+        "exec_s": summarize([t["exec"] for t in turns]),
+        "executor_overhead_s": summarize([t["executor_overhead"] for t in turns if t["executions"]]),
+        "framework_s": summarize([t["latency"] - t["exec"] - t["executor_overhead"] for t in turns]),
+        "serialize_s": summarize([t["serialize"] for t in turns]),
+        "delta_bytes": summarize([t["delta_bytes"] for t in turns]),
+        "peak_rss_mb": peak_rss / 2**20,
+        "peak_traced_mb": traced_peak / 2**20 if traced_peak is not None else None,
+        "settings": {
+            "transcripts": os.path.basename(args.transcripts),
+            "repeat": args.repeat,
+            "executor_backend": demo_agent.EXECUTOR_BACKEND,
+            "delta_chars": args.delta_chars,
+            "first_token_delay": args.first_token_delay,
+            "delta_delay": args.delta_delay,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark for DemoAgent")
+    parser.add_argument("--transcripts", default=DEFAULT_TRANSCRIPTS, help="recorded conversations (JSON)")
+    parser.add_argument("--repeat", type=int, default=5, help="times every conversation is replayed")
+    parser.add_argument("--delta-chars", type=int, default=8, help="characters per streamed delta")
+    parser.add_argument("--first-token-delay", type=float, default=0.0, help="simulated TTFT in seconds")
+    parser.add_argument("--delta-delay", type=float, default=0.0, help="simulated seconds between deltas")
+    parser.add_argument("--trace-memory", action="store_true", help="also report the tracemalloc peak (slower)")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="compare against a previous JSON result")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown vs. baseline")
+    args = parser.parse_args()
+
+    results = run(args)
+
+    print(f"{results['turns']} turns in {results['wall_s']:.2f}s")
+    for key in ("latency_s", "ttft_s", "exec_s", "executor_overhead_s", "framework_s", "serialize_s"):
+        stats = results[key]
+        print(f"  {key:<20} p50 {stats['p50'] * 1000:9.2f} ms   p95 {stats['p95'] * 1000:9.2f} ms")
+    print(f"  {'peak_rss':<20} {results['peak_rss_mb']:.1f} MB")
+    if results["peak_traced_mb"] is not None:
+        print(f"  {'peak_traced':<20} {results['peak_traced_mb']:.1f} MB")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressed = False
+        for key in ("latency_s", "executor_overhead_s", "serialize_s"):
+            for stat in ("p50", "p95"):
+                old, new = baseline[key][stat], results[key][stat]
+                change = new / old - 1 if old else 0.0
+                status = "REGRESSION" if change > args.tolerance else "ok"
+                regressed |= change > args.tolerance
+                print(f"{key + ' ' + stat:<24} {old * 1000:.2f}ms -> {new * 1000:.2f}ms ({change:+.0%}) {status}")
+        sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
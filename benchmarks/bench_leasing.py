@@ -0,0 +1,95 @@
+# bench_leasing.py
+#
+# Compares design_leasing_offers (vectorized) with calling design_leasing_offer per row.
+# Zone lookups are served from an in-memory offline population table, so no network is used.
+#
+#   python benchmarks/bench_leasing.py [--sizes 1000 10000 100000]
+
+import argparse
+import random
+import time
+import sys
+import os
+
+# Keep the benchmark's city cache out of the user's persistent cache
+os.environ["CITY_CACHE_PATH"] = ":memory:"
+
+# Add the parent directory (project root) to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pandas as pd
+
+from src.city_lookup import get_city_lookup
+from tools.custom_tools_globalKyc import design_leasing_offer, design_leasing_offers
+
+CITIES = {
+    "Santo Domingo": 965040,
+    "Santiago": 691262,
+    "La Romana": 139671,
+    "Bani": 48000,
+    "Jarabacoa": 29000,
+    "Constanza": 24000,
+    "Nagua": 33000,
+    "Moca": 61000,
+}
+
+
+def make_portfolio(rows: int, seed: int = 0) -> pd.DataFrame:
+    """Random customer portfolio; includes a city the offline table doesn't know."""
+    rng = random.Random(seed)
+    cities = list(CITIES) + ["Atlantis"]
+    return pd.DataFrame({
+        "customer_id": [f"C{i:06d}" for i in range(rows)],
+        "birthdate": [
+            f"{rng.randint(1, 28):02d}-{rng.randint(1, 12):02d}-{rng.randint(1950, 2012)}"
+            for _ in range(rows)
+        ],
+        "income": [rng.choice([rng.uniform(1000, 9999), rng.uniform(10000, 99999), rng.uniform(100000, 500000)]) for _ in range(rows)],
+        "city": [rng.choice(cities) for _ in range(rows)],
+        "vehicle_year": [rng.randint(2000, 2025) for _ in range(rows)],
+    })
+
+
+def per_row(customers: pd.DataFrame) -> list:
+    return [
+        design_leasing_offer(row.customer_id, row.birthdate, row.income, row.city, row.vehicle_year)
+        for row in customers.itertuples(index=False)
+    ]
+
+
+def to_records(offers: pd.DataFrame) -> list:
+    """Batch output as dicts shaped like the single-customer tool's return value."""
+    records = []
+    for record in offers.to_dict("records"):
+        record = {k: v for k, v in record.items() if v is not None and not pd.isna(v)}
+        records.append({k: (v.item() if hasattr(v, "item") else v) for k, v in record.items()})
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    args = parser.parse_args()
+
+    lookup = get_city_lookup()
+    lookup.preload((city, "DO", population) for city, population in CITIES.items())
+    lookup.preload([("Atlantis", "DO", None)])
+
+    print(f"{'rows':>8} {'per-row (s)':>12} {'batch (s)':>10} {'speedup':>8}  match")
+    for size in args.sizes:
+        customers = make_portfolio(size)
+
+        start = time.perf_counter()
+        expected = per_row(customers)
+        scalar_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        offers = design_leasing_offers(customers)
+        batch_time = time.perf_counter() - start
+
+        match = to_records(offers) == expected
+        print(f"{size:>8} {scalar_time:>12.3f} {batch_time:>10.3f} {scalar_time / batch_time:>7.1f}x  {match}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# bench_startup.py
+#
+# Cold-start benchmark: `python -X importtime` breakdown of `import src.demo_agent`
+# and time to the first DemoAgent(), each measured in fresh interpreters.
+# Results can be saved as JSON and compared against a previous run.
+#
+#   python benchmarks/bench_startup.py --output startup.json
+#   python benchmarks/bench_startup.py --baseline startup.json   # exits 1 on regression
+
+from typing import Dict, List
+import subprocess
+import statistics
+import argparse
+import json
+import sys
+import os
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Dummy settings so DemoAgent() can be built without credentials (no request is made)
+ENV = {
+    **os.environ,
+    "LLM": os.getenv("LLM", "llama-3.3-70b-versatile"),
+    "GROK_API_KEY": os.getenv("GROK_API_KEY", "benchmark"),
+    "PYTHONWARNINGS": "ignore",
+}
+
+FIRST_AGENT_SCRIPT = """
+import time
+start = time.perf_counter()
+import src.demo_agent as demo_agent
+imported = time.perf_counter()
+demo_agent.DemoAgent()
+built = time.perf_counter()
+print(imported - start, built - start)
+"""
+
+
+def import_breakdown(top: int) -> Dict:
+    """Run `python -X importtime` on the agent module and aggregate by top-level package."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import src.demo_agent"],
+        cwd=ROOT, env=ENV, capture_output=True, text=True, check=True,
+    )
+    total = 0
+    packages: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + int(self_us)
+        if name == "src.demo_agent":
+            total = int(cumulative_us)
+    heaviest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "import_total_s": total / 1e6,
+        "packages_s": {name: us / 1e6 for name, us in heaviest},
+    }
+
+
+def first_agent(runs: int) -> Dict:
+    """Median time to import the agent module and to build the first DemoAgent."""
+    imports: List[float] = []
+    agents: List[float] = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", FIRST_AGENT_SCRIPT],
+            cwd=ROOT, env=ENV, capture_output=True, text=True, check=True,
+        )
+        imported, built = map(float, result.stdout.split())
+        imports.append(imported)
+        agents.append(built)
+    return {
+        "import_s": statistics.median(imports),
+        "first_agent_s": statistics.median(agents),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start benchmark for DemoAgent")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to time")
+    parser.add_argument("--top", type=int, default=15, help="packages to list in the breakdown")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="compare against a previous JSON result")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown vs. baseline")
+    args = parser.parse_args()
+
+    results = {**first_agent(args.runs), **import_breakdown(args.top)}
+
+    print(f"import src.demo_agent : {results['import_s']:.3f}s (median of {args.runs})")
+    print(f"first DemoAgent()     : {results['first_agent_s']:.3f}s (median of {args.runs})")
+    print("self import time by package (-X importtime):")
+    for name, seconds in results["packages_s"].items():
+        print(f"  {name:<28} {seconds:.3f}s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressed = False
+        for key in ("import_s", "first_agent_s"):
+            change = results[key] / baseline[key] - 1
+            status = "REGRESSION" if change > args.tolerance else "ok"
+            regressed |= change > args.tolerance
+            print(f"{key:<14} {baseline[key]:.3f}s -> {results[key]:.3f}s ({change:+.0%}) {status}")
+        sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
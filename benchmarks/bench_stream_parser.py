@@ -0,0 +1,102 @@
+# bench_stream_parser.py
+#
+# Throughput of splitting a streamed response into text and <execute> chunks:
+# the incremental ExecuteStreamParser vs. re-scanning a growing buffer on every delta.
+# Responses are synthetic, with code blocks of increasing size, streamed in small deltas.
+#
+#   python benchmarks/bench_stream_parser.py
+#   python benchmarks/bench_stream_parser.py --delta 2 --sizes 10000 100000
+
+from typing import Dict, List
+import argparse
+import random
+import time
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.stream_parser import ExecuteStreamParser
+
+
+def make_response(code_chars: int, blocks: int = 3) -> str:
+    """Response alternating text and <execute> blocks of about `code_chars` each."""
+    line = "df['total'] = df['price'] * df['quantity']  # update totals\n"
+    code = line * max(1, code_chars // len(line))
+    parts = []
+    for i in range(blocks):
+        parts.append(f"Step {i}: let me compute this.\n<execute>\n{code}</execute>\n")
+    parts.append("Done, the totals are updated.")
+    return "".join(parts)
+
+
+def make_deltas(response: str, size: int, seed: int = 0) -> List[str]:
+    """Split a response into deltas of 1..2*size characters, so tags get split too."""
+    rng = random.Random(seed)
+    deltas, i = [], 0
+    while i < len(response):
+        step = rng.randint(1, 2 * size)
+        deltas.append(response[i:i + step])
+        i += step
+    return deltas
+
+
+def rescan(deltas: List[str]) -> List[Dict[str, str]]:
+    """The buffer re-scanning approach used before the incremental parser."""
+    chunks, current_text, buffer = [], "", ""
+    for delta in deltas:
+        buffer += delta
+        while "<execute>" in buffer and "</execute>" in buffer:
+            before, rest = buffer.split("<execute>", 1)
+            code, after = rest.split("</execute>", 1)
+            current_text += before
+            if current_text.strip():
+                chunks.append({"type": "text", "content": current_text.strip()})
+                current_text = ""
+            chunks.append({"type": "code", "content": code.strip()})
+            buffer = after
+    if buffer.strip():
+        chunks.append({"type": "text", "content": buffer.strip()})
+    return chunks
+
+
+def incremental(deltas: List[str]) -> List[Dict[str, str]]:
+    parser = ExecuteStreamParser()
+    events = []
+    for delta in deltas:
+        events.extend(parser.feed(delta))
+    events.extend(parser.close())
+    return [event.to_dict() for event in events if event.done]
+
+
+def timed(fn, deltas: List[str], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(deltas)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming <execute> parser throughput")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000],
+                        help="characters per code block")
+    parser.add_argument("--delta", type=int, default=4, help="average delta size in characters")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement (best is kept)")
+    args = parser.parse_args()
+
+    print(f"{'code chars':>10} {'deltas':>8} {'re-scan MB/s':>13} {'parser MB/s':>12} {'speedup':>8} {'same':>5}")
+    for size in args.sizes:
+        response = make_response(size)
+        deltas = make_deltas(response, args.delta)
+        megabytes = len(response) / 1e6
+
+        same = rescan(deltas) == incremental(deltas)
+        old = timed(rescan, deltas, args.repeat)
+        new = timed(incremental, deltas, args.repeat)
+        print(f"{size:>10} {len(deltas):>8} {megabytes / old:>13.2f} {megabytes / new:>12.2f} "
+              f"{old / new:>7.1f}x {str(same):>5}")
+
+
+if __name__ == "__main__":
+    main()
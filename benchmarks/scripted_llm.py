@@ -0,0 +1,91 @@
+# scripted_llm.py
+#
+# Deterministic stand-in for the Groq LLM, used by the offline benchmarks.
+# It replays recorded responses in order (one per LLM call), streamed in small
+# deltas, optionally with a simulated time to first token and per-delta delay.
+
+from typing import Any, List
+import asyncio
+import time
+import json
+
+from llama_index.core.llms import CompletionResponse, CustomLLM, LLMMetadata
+from llama_index.core.llms.callbacks import llm_completion_callback
+
+
+class ScriptedLLM(CustomLLM):
+    """Replays a list of responses; raises once the script is exhausted."""
+
+    responses: List[str] = []
+    delta_chars: int = 8  # characters per streamed delta
+    first_token_delay: float = 0.0  # seconds
+    delta_delay: float = 0.0  # seconds between deltas
+    calls: int = 0
+    prompt_chars: List[int] = []
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(model_name="scripted", is_chat_model=False, context_window=128000)
+
+    def load(self, responses: List[str]):
+        """Start replaying a new script."""
+        self.responses = list(responses)
+        self.calls = 0
+        self.prompt_chars = []
+
+    def _next(self, prompt: str) -> str:
+        if self.calls >= len(self.responses):
+            raise RuntimeError(f"Scripted LLM has no response left (call {self.calls + 1})")
+        self.prompt_chars.append(len(prompt))
+        response = self.responses[self.calls]
+        self.calls += 1
+        return response
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        return CompletionResponse(text=self._next(prompt))
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        response = self._next(prompt)
+
+        def gen():
+            if self.first_token_delay:
+                time.sleep(self.first_token_delay)
+            text = ""
+            for i in range(0, len(response), self.delta_chars):
+                if i and self.delta_delay:
+                    time.sleep(self.delta_delay)
+                delta = response[i:i + self.delta_chars]
+                text += delta
+                yield CompletionResponse(text=text, delta=delta)
+
+        return gen()
+
+    @llm_completion_callback()
+    async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        # Async delays, so concurrent sessions overlap like real requests do
+        response = self._next(prompt)
+
+        async def gen():
+            if self.first_token_delay:
+                await asyncio.sleep(self.first_token_delay)
+            text = ""
+            for i in range(0, len(response), self.delta_chars):
+                if i and self.delta_delay:
+                    await asyncio.sleep(self.delta_delay)
+                delta = response[i:i + self.delta_chars]
+                text += delta
+                yield CompletionResponse(text=text, delta=delta)
+
+        return gen()
+
+
+def load_transcripts(path: str) -> List[dict]:
+    """
+    Load recorded conversations.
+    Each conversation is {"name": str, "turns": [{"query": str, "responses": [str, ...]}]},
+    with one response per LLM call of the turn (those with <execute> blocks run code).
+    """
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,206 @@
+# agent_factory.py
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+import functools
+import threading
+import logging
+import time
+import sys
+import os
+
+from dotenv import load_dotenv
+
+# Add the parent directory (project root) to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.conversation_memory import ConversationMemory
+from src.demo_agent import DemoAgent, get_function_tools, get_llm, get_router, get_system_prompt
+from src.tracing import registry
+
+logger = logging.getLogger(__name__)
+
+# Load env variables
+load_dotenv()
+AGENT_IDLE_TTL = float(os.getenv("AGENT_IDLE_TTL", "1800"))  # seconds before an idle session is evicted
+AGENT_MAX_SESSIONS = int(os.getenv("AGENT_MAX_SESSIONS", "100"))
+
+sessions_gauge = registry.gauge("agent_sessions", "Live agent sessions by state")
+session_bytes_gauge = registry.gauge("agent_session_bytes", "Memory held by all live sessions, by kind")
+
+
+@dataclass
+class AgentSession:
+    """Per-session state: an agent (with its own executor namespace) and the conversation memory."""
+    agent: DemoAgent
+    memory: ConversationMemory = field(default_factory=ConversationMemory)
+    created: float = field(default_factory=time.time)
+    last_used: float = field(default_factory=time.time)
+    # Turns running right now; busy sessions are never evicted
+    busy: int = 0
+    # Released while busy: closed once its last turn ends
+    released: bool = False
+
+
+class AgentFactory:
+    """
+    Hands out per-session agents built on process-wide shared pieces.
+    The LLM client, tool schemas and prompt templates are built once; a session only
+    owns its code executor namespace and conversation memory. Sessions idle for
+    longer than `idle_ttl` are evicted (their executors closed), as are the least
+    recently used ones once there are more than `max_sessions`. A session is
+    marked busy for the duration of each turn (`begin_turn`/`end_turn`) and is
+    never evicted meanwhile.
+    """
+
+    def __init__(self, idle_ttl: float = AGENT_IDLE_TTL, max_sessions: int = AGENT_MAX_SESSIONS):
+        """
+        Initialize the agent factory.
+        Args:
+            idle_ttl: Seconds a session may stay unused before being evicted
+            max_sessions: Max sessions kept alive at once
+        """
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self._sessions: Dict[str, AgentSession] = {}
+        self._lock = threading.Lock()
+        # session id -> lock held while its agent is built (outside the factory lock)
+        self._building: Dict[str, threading.Lock] = {}
+        self.evictions = 0
+
+    def get(self, session_id: str) -> AgentSession:
+        """
+        The session's agent and memory, created on first use (or after eviction).
+        Args:
+            session_id: Unique id of the user session
+        Returns:
+            The AgentSession
+        """
+        self.evict_idle()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                building = self._building.setdefault(session_id, threading.Lock())
+
+        if session is None:
+            # Only requests for the same session wait for the agent to be built
+            with building:
+                with self._lock:
+                    session = self._sessions.get(session_id)
+                if session is None:
+                    try:
+                        agent = DemoAgent(llm=get_llm(), tools=get_function_tools(), router=get_router())
+                        session = AgentSession(agent=agent)
+                        with self._lock:
+                            self._sessions[session_id] = session
+                    finally:
+                        # Also when the build failed, so failed sessions don't leave their lock behind
+                        with self._lock:
+                            if self._building.get(session_id) is building:
+                                del self._building[session_id]
+
+        with self._lock:
+            session.last_used = time.time()
+
+            # Over capacity: drop the least recently used other sessions that aren't busy
+            evicted = []
+            while len(self._sessions) > self.max_sessions:
+                candidates = [sid for sid, s in self._sessions.items() if sid != session_id and not s.busy]
+                if not candidates:
+                    break
+                oldest = min(candidates, key=lambda sid: self._sessions[sid].last_used)
+                evicted.append(self._sessions.pop(oldest))
+
+        self._close(evicted)
+        return session
+
+    def begin_turn(self, session: AgentSession):
+        """Mark a session busy while one of its turns runs."""
+        with self._lock:
+            session.busy += 1
+            session.last_used = time.time()
+
+    def end_turn(self, session: AgentSession):
+        """Mark a turn finished (once per `begin_turn`, e.g. when the turn's future completes)."""
+        with self._lock:
+            session.busy -= 1
+            session.last_used = time.time()
+            close = session.released and not session.busy
+        if close:
+            session.agent.close()
+        self.publish_memory()
+
+    def release(self, session_id: str):
+        """Drop a session, e.g. when its chat is restarted (a running turn finishes first)."""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is not None and session.busy:
+                session.released = True
+                session = None
+        self._close([session] if session else [])
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        """Evict sessions unused for longer than the idle TTL. Returns how many were evicted."""
+        now = now or time.time()
+        with self._lock:
+            idle = [
+                sid for sid, s in self._sessions.items()
+                if not s.busy and now - s.last_used > self.idle_ttl
+            ]
+            evicted = [self._sessions.pop(sid) for sid in idle]
+        self._close(evicted)
+        return len(evicted)
+
+    def _close(self, sessions: List[AgentSession]):
+        for session in sessions:
+            session.agent.close()
+        if sessions:
+            self.evictions += len(sessions)
+            logger.info("Evicted %d agent session(s)", len(sessions))
+            self.publish_memory()
+
+    def memory_report(self) -> List[Dict]:
+        """
+        Memory held by each live session.
+        Returns:
+            One dict per session with `session_id`, `idle_s`, `executor_bytes`
+            (variables, or worker RSS for the process backend) and `memory_bytes`
+            (serialized conversation memory), heaviest first
+        """
+        now = time.time()
+        with self._lock:
+            sessions = list(self._sessions.items())
+        report = [
+            {
+                "session_id": session_id,
+                "idle_s": now - session.last_used,
+                "executor_bytes": session.agent.code_executor.namespace_bytes(),
+                "memory_bytes": session.memory.total_bytes,
+            }
+            for session_id, session in sessions
+        ]
+        return sorted(report, key=lambda r: r["executor_bytes"] + r["memory_bytes"], reverse=True)
+
+    def publish_memory(self):
+        """Export the session count and the memory held by all sessions (from `memory_report`) as metrics."""
+        report = self.memory_report()
+        with self._lock:
+            busy = sum(1 for session in self._sessions.values() if session.busy)
+        sessions_gauge.set(busy, state="busy")
+        sessions_gauge.set(len(report) - busy, state="idle")
+        session_bytes_gauge.set(sum(r["executor_bytes"] for r in report), kind="executor")
+        session_bytes_gauge.set(sum(r["memory_bytes"] for r in report), kind="memory")
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+@functools.lru_cache(maxsize=None)
+def get_agent_factory() -> AgentFactory:
+    """Process-wide agent factory, created on first use."""
+    # Build the shared pieces up front so the first session doesn't pay for them
+    get_llm()
+    get_router()
+    get_function_tools()
+    get_system_prompt()
+    return AgentFactory()
@@ -1,14 +1,14 @@
 # app.py
 
-import tempfile
-import asyncio
+import base64
+import queue
+import uuid
 import time
 import json
 import sys
 import os
 import io
 
-from llama_index.core.agent.workflow import ToolCallResult, AgentStream
 from llama_index.core.workflow import Context
 
 from streamlit_mic_recorder import mic_recorder
@@ -17,9 +17,25 @@ import streamlit as st
 # Add the parent directory (project root) to sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from src.demo_agent import DemoAgent
+from src.async_runtime import get_background_loop
+from src.agent_factory import get_agent_factory
+from src.inference import run_inference
+from src.tracing import span, start_metrics_server
+from src.upload_store import get_upload_store
 from src.multimodal import stt
 
+# Max characters of live code output kept on screen while code runs
+LIVE_OUTPUT_CHARS = 8000
+
+# Min seconds between two markdown updates of the streaming answer
+LIVE_RENDER_INTERVAL = 0.05
+
+# Messages rendered per page of chat history (older pages are shown on request)
+HISTORY_PAGE_MESSAGES = 20
+
+# Max characters of a code output kept for display in the chat history
+HISTORY_OUTPUT_CHARS = 8000
+
 # Set page title and favicon
 st.set_page_config(
     page_title="Demo Time",
@@ -52,23 +68,39 @@ section[data-testid="stSidebar"] {
 
 st.markdown(css, unsafe_allow_html=True)
 
+# Prometheus endpoint (only if METRICS_PORT is set; started once per process)
+start_metrics_server()
+
 # Session state variables
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
-if "agent" not in st.session_state:
-    st.session_state.agent = DemoAgent()
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+
+# Agent and memory live in the process-wide factory (sessions idle for too long are evicted)
+session = get_agent_factory().get(st.session_state.session_id)
+if st.session_state.get("agent_created") != session.created:
+    st.session_state.agent_created = session.created
+    st.session_state.upload_paths = () # a new agent needs the file instructions again
 
-if "memory" not in st.session_state:
-    st.session_state.memory = {}
+if "metrics" not in st.session_state:
+    st.session_state.metrics = [] # per-turn ttft and total latency
 
 if "processing_query" not in st.session_state:
     st.session_state.processing_query = False
 
+if "uploads" not in st.session_state:
+    st.session_state.uploads = {} # file_id -> stored path
+
+if "upload_paths" not in st.session_state:
+    st.session_state.upload_paths = ()
+
 if "voice_input_key" not in st.session_state:
     st.session_state.voice_input_key = 0
 
-context = Context(st.session_state.agent._agent)
+if "history_pages" not in st.session_state:
+    st.session_state.history_pages = 1
 
 # Create the chat container first
 chat_container = st.container()
@@ -81,23 +113,27 @@ with st.sidebar:
     # File uploader
     uploaded_files = st.file_uploader(label="📂 Uploaded Files", type=None, accept_multiple_files=True, label_visibility="visible")
 
-    # Handle files
-    temp_file_paths = []
-    if uploaded_files:
-        # Make temp dirs
-        temp_dir = tempfile.mkdtemp()
-        for file in uploaded_files:
-            file_path = os.path.join(temp_dir, file.name)
-            with open(file_path, "wb") as f:
-                f.write(file.read())
-            temp_file_paths.append(file_path)
-
-        # Update agent's prompt
-        file_list = '\n'.join(f'- {file}' for file in temp_file_paths)
-        instructions = f"""
+    # Handle files (stored once by content; reruns reuse the stored copy)
+    upload_store = get_upload_store()
+    file_paths = []
+    for file in uploaded_files or []:
+        file_path = st.session_state.uploads.get(file.file_id)
+        if file_path is None or not upload_store.touch(file_path):
+            file_path = upload_store.put(file)
+            st.session_state.uploads[file.file_id] = file_path
+        file_paths.append(file_path)
+
+    # Update agent's prompt only when the set of files changes
+    if tuple(file_paths) != st.session_state.upload_paths:
+        st.session_state.upload_paths = tuple(file_paths)
+        instructions = ""
+        if file_paths:
+            file_list = '\n'.join(f'- {file}' for file in file_paths)
+            instructions = f"""
         The user has uploaded the following files:
-        {file_list}"""
-        st.session_state.agent.give_instructions(instructions)
+        {file_list}
+        Use `preview_table` and `load_table` (with only the columns you need) to read tabular files."""
+        session.agent.give_instructions(instructions)
 
     # Action buttons below chat input
     with st.container():
@@ -112,25 +148,75 @@ with st.sidebar:
             if st.button("💡", help="Reasoning mode", use_container_width=True):
                 st.warning("WIP")
 
-# Display chat messages from session state in the chat container
-with chat_container:
-    for msg in st.session_state.get("messages", []):
+@st.cache_data(max_entries=256, show_spinner=False)
+def figure_url(path, mime):
+    """Data URL of a stored figure (immutable: the path is its content hash), built once."""
+    with open(path, "rb") as f:
+        return f"data:{mime};base64,{base64.b64encode(f.read()).decode('ascii')}"
+
+def display_chunks(chunks):
+    """
+    Chunks as kept in the chat history, prepared once so reruns do no extra work:
+    long tool outputs are cut to their tail.
+    """
+    displayed = []
+    for chunk in chunks:
+        chunk = dict(chunk)
+        if chunk["type"] == "tool" and len(chunk["content"]) > HISTORY_OUTPUT_CHARS:
+            dropped = len(chunk["content"]) - HISTORY_OUTPUT_CHARS
+            chunk["content"] = f"... [{dropped} characters not shown] ...\n" + chunk["content"][-HISTORY_OUTPUT_CHARS:]
+        displayed.append(chunk)
+    return displayed
+
+def render_chunk(chunk):
+    """Render one chunk of an assistant message."""
+    if chunk["type"] == "text":
+        st.markdown(chunk["content"])
+    elif chunk["type"] == "code":
+        with st.expander("🛠️ Code", expanded=False):
+            st.code(chunk["content"], language="python")
+    elif chunk["type"] == "tool":
+        with st.expander("⚙️ Output", expanded=False):
+            st.code(chunk["content"], language="raw")
+    elif chunk["type"] == "image":
+        # A URL is passed through as is: the image isn't decoded or re-encoded on reruns
+        try:
+            st.image(figure_url(chunk["content"], chunk.get("mime", "image/png")))
+        except FileNotFoundError:
+            st.caption("🖼️ Figure no longer available")
+
+def show_earlier_messages():
+    st.session_state.history_pages += 1
+
+@st.fragment
+def render_history():
+    """
+    Render the most recent messages, older ones on request.
+    As a fragment, paging through the history reruns only this function.
+    """
+    messages = st.session_state.get("messages", [])
+    shown = st.session_state.history_pages * HISTORY_PAGE_MESSAGES
+    if len(messages) > shown:
+        st.button(
+            f"⬆️ Show earlier messages ({len(messages) - shown})",
+            on_click=show_earlier_messages,
+            use_container_width=True,
+        )
+
+    for msg in messages[-shown:]:
         with st.chat_message(msg["role"]):
             # Multi-chunk assistant message
             if isinstance(msg["content"], list):
                 for chunk in msg["content"]:
-                    if chunk["type"] == "text":
-                        st.markdown(chunk["content"])
-                    elif chunk["type"] == "code":
-                        with st.expander("🛠️ Code", expanded=False):
-                            st.code(chunk["content"], language="python")
-                    elif chunk["type"] == "tool":
-                        with st.expander("⚙️ Output", expanded=False):
-                            st.code(chunk["content"], language="raw")
+                    render_chunk(chunk)
             # Regular user message
             else:
                 st.markdown(msg["content"])
 
+# Display chat messages from session state in the chat container
+with chat_container:
+    render_history()
+
 # Put the input elements at the bottom
 with input_container:
     col1, col2, col3 = st.columns([86, 7, 7])
@@ -148,13 +234,15 @@ with input_container:
             key=f"voice_input_{st.session_state.voice_input_key}"
         )
     with col3:
-        if st.session_state.get("messages"):
+        # Also shown while the first query is answered (the page isn't rerun afterwards)
+        if st.session_state.get("messages") or query or audio_data:
             if st.button("🗑️", help="Restart chat", use_container_width=True):
                 # Generate a new unique key for the voice recorder widget and store it temporarily 
                 st.session_state.voice_input_key += 1
                 value_to_keep = st.session_state.get("voice_input_key") 
 
                 # Clear everything in state memory, but restore important keys
+                get_agent_factory().release(st.session_state.session_id)
                 st.session_state.clear()
                 if value_to_keep is not None: st.session_state["voice_input_key"] = value_to_keep
 
@@ -172,73 +260,89 @@ if query and not st.session_state.processing_query:
     # Set processing flag
     st.session_state.processing_query = True
 
-    # Add user message to state
-    st.session_state.messages.append({"role": "user", "content": query})
+    try:
+        # Add user message to state
+        st.session_state.messages.append({"role": "user", "content": query})
     
-    # Override context with session state memory
-    if st.session_state.memory:
-        context = Context.from_dict(
-            workflow=st.session_state.agent._agent,
-            data=st.session_state.memory
-        )
-        
-    async def run_inference(query, ctx):
-        response_chunks = []
-        current_text = ""
-        buffer = ""
-
-        inside_code = False
-
-        # Run inference
-        handler = st.session_state.agent(query, ctx)
-
-        async for event in handler.stream_events():
-            if isinstance(event, AgentStream):
-                buffer += event.delta
-
-                while "<execute>" in buffer and "</execute>" in buffer:
-                    before, rest = buffer.split("<execute>", 1)
-                    code, after = rest.split("</execute>", 1)
-
-                    current_text += before
-                    if current_text.strip():
-                        response_chunks.append({"type": "text", "content": current_text.strip()})
-                        current_text = ""
-
-                    response_chunks.append({"type": "code", "content": code.strip()})
-                    buffer = after
-
-            elif isinstance(event, ToolCallResult):
-                if buffer.strip():
-                    response_chunks.append({"type": "text", "content": buffer.strip()})
-                    buffer = ""
-
-                tool_result = str(event.tool_output).strip()
-                response_chunks.append({"type": "tool", "content": tool_result})
-
-        if buffer.strip():
-            response_chunks.append({"type": "text", "content": buffer.strip()})
-
-        _ = await handler
-        return response_chunks
-
-    # Run inference async loop
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    response_chunks = loop.run_until_complete(run_inference(query, ctx=context))
-    
-    # Add assistant response to state
+        # Fresh context per query; the conversation so far comes from the session memory
+        context = Context(session.agent._agent)
+
+        # Events from the background loop (and the code executor) for the script thread to render
+        events = queue.Queue()
+        def emit(kind, payload):
+            events.put((kind, payload))
+
+        # Run inference on the shared background event loop; the session isn't evicted while it runs
+        session.agent.set_output_sink(lambda chunk: emit("output", chunk))
+        factory = get_agent_factory()
+        factory.begin_turn(session)
+        try:
+            future = get_background_loop().submit(run_inference(
+                session.agent, query, context, memory=session.memory, emit=emit
+            ))
+        except BaseException:
+            # The turn never started, so its done callback won't end it
+            factory.end_turn(session)
+            raise
+        future.add_done_callback(lambda _: factory.end_turn(session))
+        future.add_done_callback(lambda _: emit("done", None))
+
+        # Render the turn live while it streams
+        with chat_container:
+            with st.chat_message("user"):
+                st.markdown(query)
+
+            with st.chat_message("assistant"):
+                live_text = st.empty()
+                live_output = st.empty()
+                text, output = "", ""
+                last_render = 0.0
+                render = span("app.render", redact=True)  # errors may quote the query or its files
+                try:
+                    while True:
+                        kind, payload = events.get()
+                        if kind == "done":
+                            break
+
+                        if kind == "delta":
+                            text += payload.content
+                            # Throttle updates of the chunk being streamed
+                            if time.monotonic() - last_render > LIVE_RENDER_INTERVAL:
+                                if payload.type == "code":
+                                    live_text.code(text, language="python")
+                                else:
+                                    live_text.markdown(text + "▌")
+                                last_render = time.monotonic()
+
+                        elif kind == "output":
+                            output = (output + payload)[-LIVE_OUTPUT_CHARS:]
+                            live_output.code(output, language="raw")
+
+                        elif kind == "chunk":
+                            # Completed chunks replace the live placeholders, which move below them
+                            live_text.empty()
+                            live_output.empty()
+                            render_chunk(payload)
+                            live_text = st.empty()
+                            live_output = st.empty()
+                            text, output = "", ""
+
+                    response_chunks, metrics = future.result()
+                    render.set(ttft=metrics["ttft"], total=metrics["total"])
+                except Exception as e:
+                    render.error(e)
+                    raise
+                finally:
+                    render.end()
+    finally:
+        session.agent.set_output_sink(None)
+        st.session_state.processing_query = False
+
+    # Latency as seen by the user, per turn
+    st.session_state.metrics.append(metrics)
+
+    # Add assistant response to state (the turn is already on screen: no rerun needed)
     st.session_state.messages.append({
         "role": "assistant",
-        "content": response_chunks
-    })
-            
-    # Note: context can not be stored as session var due to streamlit async incompatibility.
-    # As a work-around, I transform context into a dict and store it as session var at the end of the st loop. 
-    st.session_state.memory = context.to_dict()
-
-    # Reset processing flag
-    st.session_state.processing_query = False
-
-    # Force rerun to update UI with new messages
-    st.rerun()
\ No newline at end of file
+        "content": display_chunks(response_chunks)
+    })
\ No newline at end of file
@@ -0,0 +1,51 @@
+# async_runtime.py
+
+from typing import Any, Callable, Coroutine, Optional
+import concurrent.futures
+import contextvars
+import functools
+import threading
+import asyncio
+
+
+class BackgroundLoop:
+    """
+    An asyncio event loop running forever in a daemon thread.
+    Shared by all queries and sessions, so clients and connections bound to the
+    loop stay warm instead of being thrown away with a per-query loop.
+    """
+
+    def __init__(self, name: str = "agent-event-loop"):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro: Coroutine[Any, Any, Any]) -> concurrent.futures.Future:
+        """Schedule a coroutine on the loop; returns a thread-safe future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+
+async def run_in_thread(
+    fn: Callable, *args, executor: Optional[concurrent.futures.Executor] = None, **kwargs
+) -> Any:
+    """
+    Like asyncio.to_thread (Python 3.9+): runs `fn(*args, **kwargs)` in a thread,
+    in a copy of the caller's context, and awaits its result.
+    Args:
+        fn: The (sync) function
+        executor: Executor to run it on (the running loop's default executor if None)
+    Returns:
+        The function's result
+    """
+    call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(executor, call)
+
+
+@functools.lru_cache(maxsize=None)
+def get_background_loop() -> BackgroundLoop:
+    """Process-wide background event loop, started on first use."""
+    return BackgroundLoop()
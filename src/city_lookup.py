@@ -0,0 +1,245 @@
+# city_lookup.py
+
+from typing import Dict, Iterable, List, Optional, Tuple
+from collections import OrderedDict
+from pathlib import Path
+import functools
+import threading
+import logging
+import sqlite3
+import time
+import csv
+import os
+
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+import requests
+
+from src.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Load env variables
+load_dotenv()
+NINJAS_API_KEY = os.getenv("NINJAS_API_KEY")
+CITY_API_URL = os.getenv("CITY_API_URL", "https://api.api-ninjas.com/v1/city")
+CITY_CACHE_PATH = os.getenv(
+    "CITY_CACHE_PATH", str(Path.home() / ".cache" / "code-agent-demo" / "cities.sqlite3")
+)
+CITY_CACHE_TTL = float(os.getenv("CITY_CACHE_TTL", str(30 * 24 * 3600)))  # seconds
+CITY_CACHE_MISS_TTL = float(os.getenv("CITY_CACHE_MISS_TTL", "3600"))  # seconds "no data" answers are kept
+CITY_POPULATION_CSV = os.getenv("CITY_POPULATION_CSV")  # optional offline table
+
+# Marks a key that isn't cached, as opposed to a city known to have no data (None)
+_MISSING = object()
+
+
+class CityLookup:
+    """
+    Population lookup for (city, country) pairs backed by the API Ninjas city endpoint.
+    Lookups go through an in-memory LRU with TTL, then a persistent SQLite cache,
+    and only then hit the network over a pooled requests.Session.
+    Cities the API has no data for are cached too, for a shorter time, so a
+    transient miss doesn't hide a city for long.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = NINJAS_API_KEY,
+        url: str = CITY_API_URL,
+        db_path: Optional[str] = CITY_CACHE_PATH,
+        ttl: float = CITY_CACHE_TTL,
+        miss_ttl: float = CITY_CACHE_MISS_TTL,
+        memory_size: int = 1024,
+        pool_size: int = 10,
+        timeout: float = 10,
+    ):
+        """
+        Initialize the city lookup.
+        Args:
+            api_key: API Ninjas key
+            url: City endpoint (point it at a local server for tests)
+            db_path: SQLite cache file, or None to keep the cache in memory only
+            ttl: Seconds a fetched population stays valid
+            miss_ttl: Seconds a fetched "no data" answer stays valid
+            memory_size: Max entries kept in the in-memory LRU
+            pool_size: Max pooled HTTP connections
+            timeout: HTTP timeout in seconds
+        """
+        self.url = url
+        self.db_path = db_path
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self.memory_size = memory_size
+        self.timeout = timeout
+
+        # Pooled HTTP session with keep-alive
+        self.session = requests.Session()
+        self.session.headers["X-Api-Key"] = api_key or ""
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        # In-memory LRU: key -> (population, expires_at)
+        self._memory: "OrderedDict[Tuple[str, str], Tuple[Optional[int], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Persistent cache; rows with a NULL fetched_at were preloaded and never expire
+        if db_path and db_path != ":memory:":
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(db_path or ":memory:", check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS cities ("
+            "city TEXT NOT NULL, country TEXT NOT NULL, population INTEGER, fetched_at REAL, "
+            "PRIMARY KEY (city, country))"
+        )
+        self._db.commit()
+
+        self.stats: Dict[str, int] = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    @staticmethod
+    def _key(city: str, country: str) -> Tuple[str, str]:
+        return city.strip().casefold(), country.strip().upper()
+
+    def _expires_at(self, population: Optional[int], fetched_at: Optional[float]) -> float:
+        if fetched_at is None:
+            return float("inf")
+        return fetched_at + (self.ttl if population is not None else self.miss_ttl)
+
+    def _remember(self, key: Tuple[str, str], population: Optional[int], expires_at: float):
+        self._memory[key] = (population, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _cached(self, key: Tuple[str, str]):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[1] > now:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return entry[0]
+
+            row = self._db.execute(
+                "SELECT population, fetched_at FROM cities WHERE city = ? AND country = ?", key
+            ).fetchone()
+            if row is not None:
+                population, fetched_at = row
+                expires_at = self._expires_at(population, fetched_at)
+                if expires_at > now:
+                    self._remember(key, population, expires_at)
+                    self.stats["disk_hits"] += 1
+                    return population
+
+            self.stats["misses"] += 1
+            return _MISSING
+
+    def _store(self, key: Tuple[str, str], population: Optional[int], fetched_at: Optional[float]):
+        expires_at = self._expires_at(population, fetched_at)
+        with self._lock:
+            self._remember(key, population, expires_at)
+            self._db.execute(
+                "INSERT OR REPLACE INTO cities (city, country, population, fetched_at) VALUES (?, ?, ?, ?)",
+                (*key, population, fetched_at),
+            )
+            self._db.commit()
+
+    def population(self, city: str, country: str) -> Optional[int]:
+        """
+        Get the population of a city.
+        Args:
+            city: Name of the city
+            country: Country code
+        Returns:
+            The population, or None if no data is available
+        Raises:
+            requests.exceptions.RequestException: if the API request fails
+        """
+        key = self._key(city, country)
+        population = self._cached(key)
+        if population is not _MISSING:
+            return population
+
+        # No city or country on the span: they are customer data
+        with span("city_lookup.fetch", redact=True):
+            response = self.session.get(
+                self.url, params={"name": city, "country": country}, timeout=self.timeout
+            )
+            response.raise_for_status()
+        data = response.json()
+        population = data[0].get("population") if data else None
+
+        self._store(key, population, time.time())
+        return population
+
+    def preload(self, rows: Iterable[Tuple[str, str, Optional[int]]]) -> int:
+        """
+        Load an offline population table into the persistent cache.
+        Preloaded entries never expire. Rows with a population that isn't a number
+        are skipped with a warning.
+        Args:
+            rows: Iterable of (city, country, population); populations may be
+                strings such as "1234" or "1234.0", empty/None for no data
+        Returns:
+            Number of rows loaded
+        """
+        count = 0
+        with self._lock:
+            for city, country, population in rows:
+                key = self._key(city, country)
+                try:
+                    population = int(float(population)) if population not in (None, "") else None
+                except (TypeError, ValueError, OverflowError):
+                    logger.warning("Skipping %s, %s: invalid population %r", city, country, population)
+                    continue
+                self._remember(key, population, float("inf"))
+                self._db.execute(
+                    "INSERT OR REPLACE INTO cities (city, country, population, fetched_at) VALUES (?, ?, ?, NULL)",
+                    (*key, population),
+                )
+                count += 1
+            self._db.commit()
+        return count
+
+    def preload_csv(self, path: str) -> int:
+        """Load an offline population table from a CSV with city, country and population columns."""
+        with open(path, newline="", encoding="utf-8") as f:
+            return self.preload(
+                (row["city"], row["country"], row["population"]) for row in csv.DictReader(f)
+            )
+
+    @property
+    def persistent(self) -> bool:
+        """Whether the cache lives in a file other processes open too."""
+        return bool(self.db_path) and self.db_path != ":memory:"
+
+    def snapshot(self) -> List[Tuple[str, str, Optional[int], Optional[float]]]:
+        """Every cached row as (city, country, population, fetched_at), to seed another process's cache."""
+        with self._lock:
+            return self._db.execute("SELECT city, country, population, fetched_at FROM cities").fetchall()
+
+    def restore(self, rows: Iterable[Tuple[str, str, Optional[int], Optional[float]]]):
+        """Load rows taken with `snapshot`, keeping their fetch times."""
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO cities (city, country, population, fetched_at) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._db.commit()
+
+    def clear(self):
+        """Drop every cached entry, in memory and on disk."""
+        with self._lock:
+            self._memory.clear()
+            self._db.execute("DELETE FROM cities")
+            self._db.commit()
+
+
+@functools.lru_cache(maxsize=None)
+def get_city_lookup() -> CityLookup:
+    """Process-wide city lookup, created on first use."""
+    lookup = CityLookup()
+    if CITY_POPULATION_CSV:
+        lookup.preload_csv(CITY_POPULATION_CSV)
+    return lookup
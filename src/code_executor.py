@@ -1,11 +1,256 @@
 # code_executor.py
 
-from typing import Any, Dict, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+import contextvars
 import contextlib
 import traceback
+import threading
+import hashlib
+import time
 import ast
+import sys
 import io
 
+from src.figure_store import capture_figures, may_plot, track_figures, use_agg
+from src.scheduler import TOOL, request_priority
+from src.spillable_namespace import SpillableNamespace, code_names
+from src.tracing import span
+
+# Name the value of the last expression is stored under
+RESULT_NAME = "__result__"
+
+# Max number of compiled code objects kept in memory
+COMPILE_CACHE_SIZE = 256
+
+# Max bytes of stdout/stderr retained per execution (split between head and tail)
+MAX_OUTPUT_BYTES = 64 * 1024
+
+# Min seconds between two chunks pushed to an output sink
+STREAM_FLUSH_INTERVAL = 0.1
+
+# Compiled code cache: source hash -> (code object, captures last expression)
+_compile_cache: "OrderedDict[str, Tuple[Any, bool]]" = OrderedDict()
+_compile_cache_lock = threading.Lock()
+
+
+def compile_code(code: str, timings: Optional[Dict[str, float]] = None) -> Tuple[Any, bool, bool]:
+    """
+    Compile agent code, rewriting a trailing expression into an assignment to
+    `__result__` so its value can be captured without a second pass.
+    Args:
+        code: Python code to compile
+        timings: Optional dict to record `parse` and `compile` durations into
+    Returns:
+        Tuple of (code object, whether it captures a result, whether it was a cache hit)
+    """
+    key = hashlib.sha1(code.encode("utf-8")).hexdigest()
+    with _compile_cache_lock:
+        cached = _compile_cache.get(key)
+        if cached is not None:
+            _compile_cache.move_to_end(key)
+            return cached[0], cached[1], True
+
+    start = time.perf_counter()
+    tree = ast.parse(code)
+    has_result = bool(tree.body) and isinstance(tree.body[-1], ast.Expr)
+    if has_result:
+        last_node = tree.body[-1]
+        tree.body[-1] = ast.copy_location(
+            ast.Assign(
+                targets=[ast.Name(id=RESULT_NAME, ctx=ast.Store())],
+                value=last_node.value,
+            ),
+            last_node,
+        )
+        ast.fix_missing_locations(tree)
+    parsed = time.perf_counter()
+    compiled = compile(tree, "<string>", "exec")
+    if timings is not None:
+        timings["parse"] = parsed - start
+        timings["compile"] = time.perf_counter() - parsed
+
+    with _compile_cache_lock:
+        _compile_cache[key] = (compiled, has_result)
+        if len(_compile_cache) > COMPILE_CACHE_SIZE:
+            _compile_cache.popitem(last=False)
+
+    return compiled, has_result, False
+
+
+class OutputCapture(io.TextIOBase):
+    """
+    Text stream used in place of stdout/stderr while code runs.
+    Complete lines are forwarded to an optional sink as they are written (batched
+    so a tight print loop doesn't flood it), and only the first and last
+    `max_bytes / 2` bytes are retained; everything in between is counted and dropped.
+    """
+
+    def __init__(self, sink: Optional[Callable[[str], None]] = None, max_bytes: int = MAX_OUTPUT_BYTES):
+        self.sink = sink
+        self.head_limit = max_bytes // 2
+        self.tail_limit = max_bytes - self.head_limit
+        self.dropped_bytes = 0
+
+        self._head: List[str] = []
+        self._head_size = 0
+        self._tail: deque = deque()
+        self._tail_size = 0
+
+        self._pending: List[str] = []
+        self._last_flush = 0.0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        if not text:
+            return 0
+        self._retain(text)
+
+        if self.sink is not None:
+            self._pending.append(text)
+            if "\n" in text and time.monotonic() - self._last_flush >= STREAM_FLUSH_INTERVAL:
+                self._emit(complete_lines_only=True)
+        return len(text)
+
+    def flush(self):
+        if self.sink is not None and self._pending:
+            self._emit(complete_lines_only=False)
+
+    def _emit(self, complete_lines_only: bool):
+        pending = "".join(self._pending)
+        if complete_lines_only:
+            cut = pending.rfind("\n") + 1
+            chunk, rest = pending[:cut], pending[cut:]
+        else:
+            chunk, rest = pending, ""
+        self._pending = [rest] if rest else []
+        self._last_flush = time.monotonic()
+        if chunk:
+            self.sink(chunk)
+
+    def _retain(self, text: str):
+        size = len(text.encode("utf-8", "replace"))
+
+        # Fill the head first
+        if self._head_size < self.head_limit:
+            room = self.head_limit - self._head_size
+            if size <= room:
+                self._head.append(text)
+                self._head_size += size
+                return
+            # Approximate split by characters; exact for ASCII output
+            self._head.append(text[:room])
+            self._head_size += room
+            text = text[room:]
+            size = len(text.encode("utf-8", "replace"))
+
+        # Then keep a rolling tail
+        self._tail.append((text, size))
+        self._tail_size += size
+        while self._tail_size > self.tail_limit and self._tail:
+            old, old_size = self._tail.popleft()
+            overflow = self._tail_size - self.tail_limit
+            if old_size > overflow and len(old) == old_size:
+                # Trim an ASCII piece instead of dropping it whole
+                self._tail.appendleft((old[overflow:], old_size - overflow))
+                self._tail_size -= overflow
+                self.dropped_bytes += overflow
+            else:
+                self._tail_size -= old_size
+                self.dropped_bytes += old_size
+
+    def getvalue(self) -> str:
+        head = "".join(self._head)
+        tail = "".join(text for text, _ in self._tail)
+        if self.dropped_bytes:
+            return f"{head}\n... [{self.dropped_bytes} bytes truncated] ...\n{tail}"
+        return head + tail
+
+
+# Capture of the execution running in the current context, per stream
+_stdout_capture: contextvars.ContextVar[Optional[OutputCapture]] = contextvars.ContextVar("stdout_capture", default=None)
+_stderr_capture: contextvars.ContextVar[Optional[OutputCapture]] = contextvars.ContextVar("stderr_capture", default=None)
+_router_lock = threading.Lock()
+
+
+class StreamRouter:
+    """
+    Stands in for sys.stdout/sys.stderr for the whole process, and writes to the
+    capture of the execution running in the calling context, or to the original
+    stream outside executions. Sessions running code at the same time in different
+    threads each get their own output. Threads started with a copy of the
+    execution's context (e.g. by parallel_map) write to its capture too; other
+    threads write to the original stream.
+    """
+
+    def __init__(self, capture: contextvars.ContextVar, original: Any):
+        self.capture = capture
+        self.original = original
+
+    def _target(self) -> Any:
+        capture = self.capture.get()
+        return capture if capture is not None else self.original
+
+    def write(self, text: str) -> int:
+        return self._target().write(text)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        self._target().flush()
+
+    def writable(self) -> bool:
+        return True
+
+    def __getattr__(self, name: str):
+        # encoding, fileno, isatty... come from the original stream
+        return getattr(self.original, name)
+
+
+def _route_streams():
+    """Install the stream routers, unless they are in place already (also after sys.stdout was replaced)."""
+    with _router_lock:
+        if not isinstance(sys.stdout, StreamRouter):
+            sys.stdout = StreamRouter(_stdout_capture, sys.stdout)
+        if not isinstance(sys.stderr, StreamRouter):
+            sys.stderr = StreamRouter(_stderr_capture, sys.stderr)
+
+
+@contextlib.contextmanager
+def capture_output(stdout: OutputCapture, stderr: OutputCapture):
+    """Send what the current context writes to stdout and stderr to the given captures."""
+    _route_streams()
+    stdout_token = _stdout_capture.set(stdout)
+    stderr_token = _stderr_capture.set(stderr)
+    try:
+        yield
+    finally:
+        _stdout_capture.reset(stdout_token)
+        _stderr_capture.reset(stderr_token)
+
+
+@dataclass
+class ExecutionResult:
+    """Outcome of a single execution."""
+    success: bool
+    output: str
+    return_value: Any = None
+    cache_hit: bool = False
+    # Bytes of stdout/stderr dropped by head/tail truncation
+    dropped_bytes: int = 0
+    # Per-phase wall-clock time in seconds: parse, compile, exec, figures, format, spill
+    timings: Dict[str, float] = field(default_factory=dict)
+    # Variables moved to disk after this run to stay within the memory budget
+    spilled: List[str] = field(default_factory=list)
+    # Figures rendered by this run (references into the figure store)
+    figures: List[Dict[str, Any]] = field(default_factory=list)
+
+
 class SimpleCodeExecutor:
     """
     A simple code executor that runs Python code with state persistence.
@@ -14,60 +259,78 @@ class SimpleCodeExecutor:
     NOTE: not safe for production use! Use with caution.
     """
 
-    def __init__(self, locals: Dict[str, Any], globals: Dict[str, Any]):
+    def __init__(
+        self,
+        locals: Dict[str, Any],
+        globals: Dict[str, Any],
+        memory_budget_mb: Optional[float] = None,
+    ):
         """
         Initialize the code executor.
         Args:
             locals: Local variables to use in the execution context
             globals: Global variables to use in the execution context
+            memory_budget_mb: Memory budget for the session's variables, beyond which
+                large cold DataFrames and arrays spill to disk (defaults to EXECUTOR_MEMORY_BUDGET_MB)
         """
         # State that persists between executions
         self.globals = globals
+        if not isinstance(locals, SpillableNamespace):
+            budget = {} if memory_budget_mb is None else {"budget_mb": memory_budget_mb}
+            locals = SpillableNamespace(locals, **budget)
         self.locals = locals
 
-    def execute(self, code: str) -> Tuple[bool, str, Any]:
+        # Optional callable receiving output chunks while code runs
+        self.output_sink: Optional[Callable[[str], None]] = None
+
+        # Timings of the most recent execution
+        self.last_timings: Dict[str, float] = {}
+
+        # Figures rendered since they were last collected with pop_figures()
+        self.figures: List[Dict[str, Any]] = []
+
+        # Plots are rendered off-screen and captured after each run
+        use_agg()
+
+    def run(self, code: str) -> ExecutionResult:
         """
-        Execute Python code and capture output and return values.
+        Execute Python code and capture output, return value and per-phase timings.
         Args:
             code: Python code to execute
         Returns:
-            Dict with keys `success`, `output`, and `return_value`
+            ExecutionResult for this run
         """
+        timings = {"parse": 0.0, "compile": 0.0, "exec": 0.0, "figures": 0.0, "format": 0.0, "spill": 0.0}
+
         # Capture stdout and stderr
-        stdout = io.StringIO()
-        stderr = io.StringIO()
+        stdout = OutputCapture(self.output_sink)
+        stderr = OutputCapture(self.output_sink)
 
         output = ""
         return_value = None
+        success = True
+        cache_hit = False
+        names = set()
+        owned_figures: List[Any] = []
         try:
+            compiled, has_result, cache_hit = compile_code(code, timings)
+            names = code_names(compiled)
+            self.locals.touch(names)
+
             # Execute with captured output
-            with contextlib.redirect_stdout(
-                stdout
-            ), contextlib.redirect_stderr(stderr):
-                # Try to detect if there's a return value (last expression)
-                try:
-                    tree = ast.parse(code)
-                    last_node = tree.body[-1] if tree.body else None
-
-                    # If the last statement is an expression, capture its value
-                    if isinstance(last_node, ast.Expr):
-                        # Split code to add a return value assignment
-                        last_line = code.rstrip().split("\n")[-1]
-                        exec_code = (
-                            code[: -len(last_line)]
-                            + "\n__result__ = "
-                            + last_line
-                        )
-
-                        # Execute modified code
-                        exec(exec_code, self.globals, self.locals)
-                        return_value = self.locals.get("__result__")
-                    else:
-                        # Normal execution
-                        exec(code, self.globals, self.locals)
-                except:
-                    # If parsing fails, just execute the code as is
-                    exec(code, self.globals, self.locals)
+            start = time.perf_counter()
+            try:
+                # Code that may plot runs alone: pyplot's current figure is process-wide
+                plotting = may_plot(names, (self.locals, self.globals))
+                # API calls made by the code wait behind interactive chat requests
+                with capture_output(stdout, stderr), request_priority(TOOL), track_figures(owned_figures, plotting):
+                    exec(compiled, self.globals, self.locals)
+                    if has_result:
+                        return_value = self.locals.pop(RESULT_NAME, None)
+            finally:
+                timings["exec"] = time.perf_counter() - start
+                stdout.flush()
+                stderr.flush()
 
             # Get output
             output = stdout.getvalue()
@@ -76,10 +339,80 @@ class SimpleCodeExecutor:
 
         except Exception as e:
             # Capture exception information
+            success = False
             output = f"Error: {type(e).__name__}: {str(e)}\n"
             output += traceback.format_exc()
 
+        # Render and close the figures this run left open (also after a failed run)
+        start = time.perf_counter()
+        figures, figure_errors = capture_figures(owned_figures)
+        self.figures.extend(figures)
+        timings["figures"] = time.perf_counter() - start
+
+        start = time.perf_counter()
         if return_value is not None:
             output += "\n\n" + str(return_value)
+        for figure in figures:
+            output += f"\n[Figure shown to the user: {figure['width']}x{figure['height']} {figure['mime']}]"
+        for error in figure_errors:
+            output += f"\n{error}"
+        timings["format"] = time.perf_counter() - start
+
+        # Keep the session's variables within the memory budget
+        start = time.perf_counter()
+        spilled = self.locals.enforce_budget(used=names)
+        timings["spill"] = time.perf_counter() - start
+
+        self.last_timings = timings
+        return ExecutionResult(
+            success=success,
+            output=output,
+            return_value=return_value,
+            cache_hit=cache_hit,
+            dropped_bytes=stdout.dropped_bytes + stderr.dropped_bytes,
+            timings=timings,
+            spilled=spilled,
+            figures=figures,
+        )
+
+    def execute(self, code: str) -> str:
+        """
+        Execute Python code and return its captured output.
+        This is the function handed to the CodeActAgent.
+        Args:
+            code: Python code to execute
+        Returns:
+            Captured stdout/stderr followed by the value of the last expression, if any
+        """
+        with span("executor.execute", backend="local", chars=len(code)) as s:
+            result = self.run(code)
+            s.set(success=result.success, cache_hit=result.cache_hit,
+                  output_bytes=len(result.output), spilled=len(result.spilled), **result.timings)
+        return result.output
+
+    def pop_figures(self) -> List[Dict[str, Any]]:
+        """Figures rendered since the last call, oldest first."""
+        figures, self.figures = self.figures, []
+        return figures
+
+    def namespace_bytes(self) -> int:
+        """Approximate memory held by the session's variables (excluding spilled ones)."""
+        return self.locals.usage()["in_memory_bytes"]
+
+    def memory_usage(self) -> Dict[str, int]:
+        """Bytes of the session's variables in memory and on disk, budget and spill counts."""
+        return self.locals.usage()
+
+    def heaviest(self, n: int = 10) -> List[Dict[str, Any]]:
+        """
+        The session's largest variables.
+        Args:
+            n: Max number of variables listed
+        Returns:
+            Dicts with `name`, `type`, `bytes`, `spilled` and `idle` (executions since last use)
+        """
+        return self.locals.heaviest(n)
 
-        return output
\ No newline at end of file
+    def close(self):
+        """Delete the session's spill files."""
+        self.locals.close()
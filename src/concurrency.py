@@ -0,0 +1,198 @@
+# concurrency.py
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Iterable, List, Optional, Tuple
+import contextvars
+import functools
+import threading
+import asyncio
+import time
+import os
+
+from dotenv import load_dotenv
+
+from src.async_runtime import get_background_loop, run_in_thread
+from src.scheduler import BATCH, request_priority
+
+# Load env variables
+load_dotenv()
+TOOL_MAX_WORKERS = int(os.getenv("TOOL_MAX_WORKERS", "8"))  # concurrent calls per parallel_map
+TOOL_CALL_TIMEOUT = float(os.getenv("TOOL_CALL_TIMEOUT", "60"))  # seconds per call; 0 = no limit
+ASYNC_TOOL_WORKERS = int(os.getenv("ASYNC_TOOL_WORKERS", "8"))  # threads running sync tools for <tool>_async
+
+# How the helpers are described to the model (a section of the system prompt)
+PROMPT = """\
+Concurrent tool calls: tools that wait on the network (API lookups, image analysis, transcription) can run concurrently instead of one after another in a loop.
+- `parallel_map(fn, items, max_workers={workers}, timeout={timeout}, star=False, return_exceptions=False)` calls `fn(item)` for every item on a thread pool and returns the results in order. With `star=True`, tuple items are passed as positional and dict items as keyword arguments.
+- Every tool also has an async variant named `<tool>_async` (e.g. `categorize_zone_async`); run several with `run_async(*coroutines)`, which returns their results in order.
+- Calls taking longer than `timeout` seconds fail with TimeoutError. If any call fails, a `ParallelCallError` lists every failure; its `.results` holds the successful results (None for failed calls). Pass `return_exceptions=True` to get the exceptions in place of results instead.
+Example: `zones = parallel_map(categorize_zone, [(c, "DO") for c in cities], star=True)`"""
+
+
+class ParallelCallError(Exception):
+    """One or more calls of a parallel_map/run_async failed."""
+
+    def __init__(self, errors: List[Tuple[int, Any, BaseException]], results: List[Any]):
+        self.errors = errors  # (index, item, exception), in item order
+        self.results = results
+        lines = [f"{len(errors)} of {len(results)} calls failed:"]
+        lines += [f"  [{index}] {item!r}: {type(exc).__name__}: {exc}" for index, item, exc in errors[:10]]
+        if len(errors) > 10:
+            lines.append(f"  ... and {len(errors) - 10} more")
+        super().__init__("\n".join(lines))
+
+
+def _call(fn: Callable, item: Any, star: bool) -> Any:
+    if star:
+        return fn(**item) if isinstance(item, dict) else fn(*item)
+    return fn(item)
+
+
+def parallel_map(
+    fn: Callable,
+    items: Iterable,
+    max_workers: int = TOOL_MAX_WORKERS,
+    timeout: Optional[float] = TOOL_CALL_TIMEOUT,
+    star: bool = False,
+    return_exceptions: bool = False,
+) -> List[Any]:
+    """
+    Call `fn` on every item concurrently on a bounded thread pool.
+    Args:
+        fn: Function to call (typically an I/O-bound tool)
+        items: Arguments, one call per item
+        max_workers: Max concurrent calls
+        timeout: Max seconds per call, from the moment it starts (None or 0 for no limit).
+            A timed-out call's thread is abandoned, not killed
+        star: Unpack tuple items as positional and dict items as keyword arguments
+        return_exceptions: Put exceptions in the results instead of raising
+    Returns:
+        Results in item order
+    """
+    items = list(items)
+    if not items:
+        return []
+    results: List[Any] = [None] * len(items)
+    errors: List[Tuple[int, Any, BaseException]] = []
+    started = {}
+
+    def run(index: int) -> Any:
+        started[index] = time.monotonic()
+        # Fanned-out calls queue behind interactive requests at the API rate limits
+        with request_priority(BATCH):
+            return _call(fn, items[index], star)
+
+    pool = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items))), thread_name_prefix="parallel-map")
+    # Each call runs in a copy of the caller's context, so it's traced under the current span
+    futures = {pool.submit(contextvars.copy_context().run, run, index): index for index in range(len(items))}
+    pending = set(futures)
+    abandoned = False
+    try:
+        while pending:
+            wait_for = None
+            if timeout:
+                now = time.monotonic()
+                deadlines = [started[futures[f]] + timeout - now for f in pending if futures[f] in started]
+                # Calls still queued start as workers free up: check again shortly
+                wait_for = max(0.0, min(deadlines)) if deadlines else 0.05
+            done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = futures[future]
+                try:
+                    results[index] = future.result()
+                except Exception as e:
+                    errors.append((index, items[index], e))
+            if timeout:
+                now = time.monotonic()
+                for future in list(pending):
+                    index = futures[future]
+                    if index in started and now - started[index] > timeout:
+                        pending.discard(future)
+                        abandoned = True
+                        errors.append((index, items[index], TimeoutError(f"call took longer than {timeout}s")))
+    finally:
+        # Calls not started yet are dropped (shutdown's cancel_futures needs Python 3.9)
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=not abandoned)
+
+    errors.sort(key=lambda error: error[0])
+    if return_exceptions:
+        for index, _, exc in errors:
+            results[index] = exc
+    elif errors:
+        raise ParallelCallError(errors, results)
+    return results
+
+
+def run_async(*coroutines: Awaitable, return_exceptions: bool = False) -> List[Any]:
+    """
+    Run coroutines concurrently and wait for all of them (from synchronous agent code).
+    Args:
+        coroutines: e.g. `analyze_image_async(path, question)` for several images
+        return_exceptions: Put exceptions in the results instead of raising
+    Returns:
+        Results in argument order
+    """
+    async def gather():
+        return await asyncio.gather(*coroutines, return_exceptions=True)
+
+    with request_priority(BATCH):
+        background = get_background_loop()
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is not background.loop:
+            # On the shared long-lived loop, so async clients and their connections are
+            # reused across calls (the coroutines run in a copy of the caller's context)
+            outcomes = background.submit(gather()).result()
+        else:
+            # Called from a coroutine on that loop, which can't wait on itself: use a fresh one in a thread
+            box = {}
+            context = contextvars.copy_context()
+            thread = threading.Thread(target=lambda: box.setdefault("outcomes", context.run(asyncio.run, gather())))
+            thread.start()
+            thread.join()
+            outcomes = box["outcomes"]
+
+    if return_exceptions:
+        return list(outcomes)
+    errors = [(index, None, out) for index, out in enumerate(outcomes) if isinstance(out, BaseException)]
+    if errors:
+        raise ParallelCallError(errors, [None if isinstance(out, BaseException) else out for out in outcomes])
+    return list(outcomes)
+
+
+@functools.lru_cache(maxsize=None)
+def get_tool_executor() -> ThreadPoolExecutor:
+    """
+    Thread pool running the sync tools behind `<tool>_async` variants. Kept apart from
+    the background loop's default executor, so slow (or timed-out, still running)
+    tools can't starve the other work the loop hands to threads.
+    """
+    return ThreadPoolExecutor(max_workers=ASYNC_TOOL_WORKERS, thread_name_prefix="async-tool")
+
+
+def async_tool(
+    fn: Callable,
+    native: Optional[Callable[..., Awaitable]] = None,
+    timeout: Optional[float] = TOOL_CALL_TIMEOUT,
+) -> Callable[..., Awaitable]:
+    """
+    Async variant of a tool, named `<tool>_async`.
+    Args:
+        fn: The (sync) tool
+        native: The tool module's own async implementation, if it has one;
+            otherwise `fn` runs on the tool executor (see `get_tool_executor`)
+        timeout: Max seconds per call (None or 0 for no limit)
+    Returns:
+        Coroutine function with the tool's signature
+    """
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        call = native(*args, **kwargs) if native is not None else run_in_thread(fn, *args, executor=get_tool_executor(), **kwargs)
+        return await (asyncio.wait_for(call, timeout) if timeout else call)
+
+    wrapper.__name__ = wrapper.__qualname__ = f"{fn.__name__}_async"
+    return wrapper
@@ -0,0 +1,186 @@
+# conversation_memory.py
+
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+import json
+import time
+import os
+
+from llama_index.core.llms import ChatMessage
+from dotenv import load_dotenv
+
+from src.prompt_builder import get_token_counter
+from src.tracing import span
+
+# Load env variables
+load_dotenv()
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "6000"))
+MAX_TOOL_OUTPUT_TOKENS = int(os.getenv("MAX_TOOL_OUTPUT_TOKENS", "500"))
+
+# Earlier turns quoted in the summary of the turns no longer shown in full
+SUMMARY_TURNS = 10
+
+# Prefix CodeActAgent puts on the message carrying code execution results
+EXECUTION_RESULT_PREFIX = "Result of executing the code given:"
+
+
+class ConversationMemory:
+    """
+    Token-budgeted conversation memory for the agent.
+    Each turn's new messages are serialized once, when the turn ends, and kept as a
+    delta; older turns are never re-serialized. Large code/tool outputs are stubbed
+    before they are stored. Only the most recent turns that fit in the token budget
+    are kept in full; older turns are folded into a running summary as they fall out
+    of the budget and their messages are released. The chat history handed to the
+    agent is that summary followed by the turns kept.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = MEMORY_TOKEN_BUDGET,
+        max_tool_output_tokens: int = MAX_TOOL_OUTPUT_TOKENS,
+        token_counter: Optional[Callable[[str], int]] = None,
+    ):
+        """
+        Initialize the conversation memory.
+        Args:
+            token_budget: Max tokens of chat history sent to the agent
+            max_tool_output_tokens: Tool outputs longer than this are stubbed
+            token_counter: Callable returning the number of tokens in a string
+        """
+        self.token_budget = token_budget
+        self.max_tool_output_tokens = max_tool_output_tokens
+        self._count = token_counter or get_token_counter()
+
+        # One serialized delta (JSON list of messages) per turn, plus parsed copies
+        self.deltas: List[str] = []
+        self._turns: List[List[ChatMessage]] = []
+        self._turn_tokens: List[int] = []
+        self._total_bytes = 0
+
+        # Running summary of the turns folded out of the budget: how many, and the
+        # summary lines of the latest SUMMARY_TURNS of them
+        self._summarized = 0
+        self._summary_lines: Deque[List[str]] = deque(maxlen=SUMMARY_TURNS)
+
+        # Per-turn serialization stats
+        self.stats: List[Dict[str, Any]] = []
+
+    def __len__(self) -> int:
+        return len(self._turns)
+
+    @property
+    def total_bytes(self) -> int:
+        """Size of the serialized turns kept."""
+        return self._total_bytes
+
+    def _stub(self, message: ChatMessage) -> ChatMessage:
+        """Replace a large tool/code output by its beginning and a note."""
+        content = message.content or ""
+        is_output = message.role.value == "tool" or content.startswith(EXECUTION_RESULT_PREFIX)
+        if not is_output:
+            return message
+        tokens = self._count(content)
+        if tokens <= self.max_tool_output_tokens:
+            return message
+        # Cut proportionally; close enough to the token limit without re-tokenizing
+        kept = content[: len(content) * self.max_tool_output_tokens // tokens]
+        return ChatMessage(
+            role=message.role,
+            content=f"{kept}\n[... output truncated, {tokens} tokens in total ...]",
+            additional_kwargs=message.additional_kwargs,
+        )
+
+    @staticmethod
+    def _summary_of(messages: List[ChatMessage]) -> List[str]:
+        """Summary lines of one turn: its question and final answer, shortened."""
+        question = next((m.content for m in messages if m.role.value == "user"), "") or ""
+        answer = next((m.content for m in reversed(messages) if m.role.value == "assistant"), "") or ""
+        lines = [f"- user: {question.strip()[:150]}"]
+        if answer:
+            lines.append(f"  assistant: {answer.strip()[:150]}")
+        return lines
+
+    def _fold(self):
+        """Fold the oldest turns into the summary until the rest fit in the budget (keeping at least one)."""
+        used = sum(self._turn_tokens)
+        while used > self.token_budget and len(self._turns) > 1:
+            messages = self._turns.pop(0)
+            used -= self._turn_tokens.pop(0)
+            self._total_bytes -= len(self.deltas.pop(0))
+            self._summary_lines.append(self._summary_of(messages))
+            self._summarized += 1
+
+    def window(self) -> List[ChatMessage]:
+        """Chat history for the next turn: the summary of earlier turns, then the turns kept."""
+        history = []
+        if self._summarized:
+            lines = [f"Summary of {self._summarized} earlier turn(s) not shown in full:"]
+            for turn_lines in self._summary_lines:
+                lines.extend(turn_lines)
+            history.append(ChatMessage(role="assistant", content="\n".join(lines)))
+        for messages in self._turns:
+            history.extend(messages)
+        return history
+
+    def record_turn(self, messages: List[ChatMessage]):
+        """
+        Store the messages produced in one turn.
+        Args:
+            messages: The new messages of the turn (user query, code, results, answer)
+        """
+        with span("memory.record", messages=len(messages)) as s:
+            start = time.perf_counter()
+            messages = [self._stub(message) for message in messages]
+            delta = json.dumps([message.model_dump(mode="json") for message in messages])
+            serialize_time = time.perf_counter() - start
+            s.set(bytes=len(delta))
+
+        self.deltas.append(delta)
+        self._total_bytes += len(delta)
+        self._turns.append(messages)
+        self._turn_tokens.append(sum(self._count(message.content or "") for message in messages))
+        turn_tokens = self._turn_tokens[-1]
+        self._fold()
+
+        self.stats.append({
+            "turn": self._summarized + len(self._turns),
+            "serialize_time": serialize_time,
+            "delta_bytes": len(delta),
+            "total_bytes": self._total_bytes,
+            "turn_tokens": turn_tokens,
+        })
+
+    async def arecord_from_context(self, ctx, window_size: int):
+        """
+        Store the messages the agent added to the context's memory during this turn.
+        Args:
+            ctx: Workflow context the turn ran in
+            window_size: Number of history messages the turn started with (from `window`)
+        """
+        memory = await ctx.store.get("memory")
+        messages = await memory.aget_all()
+        self.record_turn(messages[window_size:])
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serializable state; the per-turn deltas are reused as-is."""
+        return {
+            "deltas": list(self.deltas),
+            "summary": {"turns": self._summarized, "lines": [list(lines) for lines in self._summary_lines]},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], **kwargs) -> "ConversationMemory":
+        memory = cls(**kwargs)
+        summary = data.get("summary", {})
+        memory._summarized = summary.get("turns", 0)
+        memory._summary_lines.extend(summary.get("lines", []))
+        for delta in data.get("deltas", []):
+            messages = [ChatMessage.model_validate(m) for m in json.loads(delta)]
+            memory.deltas.append(delta)
+            memory._total_bytes += len(delta)
+            memory._turns.append(messages)
+            memory._turn_tokens.append(sum(memory._count(m.content or "") for m in messages))
+        # The budget may be smaller than the one the state was saved with
+        memory._fold()
+        return memory
@@ -3,17 +3,17 @@
 from dotenv import load_dotenv
 from pathlib import Path
 import importlib
+import asyncio
+import functools
 import warnings
 import inspect
+import logging
 import sys
 import os
 
 from llama_index.core.agent.workflow import CodeActAgent
-from llama_index.llms.groq import Groq as LlamaGroq
+from llama_index.core.tools import FunctionTool
 
-import matplotlib.pyplot as plt
-import pandas as pd
-import numpy as np
 import datetime
 import re
 
@@ -21,32 +21,75 @@ import re
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from src.code_executor import SimpleCodeExecutor
+from src.concurrency import PROMPT as CONCURRENCY_PROMPT, ParallelCallError, async_tool, parallel_map, run_async
+from src.concurrency import TOOL_CALL_TIMEOUT, TOOL_MAX_WORKERS
+from src.llm_cache import LLM_CACHE
+from src.router import FAST_LLM, ModelRouter
+from src.scheduled_llm import ScheduledLLM
+from src.lazy_imports import lazy_import
+from src.prompt_builder import PromptBuilder
+from src.tracing import span, traced
+
+logger = logging.getLogger(__name__)
 
 # Load env variavbles
 load_dotenv()
 AGENT_NAME = os.getenv("AGENT_NAME", "base")
 GROK_API_KEY = os.getenv("GROK_API_KEY")
 LLM = os.getenv("LLM")
+EXECUTOR_BACKEND = os.getenv("EXECUTOR_BACKEND", "local") # "local" or "process"
 
-# LLM
-llm = LlamaGroq(
-    api_key=GROK_API_KEY,
-    model=LLM,
-    #presence_penalty=0.5,
-    #temperature=0.25,
-    #top_p=0.9,
-    #top_k=20,
-    #min_p=0,
-    )
+# LLM (built on first use; can be replaced, e.g. by a scripted model in benchmarks)
+llm = None
 
-def load_agent_tools():
-    """Load agent tools."""
+def build_llm(model):
+    """Build a Groq LLM for `model`, scheduled (and cached, if LLM_CACHE is set)."""
+    from llama_index.llms.groq import Groq as LlamaGroq
+    groq_llm = LlamaGroq(
+        api_key=GROK_API_KEY,
+        model=model,
+        max_retries=0, # retried by the scheduler, which knows about the rate limits
+        #presence_penalty=0.5,
+        #temperature=0.25,
+        #top_p=0.9,
+        #top_k=20,
+        #min_p=0,
+        )
+    # Rate limits, priorities and retries shared by all sessions
+    scheduled = ScheduledLLM(groq_llm)
+    if LLM_CACHE:
+        from src.llm_cache import CachingLLM
+        return CachingLLM(scheduled)
+    return scheduled
+
+def get_llm():
+    """Get the agent's LLM, building the Groq client on first use."""
+    global llm
+    if llm is None:
+        llm = build_llm(LLM)
+    return llm
+
+@functools.lru_cache(maxsize=None)
+def get_router():
+    """Per-turn router between FAST_LLM and the agent's model (None if FAST_LLM isn't set)."""
+    if not FAST_LLM:
+        return None
+    return ModelRouter(build_llm(FAST_LLM))
+
+@functools.lru_cache(maxsize=None)
+def discover_tools():
+    """Import the tool modules and collect their functions (done once per process)."""
     def get_module_functions(module_name):
         try:
             mod = importlib.import_module(module_name)
+            # Private helpers and async variants are not exposed as tools; each call is traced
+            # (errors by type only: tool arguments and outputs are user data)
             return {
-                name: obj for name, obj in inspect.getmembers(mod, inspect.isfunction)
+                name: traced(f"tool.{name}", redact=True)(obj)
+                for name, obj in inspect.getmembers(mod, inspect.isfunction)
                 if obj.__module__ == mod.__name__
+                and not name.startswith("_")
+                and not inspect.iscoroutinefunction(obj)
             }
         except ModuleNotFoundError:
             warnings.warn(f"[WARN] Module '{module_name}' not found.")
@@ -67,25 +110,67 @@ def load_agent_tools():
 
     return tools_dict
 
+@functools.lru_cache(maxsize=None)
+def discover_async_tools():
+    """`<tool>_async` variants of the tools, using a module's own async implementation when it has one."""
+    async_tools = {}
+    for name, fn in discover_tools().items():
+        native = getattr(sys.modules[fn.__module__], f"{name}_async", None)
+        if native is not None and inspect.iscoroutinefunction(native):
+            native = traced(f"tool.{name}", redact=True)(native)
+        else:
+            native = None
+        async_tools[f"{name}_async"] = async_tool(fn, native=native)
+    return async_tools
+
+def load_agent_tools():
+    """Load agent tools and their async variants."""
+    # A copy, since the executor uses it as its (mutable) locals
+    return {**discover_tools(), **discover_async_tools()}
+
+@functools.lru_cache(maxsize=None)
+def get_function_tools():
+    """Tool schemas for the agent, built once per process."""
+    return tuple(FunctionTool.from_defaults(fn) for fn in discover_tools().values())
+
+def build_executor_namespace():
+    """Build the initial (locals, globals) namespace for the code executor."""
+    local_ns = load_agent_tools()
+    # Heavy libraries are only imported when agent code first uses them
+    global_ns = {
+        "__builtins__": __builtins__,
+        "datetime": datetime,
+        "matplotlib": lazy_import("matplotlib"),
+        "pd": lazy_import("pandas"),
+        "np": lazy_import("numpy"),
+        "re": re,
+        # Concurrent tool calls (see CONCURRENCY_PROMPT)
+        "asyncio": asyncio,
+        "parallel_map": parallel_map,
+        "run_async": run_async,
+        "ParallelCallError": ParallelCallError,
+        }
+    return local_ns, global_ns
+
+def build_code_executor():
+    """Build code executor for the configured backend."""
+    if EXECUTOR_BACKEND == "process":
+        # Imported here so the local backend never touches multiprocessing
+        from src.executor_pool import PooledCodeExecutor
+        return PooledCodeExecutor(namespace_factory=build_executor_namespace)
+
+    local_ns, global_ns = build_executor_namespace()
+    return SimpleCodeExecutor(locals=local_ns, globals=global_ns)
+
 def build_code_executor_fn():
     """Build code executor function."""
-    code_executor = SimpleCodeExecutor(
-        locals=load_agent_tools(),
-        globals={
-        "__builtins__": __builtins__,
-        "datetime": __import__("datetime"),
-        "matplotlib": __import__("matplotlib"),
-        "pd": __import__("pandas"),
-        "np": __import__("numpy"),
-        "re": __import__("re"),
-        },
-        )
-    return code_executor.execute
+    return build_code_executor().execute
 
-def get_system_prompt():
-    """Load and format system prompt."""
+@functools.lru_cache(maxsize=4)
+def _load_system_prompt(agent_name: str, today: datetime.date) -> str:
+    # Rendered once per day: the prompt templates include today's date
     current_dir = Path(__file__).parent
-    file_path = current_dir.parent / "prompts" / (AGENT_NAME+".txt")
+    file_path = current_dir.parent / "prompts" / (agent_name+".txt")
     try:
         with open(file_path, "r") as file: 
             content = file.read()
@@ -94,26 +179,86 @@ def get_system_prompt():
         warnings.warn(f"[WARN] Could not load system prompt: {str(e)}")
         return ""
 
+def get_system_prompt():
+    """Load and format system prompt (shared by all agents of the process)."""
+    return _load_system_prompt(AGENT_NAME, datetime.date.today())
+
+@functools.lru_cache(maxsize=None)
+def get_concurrency_prompt():
+    """Prompt section describing the concurrent tool call helpers."""
+    return CONCURRENCY_PROMPT.format(workers=TOOL_MAX_WORKERS, timeout=TOOL_CALL_TIMEOUT or None)
+
 ## Agent Workflow ##
 class DemoAgent():
-    def __init__(self):
+    def __init__(self, llm=None, tools=None, router=None):
+        # Only the executor (and its namespace) belongs to this agent; the LLM,
+        # tool schemas and prompt templates are shared by the whole process
+        self.code_executor = build_code_executor()
+
+        # The large model; a router may send light turns to a fast one instead
+        self.llm = llm or get_llm()
+        self.router = router if router is not None else get_router()
+        self.last_route = None
+
         self._agent = CodeActAgent(
-            llm=llm,
-            code_execute_fn=build_code_executor_fn(),
-            tools=list(load_agent_tools().values())
+            llm=self.llm,
+            code_execute_fn=self.code_executor.execute,
+            tools=list(tools or get_function_tools())
             )
 
         self.system_prompt = get_system_prompt()
 
         self.additional_instructions = ""
 
-    def __call__(self, query: str, ctx):
+        # Stable sections first so the prompt prefix is identical across turns
+        self.prompt = PromptBuilder(order=["codeact", "concurrency", "agent", "files"])
+        self.prompt.set("codeact", self._agent.code_act_system_prompt.get_template())
+        self.prompt.set("concurrency", get_concurrency_prompt())
+        self.prompt.set("agent", self.system_prompt)
 
-        # Update code-act system prompt
-        self._agent.code_act_system_prompt.template += self.system_prompt + self.additional_instructions
+        # Prompt size of the last turn
+        self.prompt_stats = {}
 
-        handler = self._agent.run(query, ctx=ctx)
+    def __call__(self, query: str, ctx, chat_history=None):
+        with span("agent.call", redact=True, history=len(chat_history or [])) as s:
+            # Update code-act system prompt (only re-rendered when the uploaded files change)
+            self._agent.code_act_system_prompt.template = self.prompt.build()
+
+            self.prompt_stats = {"tokens": self.prompt.token_counts(), "builds": self.prompt.builds}
+            logger.info("System prompt tokens per section: %s", self.prompt_stats["tokens"])
+            s.set(prompt_tokens=sum(self.prompt_stats["tokens"].values()), prompt_builds=self.prompt.builds)
+
+            # Pick the model for this turn
+            if self.router is not None:
+                self.last_route = self.router.route(
+                    query, has_files=bool(self.additional_instructions), large_model=self.llm.metadata.model_name
+                )
+                self._agent.llm = self.router.fast_llm if self.last_route.fast else self.llm
+
+            handler = self._agent.run(query, ctx=ctx, chat_history=chat_history)
+            # The workflow runs after this returns: the span lasts until it's done
+            s.end_with(handler)
         return handler
 
+    def record_latency(self, metrics):
+        """Report a finished turn's latency to the router, per routed model."""
+        if self.router is not None and self.last_route is not None:
+            self.router.record(self.last_route.model, metrics["total"], metrics["ttft"])
+
+    def pop_figures(self):
+        """Figures rendered by the agent's code since the last call."""
+        return self.code_executor.pop_figures()
+
+    def set_output_sink(self, sink):
+        """Stream executor output chunks to `sink` while code runs (None to disable)."""
+        self.code_executor.output_sink = sink
+
+    def close(self):
+        """Release the code executor (stops its worker process, if any)."""
+        close = getattr(self.code_executor, "close", None)
+        if close is not None:
+            close()
+
     def give_instructions(self, instructions):
-        self.additional_instructions = instructions
\ No newline at end of file
+        self.additional_instructions = instructions
+        self.prompt.set("files", instructions)
\ No newline at end of file
@@ -0,0 +1,459 @@
+# executor_pool.py
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import multiprocessing as mp
+import functools
+import threading
+import warnings
+import weakref
+import time
+import sys
+import os
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+from dotenv import load_dotenv
+
+# Add the parent directory (project root) to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.code_executor import ExecutionResult, SimpleCodeExecutor
+from src.figure_store import use_agg
+from src import tracing
+
+# Load env variables
+load_dotenv()
+EXECUTOR_POOL_SIZE = int(os.getenv("EXECUTOR_POOL_SIZE", str(os.cpu_count() or 2)))
+EXECUTOR_TIMEOUT = float(os.getenv("EXECUTOR_TIMEOUT", "60"))
+EXECUTOR_MAX_RSS_MB = int(os.getenv("EXECUTOR_MAX_RSS_MB", "2048"))
+
+# Building the namespace may import the agent's modules for the first time
+INIT_TIMEOUT = 120
+
+# Heavy libraries imported once by the fork server, so every worker starts warm
+PRELOAD_MODULES = ("pandas", "numpy", "matplotlib")
+
+# How often the parent checks the worker while code is running (seconds)
+POLL_INTERVAL = 0.05
+
+
+def _rss_bytes(pid: int) -> Optional[int]:
+    """Return the resident set size of a process, or None if it can't be read."""
+    try:
+        with open(f"/proc/{pid}/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _vm_bytes(pid: int) -> Optional[int]:
+    """Return the virtual memory size of a process, or None if it can't be read."""
+    try:
+        with open(f"/proc/{pid}/statm", "r") as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _limit_address_space(max_bytes: Optional[int]) -> bool:
+    """
+    Cap the address space of the current process, so a single huge allocation
+    fails with MemoryError instead of growing past the limit between two RSS polls.
+    Mappings that are reserved but never touched (thread stacks, allocator arenas)
+    count towards the address space, so the cap is `max_bytes` on top of what the
+    process has mapped already. Returns whether the cap could be set.
+    """
+    if not max_bytes or resource is None or not hasattr(resource, "RLIMIT_AS"):
+        return False
+    try:
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        limit = (_vm_bytes(os.getpid()) or 0) + max_bytes
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+        return True
+    except (ValueError, OSError):
+        return False
+
+
+def _city_rows() -> Optional[list]:
+    """
+    The parent's city cache, if workers can't read it themselves: a cache kept in
+    memory (including rows preloaded at runtime) lives only in this process.
+    """
+    module = sys.modules.get("src.city_lookup")
+    if module is None or not module.get_city_lookup.cache_info().currsize:
+        return None
+    lookup = module.get_city_lookup()
+    return None if lookup.persistent else lookup.snapshot()
+
+
+def _cpu_seconds() -> float:
+    """CPU time (user + system) consumed so far by the current process."""
+    if resource is None:
+        return time.process_time()
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _worker_main(conn, preload: Tuple[str, ...]):
+    """Worker process loop: owns one session namespace and runs code on request."""
+    # Only the parent process writes the trace file (it traces each execution as a whole)
+    tracing.disable()
+
+    # The fork server has imported matplotlib already, but not pyplot, which is what
+    # resolves the backend: selecting it here is still early enough
+    use_agg()
+
+    for module_name in preload:
+        try:
+            __import__(module_name)
+        except ImportError:
+            pass
+
+    executor = None
+    while True:
+        try:
+            kind, payload = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+
+        if kind == "init":
+            namespace_factory, max_rss, city_rows = payload
+            limited = _limit_address_space(max_rss)
+            if city_rows:
+                from src.city_lookup import get_city_lookup
+                get_city_lookup().restore(city_rows)
+            local_ns, global_ns = namespace_factory()
+            executor = SimpleCodeExecutor(locals=local_ns, globals=global_ns)
+            conn.send(("ready", limited))
+
+        elif kind == "exec":
+            code, stream = payload
+            executor.output_sink = (lambda chunk: conn.send(("chunk", chunk))) if stream else None
+            cpu_start = _cpu_seconds()
+            wall_start = time.perf_counter()
+            result = executor.run(code)
+            stats = {
+                "wall_time": time.perf_counter() - wall_start,
+                "cpu_time": _cpu_seconds() - cpu_start,
+                "rss_bytes": _rss_bytes(os.getpid()),
+            }
+            # The return value stays in the worker; it is already part of the output
+            result.return_value = None
+            # Figures travel with the result (the images are already in the figure store)
+            executor.pop_figures()
+            conn.send(("done", (result, stats)))
+
+        elif kind == "inspect":
+            conn.send(("done", (executor.memory_usage(), executor.heaviest(payload))))
+
+        elif kind == "stop":
+            break
+
+    if executor is not None:
+        executor.close()
+    conn.close()
+
+
+class WorkerError(RuntimeError):
+    """Raised when a worker is killed or dies while running code."""
+
+
+class _Worker:
+    """Handle on a single worker process and its end of the pipe."""
+
+    def __init__(self, ctx, preload: Tuple[str, ...]):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main, args=(child_conn, preload), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+
+    def is_alive(self) -> bool:
+        return self.process.is_alive()
+
+    def request(
+        self,
+        message,
+        timeout: float,
+        max_rss: Optional[int],
+        on_chunk: Optional[Callable[[str], None]] = None,
+    ) -> Any:
+        """
+        Send a message and wait for the reply, enforcing timeout and RSS limit.
+        Output chunks streamed by the worker in the meantime are passed to `on_chunk`.
+        """
+        try:
+            self.conn.send(message)
+        except OSError as e:
+            self._died(e)
+        deadline = time.monotonic() + timeout
+        while True:
+            if self.conn.poll(POLL_INTERVAL):
+                try:
+                    kind, payload = self.conn.recv()
+                except (EOFError, OSError) as e:
+                    self._died(e)
+                if kind != "chunk":
+                    return payload
+                if on_chunk is not None:
+                    on_chunk(payload)
+            if not self.process.is_alive():
+                self.kill()
+                raise WorkerError("worker process exited unexpectedly")
+            if time.monotonic() > deadline:
+                self.kill()
+                raise TimeoutError(f"execution exceeded {timeout:g}s")
+            rss = _rss_bytes(self.process.pid)
+            if max_rss and rss and rss > max_rss:
+                self.kill()
+                raise MemoryError(
+                    f"worker exceeded the {max_rss // (1024 * 1024)} MB memory limit"
+                )
+
+    def _died(self, exc: BaseException):
+        # The worker went away mid-request (os._exit, a crash in a C extension, the OOM killer)
+        self.kill()
+        raise WorkerError(f"worker process died ({type(exc).__name__})") from exc
+
+    def stop(self):
+        try:
+            self.conn.send(("stop", None))
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.kill()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(timeout=1)
+        self.conn.close()
+
+
+class WorkerPool:
+    """
+    Keeps a number of pre-started worker processes ready to host executor sessions.
+    Workers are forked from a fork server that has already imported the heavy
+    libraries, so acquiring one is cheap. A worker holds a single session's state,
+    so it is never handed out twice; the pool is refilled in the background instead.
+    """
+
+    def __init__(self, size: int = EXECUTOR_POOL_SIZE, preload: Tuple[str, ...] = PRELOAD_MODULES):
+        """
+        Initialize the worker pool.
+        Args:
+            size: Number of idle workers to keep warm
+            preload: Modules to import before workers are forked
+        """
+        if "forkserver" in mp.get_all_start_methods():
+            self._ctx = mp.get_context("forkserver")
+            self._ctx.set_forkserver_preload(list(preload) + [__name__])
+        else:
+            self._ctx = mp.get_context("spawn")
+
+        self.size = size
+        self.preload = tuple(preload)
+        self._idle: List[_Worker] = []
+        self._lock = threading.Lock()
+        # Whether a refill thread is running (there is at most one)
+        self._refilling = True
+        self._refill()
+
+    def _refill(self):
+        # Start workers one at a time until the pool is full again; workers taken
+        # out meanwhile are replaced by the same loop
+        while True:
+            with self._lock:
+                if len(self._idle) >= self.size:
+                    self._refilling = False
+                    return
+            worker = _Worker(self._ctx, self.preload)
+            with self._lock:
+                self._idle.append(worker)
+
+    def acquire(self) -> _Worker:
+        """Take a warm worker out of the pool (or start one if none is idle)."""
+        with self._lock:
+            worker = self._idle.pop() if self._idle else None
+            start_refill = not self._refilling
+            self._refilling = True
+        if start_refill:
+            threading.Thread(target=self._refill, daemon=True).start()
+        if worker is None or not worker.is_alive():
+            worker = _Worker(self._ctx, self.preload)
+        return worker
+
+    def shutdown(self):
+        """Stop all idle workers."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.stop()
+
+
+@functools.lru_cache(maxsize=None)
+def get_worker_pool() -> WorkerPool:
+    """Process-wide worker pool, created on first use."""
+    return WorkerPool()
+
+
+class PooledCodeExecutor:
+    """
+    A code executor with the same interface as SimpleCodeExecutor, but the session
+    namespace lives in a dedicated worker process taken from a WorkerPool.
+    Each execution gets a wall-clock timeout and an RSS limit; when either is hit,
+    the worker is killed and the session starts over with a fresh namespace. The
+    worker's address space is capped as well, so an allocation far over the limit
+    fails right away with a MemoryError inside the agent code.
+    """
+
+    def __init__(
+        self,
+        namespace_factory: Callable[[], Tuple[Dict[str, Any], Dict[str, Any]]],
+        pool: Optional[WorkerPool] = None,
+        timeout: float = EXECUTOR_TIMEOUT,
+        max_rss_mb: int = EXECUTOR_MAX_RSS_MB,
+    ):
+        """
+        Initialize the pooled code executor.
+        Args:
+            namespace_factory: Picklable callable returning the initial (locals, globals)
+            pool: Worker pool to take workers from (defaults to the shared pool)
+            timeout: Wall-clock limit per execution, in seconds
+            max_rss_mb: Resident memory limit for the worker, in MB
+        """
+        self.namespace_factory = namespace_factory
+        self.pool = pool or get_worker_pool()
+        self.timeout = timeout
+        self.max_rss = max_rss_mb * 1024 * 1024 if max_rss_mb else None
+
+        # Optional callable receiving output chunks while code runs
+        self.output_sink: Optional[Callable[[str], None]] = None
+
+        # Resource accounting
+        self.last_stats: Dict[str, Any] = {}
+        self.last_timings: Dict[str, float] = {}
+        self.cpu_time_total = 0.0
+
+        # Figures rendered since they were last collected with pop_figures()
+        self.figures: List[Dict[str, Any]] = []
+
+        self._worker: Optional[_Worker] = None
+        self._finalizer = None
+        self._lock = threading.Lock()
+
+    def _ensure_worker(self) -> _Worker:
+        if self._worker is not None and self._worker.is_alive():
+            return self._worker
+
+        worker = self.pool.acquire()
+        limited = worker.request(
+            ("init", (self.namespace_factory, self.max_rss, _city_rows())),
+            max(self.timeout, INIT_TIMEOUT),
+            self.max_rss,
+        )
+        if self.max_rss:
+            polled = _rss_bytes(worker.process.pid) is not None
+            if not (limited or polled):
+                warnings.warn("The executor memory limit can't be enforced on this platform")
+            elif not limited:
+                warnings.warn("Could not cap the worker's address space: memory limit checked by polling only")
+            elif not polled:
+                warnings.warn("Worker memory can't be polled on this platform: only the address space is capped")
+        self._worker = worker
+        self._finalizer = weakref.finalize(self, worker.stop)
+        return worker
+
+    def _reset(self):
+        if self._finalizer is not None:
+            self._finalizer.detach()
+        self._worker = None
+        self._finalizer = None
+
+    def run(self, code: str) -> ExecutionResult:
+        """
+        Execute Python code in the session's worker process.
+        Args:
+            code: Python code to execute
+        Returns:
+            ExecutionResult for this run (without the return value, which stays in the worker)
+        """
+        with self._lock:
+            try:
+                worker = self._ensure_worker()
+                sink = self.output_sink
+                result, stats = worker.request(
+                    ("exec", (code, sink is not None)), self.timeout, self.max_rss, on_chunk=sink
+                )
+            except (TimeoutError, MemoryError, WorkerError) as e:
+                self._reset()
+                self.last_stats = {"error": type(e).__name__}
+                self.last_timings = {}
+                return ExecutionResult(
+                    success=False,
+                    output=(
+                        f"Error: {type(e).__name__}: {str(e)}\n"
+                        "The execution was stopped and all session variables were reset.\n"
+                    ),
+                )
+
+        self.last_stats = stats
+        self.last_timings = result.timings
+        self.cpu_time_total += stats["cpu_time"]
+        self.figures.extend(result.figures)
+        return result
+
+    def execute(self, code: str) -> str:
+        """
+        Execute Python code in the session's worker process.
+        Args:
+            code: Python code to execute
+        Returns:
+            The captured output, as returned by SimpleCodeExecutor.execute
+        """
+        with tracing.span("executor.execute", backend="process", chars=len(code)) as s:
+            result = self.run(code)
+            s.set(success=result.success, cache_hit=result.cache_hit,
+                  output_bytes=len(result.output), **result.timings, **self.last_stats)
+        return result.output
+
+    def pop_figures(self) -> List[Dict[str, Any]]:
+        """Figures rendered since the last call, oldest first."""
+        figures, self.figures = self.figures, []
+        return figures
+
+    def namespace_bytes(self) -> int:
+        """Resident memory of the session's worker after its last execution (0 before any)."""
+        return self.last_stats.get("rss_bytes") or 0
+
+    def inspect(self, n: int = 10) -> Tuple[Dict[str, int], List[Dict[str, Any]]]:
+        """Memory usage and heaviest variables of the session's worker namespace."""
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                return {}, []
+            try:
+                return self._worker.request(("inspect", n), self.timeout, self.max_rss)
+            except (TimeoutError, MemoryError, WorkerError):
+                self._reset()
+                return {}, []
+
+    def memory_usage(self) -> Dict[str, int]:
+        """Same as SimpleCodeExecutor.memory_usage, for the worker's namespace."""
+        return self.inspect(0)[0]
+
+    def heaviest(self, n: int = 10) -> List[Dict[str, Any]]:
+        """Same as SimpleCodeExecutor.heaviest, for the worker's namespace."""
+        return self.inspect(n)[1]
+
+    def close(self):
+        """Stop the session's worker process."""
+        with self._lock:
+            if self._finalizer is not None:
+                self._finalizer()
+            self._reset()
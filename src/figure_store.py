@@ -0,0 +1,281 @@
+# figure_store.py
+
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from pathlib import Path
+import contextlib
+import functools
+import threading
+import tempfile
+import warnings
+import hashlib
+import sys
+import io
+import os
+
+from dotenv import load_dotenv
+
+from src.spillable_namespace import code_names
+
+# Load env variables
+load_dotenv()
+FIGURE_DIR = os.getenv("FIGURE_DIR", os.path.join(tempfile.gettempdir(), "code-agent-demo-figures"))
+FIGURE_FORMAT = os.getenv("FIGURE_FORMAT", "png").lower()  # "png" or "webp"
+FIGURE_MAX_SIDE = int(os.getenv("FIGURE_MAX_SIDE", "1600"))  # pixels
+FIGURE_MAX_KB = int(os.getenv("FIGURE_MAX_KB", "300"))  # per image; the resolution is lowered to fit
+FIGURE_STORE_MB = int(os.getenv("FIGURE_STORE_MB", "256"))
+
+MIME_TYPES = {"png": "image/png", "webp": "image/webp"}
+
+# Attempts at lowering the resolution of a figure over the size cap
+MAX_ENCODE_ATTEMPTS = 4
+
+# Names whose use means code may draw with pyplot (directly, or through pandas' .plot/.hist)
+PLOT_NAMES = frozenset({
+    "plt", "pyplot", "matplotlib", "figure", "subplots", "subplot", "plot", "hist", "boxplot",
+    "scatter", "bar", "barh", "pie", "imshow", "savefig", "gcf", "gca",
+})
+
+# Held by executions that may plot, once pyplot is imported (see `track_figures`)
+_snapshot_lock = threading.RLock()
+
+
+@functools.lru_cache(maxsize=None)
+def use_agg():
+    """Render matplotlib off-screen: no GUI windows, and `plt.show()` doesn't block (once per process)."""
+    os.environ["MPLBACKEND"] = "Agg"
+    if "matplotlib" in sys.modules:
+        sys.modules["matplotlib"].use("Agg")
+    # Figures are captured after each execution, so there is nothing to warn about
+    warnings.filterwarnings("ignore", message=".*non-interactive, and thus cannot be shown")
+
+
+def _live(owned: List[Any]) -> List[Any]:
+    # Managers the run created that pyplot hasn't closed yet
+    Gcf = sys.modules["matplotlib._pylab_helpers"].Gcf
+    return [manager for manager in owned if Gcf.figs.get(manager.num) is manager]
+
+
+def may_plot(names: Set[str], namespaces: Iterable[Dict[str, Any]]) -> bool:
+    """
+    Whether code may draw with pyplot: it uses plotting names, or calls a function of
+    the session that does (looked up in `namespaces`, following calls between them).
+    Args:
+        names: Names the code uses (see `code_names`)
+        namespaces: The session's locals and globals
+    """
+    namespaces = list(namespaces)
+    seen: Set[str] = set()
+    pending = set(names)
+    while pending:
+        if pending & PLOT_NAMES:
+            return True
+        seen |= pending
+        called: Set[str] = set()
+        for name in pending:
+            for namespace in namespaces:
+                # dict.get: spilled variables aren't reloaded (they are never functions)
+                fn = dict.get(namespace, name)
+                code = getattr(fn, "__code__", None)
+                if code is not None:
+                    called |= code_names(code)
+                    break
+        pending = called - seen
+    return False
+
+
+@contextlib.contextmanager
+def track_figures(owned: List[Any], plotting: bool = True):
+    """
+    Record the pyplot figures created in the block into `owned`, by comparing pyplot's
+    figures before and after it. pyplot's figures (and its current figure) are global
+    to the process, so blocks that may plot run one at a time; the others run freely,
+    and only keep the figures they made if no plotting block is running when they end.
+    Args:
+        owned: List the figure managers are appended to, for `capture_figures`
+        plotting: Whether the block may plot (see `may_plot`)
+    """
+    if "matplotlib.pyplot" not in sys.modules:
+        try:
+            yield owned
+        finally:
+            # pyplot was first imported by the block: all its figures are new
+            if "matplotlib.pyplot" in sys.modules:
+                Gcf = sys.modules["matplotlib._pylab_helpers"].Gcf
+                owned.extend(Gcf.get_all_fig_managers())
+        return
+
+    Gcf = sys.modules["matplotlib._pylab_helpers"].Gcf
+    if plotting:
+        with _snapshot_lock:
+            before = set(Gcf.get_all_fig_managers())
+            try:
+                yield owned
+            finally:
+                owned.extend(manager for manager in Gcf.get_all_fig_managers() if manager not in before)
+        return
+
+    before = set(Gcf.get_all_fig_managers())
+    try:
+        yield owned
+    finally:
+        # New figures while a plotting block runs may be its own: leave them to it
+        if _snapshot_lock.acquire(blocking=False):
+            try:
+                owned.extend(manager for manager in Gcf.get_all_fig_managers() if manager not in before)
+            finally:
+                _snapshot_lock.release()
+
+
+def render_figure(
+    fig: Any,
+    fmt: str = FIGURE_FORMAT,
+    max_side: int = FIGURE_MAX_SIDE,
+    max_bytes: int = FIGURE_MAX_KB * 1024,
+) -> Tuple[bytes, int, int]:
+    """
+    Encode a matplotlib figure, lowering its resolution until it fits the size caps.
+    Args:
+        fig: matplotlib Figure
+        fmt: "png" or "webp"
+        max_side: Max width/height in pixels
+        max_bytes: Max encoded size (best effort: gives up after a few attempts)
+    Returns:
+        Tuple of (encoded image, width, height)
+    """
+    width, height = fig.get_size_inches()
+    dpi = min(fig.dpi, max_side / max(width, height, 1e-6))
+    options = {"pil_kwargs": {"quality": 80}} if fmt == "webp" else {}
+    for _ in range(MAX_ENCODE_ATTEMPTS):
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format=fmt, dpi=dpi, **options)
+        data = buffer.getvalue()
+        if len(data) <= max_bytes:
+            break
+        # The encoded size scales roughly with the pixel count
+        dpi *= max(0.5, 0.9 * (max_bytes / len(data)) ** 0.5)
+    return data, round(width * dpi), round(height * dpi)
+
+
+class FigureStore:
+    """
+    Content-addressed store for rendered figures, shared by all sessions.
+    An image is written once to `<root>/<sha256>.<ext>`; the same figure rendered
+    again reuses the file. When the store grows past its size limit, the least
+    recently used images are removed. The store's size is kept as a running total,
+    so the directory is only scanned when the total goes over the limit.
+    """
+
+    def __init__(self, root: str = FIGURE_DIR, max_bytes: int = FIGURE_STORE_MB * 1024 * 1024):
+        """
+        Initialize the figure store.
+        Args:
+            root: Directory holding the images
+            max_bytes: Size limit of the store before old images are evicted
+        """
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # Bytes stored, as of the last scan plus the images written since (None before the first scan)
+        self._total: Optional[int] = None
+
+    def put(self, data: bytes, fmt: str, width: int, height: int) -> Dict[str, Any]:
+        """
+        Store an encoded image.
+        Args:
+            data: Encoded image
+            fmt: Its format ("png" or "webp")
+            width: Width in pixels
+            height: Height in pixels
+        Returns:
+            Figure reference with `hash`, `path`, `mime`, `width`, `height` and `bytes`
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.root / f"{digest}.{fmt}"
+        with self._lock:
+            if path.exists():
+                os.utime(path)
+            else:
+                tmp_path = self.root / f".incoming-{digest}.{fmt}"
+                tmp_path.write_bytes(data)
+                os.replace(tmp_path, path)
+                if self._total is not None:
+                    self._total += len(data)
+        self.cleanup(keep=path)
+        return {
+            "hash": digest,
+            "path": str(path),
+            "mime": MIME_TYPES.get(fmt, f"image/{fmt}"),
+            "width": width,
+            "height": height,
+            "bytes": len(data),
+        }
+
+    def _entries(self) -> List[Tuple[float, int, Path]]:
+        entries = []
+        for path in self.root.iterdir():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:  # Evicted by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def cleanup(self, keep: Optional[Path] = None):
+        """Evict least recently used images until the store fits its size limit."""
+        with self._lock:
+            if self._total is not None and self._total <= self.max_bytes:
+                return
+            # Also picks up the images other processes stored or evicted
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                path.unlink(missing_ok=True)
+                total -= size
+            self._total = total
+
+
+@functools.lru_cache(maxsize=None)
+def get_figure_store() -> FigureStore:
+    """Process-wide figure store, created on first use."""
+    return FigureStore()
+
+
+def capture_figures(
+    owned: List[Any], store: Optional[FigureStore] = None
+) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    Render and close the pyplot figures an execution left open.
+    Args:
+        owned: Figure managers recorded by `track_figures` for the execution
+        store: Where the images go (defaults to the process-wide store)
+    Returns:
+        Tuple of (figure references, error messages of figures that could not be rendered)
+    """
+    # Code that never imported pyplot has no figures
+    if "matplotlib.pyplot" not in sys.modules or not owned:
+        return [], []
+
+    Gcf = sys.modules["matplotlib._pylab_helpers"].Gcf
+    figures, errors = [], []
+    live = sorted(_live(owned), key=lambda manager: manager.num)
+    try:
+        for manager in live:
+            fig = manager.canvas.figure
+            if not (fig.axes or fig.images or fig.texts):
+                continue
+            try:
+                data, width, height = render_figure(fig)
+            except Exception as e:
+                errors.append(f"Figure {manager.num} could not be rendered: {type(e).__name__}: {e}")
+                continue
+            figures.append((store or get_figure_store()).put(data, FIGURE_FORMAT, width, height))
+    finally:
+        # Closed figures don't pile up in pyplot's registry across executions
+        for manager in live:
+            Gcf.destroy(manager)
+    return figures, errors
@@ -0,0 +1,56 @@
+# file_hashes.py
+
+from typing import Optional, Tuple
+from collections import OrderedDict
+import threading
+import hashlib
+import os
+
+CHUNK_SIZE = 1024 * 1024
+MAX_HASHES = 1024  # file hashes kept
+
+
+class FileHashes:
+    """
+    SHA-256 of files, computed in chunks and reused while a file's size and mtime
+    don't change. The most recently used `max_entries` hashes are kept.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None):
+        """
+        Initialize the file hashes.
+        Args:
+            max_entries: Max hashes kept (defaults to MAX_HASHES)
+        """
+        self.max_entries = MAX_HASHES if max_entries is None else max_entries
+        self._hashes: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hash(self, path: str) -> str:
+        """SHA-256 of a file, as a hex string."""
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            digest = self._hashes.get(key)
+            if digest is not None:
+                self._hashes.move_to_end(key)
+                return digest
+
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        with self._lock:
+            self._hashes[key] = digest
+            while len(self._hashes) > self.max_entries:
+                self._hashes.popitem(last=False)
+        return digest
+
+    def clear(self):
+        """Forget all hashes."""
+        with self._lock:
+            self._hashes.clear()
+
+    def __len__(self) -> int:
+        return len(self._hashes)
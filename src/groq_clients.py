@@ -0,0 +1,75 @@
+# groq_clients.py
+
+from groq import AsyncGroq, DefaultAsyncHttpxClient, DefaultHttpxClient
+from groq import Groq as GroqClient
+import weakref
+import functools
+import threading
+import asyncio
+import httpx
+
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+GROK_API_KEY = os.getenv("GROK_API_KEY")
+GROQ_POOL_SIZE = int(os.getenv("GROQ_POOL_SIZE", "20")) # max connections per client
+GROQ_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", "60"))
+# The base URL can be overridden with GROQ_BASE_URL (read by the Groq SDK itself)
+
+# Async clients are tied to the event loop their connections were opened on:
+# loop -> (client, async generator closing the client when the loop shuts down)
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, tuple]" = weakref.WeakKeyDictionary()
+_async_lock = threading.Lock()
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(max_connections=GROQ_POOL_SIZE, max_keepalive_connections=GROQ_POOL_SIZE)
+
+
+@functools.lru_cache(maxsize=None)
+def get_groq_client() -> GroqClient:
+    """Shared sync Groq client; its connection pool is reused across calls and threads."""
+    return GroqClient(
+        api_key=GROK_API_KEY,
+        timeout=GROQ_TIMEOUT,
+        max_retries=0,  # retried by the scheduler, which knows about the rate limits
+        http_client=DefaultHttpxClient(limits=_limits()),
+    )
+
+
+def _close_with_loop(loop: asyncio.AbstractEventLoop, client: AsyncGroq):
+    """
+    Close the client's connections when its loop shuts down. The loop finalizes the
+    async generators it has started in `shutdown_asyncgens()` (asyncio.run() does so
+    before closing the loop), which runs the generator's `finally`.
+    """
+    async def lifetime():
+        try:
+            yield
+        finally:
+            await client.close()
+
+    closer = lifetime()
+    loop.create_task(closer.__anext__())
+    return closer
+
+
+def get_async_groq_client() -> AsyncGroq:
+    """
+    Shared async Groq client for the running event loop. Async tools normally run on
+    the long-lived background loop, so its client and connections stay warm; clients
+    of shorter-lived loops are closed when their loop shuts down.
+    """
+    loop = asyncio.get_running_loop()
+    with _async_lock:
+        entry = _async_clients.get(loop)
+        if entry is None:
+            client = AsyncGroq(
+                api_key=GROK_API_KEY,
+                timeout=GROQ_TIMEOUT,
+                max_retries=0,
+                http_client=DefaultAsyncHttpxClient(limits=_limits()),
+            )
+            entry = _async_clients[loop] = (client, _close_with_loop(loop, client))
+    return entry[0]
@@ -0,0 +1,162 @@
+# image_cache.py
+
+from typing import Optional, Tuple
+from collections import OrderedDict
+import functools
+import threading
+import mimetypes
+import warnings
+import base64
+import io
+import os
+
+from dotenv import load_dotenv
+
+from src.file_hashes import FileHashes
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Images are then sent as-is
+    Image = None
+
+# Load env variables
+load_dotenv()
+VLM_MAX_SIDE = int(os.getenv("VLM_MAX_SIDE", "1568"))  # px, longest side sent to the VLM
+VLM_JPEG_QUALITY = int(os.getenv("VLM_JPEG_QUALITY", "85"))
+IMAGE_CACHE_SIZE = int(os.getenv("IMAGE_CACHE_SIZE", "32"))  # encoded payloads kept
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))  # VLM answers kept
+
+
+class ImageCache:
+    """
+    Prepares images for the VLM and remembers the work.
+    Images are downscaled to at most `max_side` pixels and re-encoded (JPEG, or PNG
+    when they have transparency) before being base64-encoded; the encoded payload
+    is cached by content hash, and answers are memoized by (image hash, question, model).
+    """
+
+    def __init__(
+        self,
+        max_side: int = VLM_MAX_SIDE,
+        quality: int = VLM_JPEG_QUALITY,
+        payload_size: int = IMAGE_CACHE_SIZE,
+        answer_size: int = ANSWER_CACHE_SIZE,
+    ):
+        """
+        Initialize the image cache.
+        Args:
+            max_side: Longest side in pixels of the image sent to the VLM
+            quality: JPEG quality used when re-encoding
+            payload_size: Max encoded payloads kept in memory
+            answer_size: Max memoized answers
+        """
+        self.max_side = max_side
+        self.quality = quality
+        self.payload_size = payload_size
+        self.answer_size = answer_size
+        self._hashes = FileHashes()
+        self._payloads: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+        self._answers: "OrderedDict[Tuple[str, str, str], str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {
+            "payload_hits": 0, "payload_misses": 0,
+            "answer_hits": 0, "answer_misses": 0,
+            "bytes_in": 0, "bytes_out": 0,
+        }
+
+    def file_hash(self, path: str) -> str:
+        """SHA-256 of a file, reused while its size and mtime don't change."""
+        return self._hashes.hash(path)
+
+    def _encode(self, path: str) -> Tuple[str, bytes]:
+        with open(path, "rb") as f:
+            data = f.read()
+        mime_type, _ = mimetypes.guess_type(path)
+        if Image is None:
+            if mime_type is None or not mime_type.startswith("image/"):
+                raise ValueError("Unsupported file type. Please provide a valid image.")
+            return mime_type, data
+
+        try:
+            image = Image.open(io.BytesIO(data))
+            image = ImageOps.exif_transpose(image)
+        except Exception:
+            raise ValueError("Unsupported file type. Please provide a valid image.")
+
+        resized = max(image.size) > self.max_side
+        if resized:
+            image.thumbnail((self.max_side, self.max_side), Image.Resampling.LANCZOS)
+
+        out = io.BytesIO()
+        has_alpha = image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+        if has_alpha:
+            # PNG can't store palette + alpha ("PA") as such
+            (image.convert("RGBA") if image.mode == "PA" else image).save(out, format="PNG", optimize=True)
+            encoded = ("image/png", out.getvalue())
+        else:
+            image.convert("RGB").save(out, format="JPEG", quality=self.quality, optimize=True)
+            encoded = ("image/jpeg", out.getvalue())
+
+        # A small image may already be smaller as it was
+        kept_as_is = mime_type in ("image/jpeg", "image/png", "image/webp")
+        if not resized and kept_as_is and len(data) <= len(encoded[1]):
+            return mime_type, data
+        return encoded
+
+    def payload(self, path: str) -> Tuple[str, str]:
+        """
+        Image ready to be sent to the VLM.
+        Args:
+            path: Path to the image file
+        Returns:
+            Tuple of (MIME type, base64-encoded image)
+        """
+        digest = self.file_hash(path)
+        with self._lock:
+            cached = self._payloads.get(digest)
+            if cached is not None:
+                self._payloads.move_to_end(digest)
+                self.stats["payload_hits"] += 1
+                return cached
+
+        mime_type, data = self._encode(path)
+        cached = (mime_type, base64.b64encode(data).decode("utf-8"))
+        with self._lock:
+            self.stats["payload_misses"] += 1
+            self.stats["bytes_in"] += os.path.getsize(path)
+            self.stats["bytes_out"] += len(data)
+            self._payloads[digest] = cached
+            while len(self._payloads) > self.payload_size:
+                self._payloads.popitem(last=False)
+        return cached
+
+    def answer_key(self, path: str, question: str, model: Optional[str]) -> Tuple[str, str, str]:
+        """Memo key of a question about an image."""
+        return (self.file_hash(path), question.strip(), model or "")
+
+    def get_answer(self, key: Tuple[str, str, str]) -> Optional[str]:
+        """Memoized answer for a key, or None."""
+        with self._lock:
+            answer = self._answers.get(key)
+            if answer is None:
+                self.stats["answer_misses"] += 1
+            else:
+                self._answers.move_to_end(key)
+                self.stats["answer_hits"] += 1
+            return answer
+
+    def set_answer(self, key: Tuple[str, str, str], answer: str):
+        """Memoize an answer."""
+        with self._lock:
+            self._answers[key] = answer
+            self._answers.move_to_end(key)
+            while len(self._answers) > self.answer_size:
+                self._answers.popitem(last=False)
+
+
+@functools.lru_cache(maxsize=None)
+def get_image_cache() -> ImageCache:
+    """Process-wide image cache, created on first use."""
+    if Image is None:
+        warnings.warn("[WARN] Pillow is not installed: images are sent to the VLM without resizing.")
+    return ImageCache()
@@ -0,0 +1,95 @@
+# inference.py
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import time
+
+from llama_index.core.agent.workflow import ToolCallResult, AgentStream
+
+from src.stream_parser import ExecuteStreamParser
+from src.tracing import Span, registry, span
+
+ttft_seconds = registry.histogram("agent_ttft_seconds", "Time to the first token of a turn")
+
+
+async def run_inference(
+    agent,
+    query: str,
+    ctx,
+    memory=None,
+    emit: Optional[Callable[[str, Any], None]] = None,
+) -> Tuple[List[Dict[str, str]], Dict[str, float]]:
+    """
+    Run one agent turn and split the response into text, code and tool chunks.
+    Args:
+        agent: DemoAgent to query
+        query: User query
+        ctx: Workflow context for this turn
+        memory: Optional ConversationMemory providing the history and recording the turn
+        emit: Optional callback receiving ("delta", ChunkEvent) for every streamed piece
+            of a text or code chunk and ("chunk", chunk) for every completed chunk
+            (including "image" chunks for figures the code rendered)
+    Returns:
+        Tuple of (response chunks, turn metrics with `ttft` and `total` in seconds)
+    """
+    emit = emit or (lambda kind, payload: None)
+    response_chunks = []
+    parser = ExecuteStreamParser()
+
+    start = time.perf_counter()
+    ttft = None
+
+    with span("turn", query_chars=len(query)) as turn:
+        # One span per LLM call: from the request until its code block (or answer) is complete
+        llm_call = Span("llm.call")
+
+        def publish(events):
+            for event in events:
+                if event.done:
+                    chunk = event.to_dict()
+                    response_chunks.append(chunk)
+                    emit("chunk", chunk)
+                    if event.type == "code":
+                        llm_call.end()
+                else:
+                    if "ttft" not in llm_call.attributes:
+                        llm_call.set(ttft=llm_call.elapsed())
+                    emit("delta", event)
+
+        # Figures left over from an interrupted turn aren't part of this one
+        agent.pop_figures()
+
+        # Run inference
+        chat_history = memory.window() if memory is not None else None
+        handler = agent(query, ctx, chat_history=chat_history)
+
+        async for event in handler.stream_events():
+            if isinstance(event, AgentStream):
+                if ttft is None and event.delta:
+                    ttft = time.perf_counter() - start
+                    ttft_seconds.observe(ttft)
+                publish(parser.feed(event.delta))
+
+            elif isinstance(event, ToolCallResult):
+                publish(parser.tool_result(str(event.tool_output)))
+                # Figures follow the output of the code that drew them
+                for figure in agent.pop_figures():
+                    chunk = {"type": "image", "content": figure["path"], "mime": figure["mime"]}
+                    response_chunks.append(chunk)
+                    emit("chunk", chunk)
+                llm_call = Span("llm.call")
+
+        publish(parser.close())
+        llm_call.end()
+
+        _ = await handler
+
+        # Keep only this turn's new messages
+        if memory is not None:
+            await memory.arecord_from_context(ctx, window_size=len(chat_history))
+
+        metrics = {"ttft": ttft, "total": time.perf_counter() - start}
+        agent.record_latency(metrics)
+        if agent.last_route is not None:
+            metrics["model"] = agent.last_route.model
+        turn.set(ttft=ttft, chunks=len(response_chunks))
+    return response_chunks, metrics
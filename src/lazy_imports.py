@@ -0,0 +1,38 @@
+# lazy_imports.py
+
+import importlib
+import types
+import sys
+
+
+class LazyModule(types.ModuleType):
+    """
+    Stand-in for a module that is only imported on first attribute access.
+    Once loaded, the real module's attributes are copied onto the proxy so later
+    lookups are plain attribute reads; anything added to the module afterwards
+    (e.g. submodules imported later) is still found through __getattr__.
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_lazy_loaded"] = False
+
+    def _load(self) -> types.ModuleType:
+        module = importlib.import_module(self.__name__)
+        if not self.__dict__["_lazy_loaded"]:
+            self.__dict__.update(module.__dict__)
+            self.__dict__["_lazy_loaded"] = True
+        return module
+
+    def __getattr__(self, attr: str):
+        # Only called for attributes missing from the proxy's __dict__
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def lazy_import(name: str) -> types.ModuleType:
+    """Return the module if it's already imported, else a proxy that imports it on first use."""
+    module = sys.modules.get(name)
+    return module if module is not None else LazyModule(name)
@@ -0,0 +1,292 @@
+# llm_cache.py
+
+from typing import Any, AsyncGenerator, Dict, Generator, List, Optional, Sequence
+from pathlib import Path
+import functools
+import threading
+import hashlib
+import logging
+import sqlite3
+import json
+import time
+import os
+
+from llama_index.core.base.llms.types import (
+    ChatMessage,
+    ChatResponse,
+    CompletionResponse,
+    LLMMetadata,
+    MessageRole,
+)
+from llama_index.core.llms import LLM
+from pydantic import ConfigDict, Field, PrivateAttr
+from dotenv import load_dotenv
+
+from src.async_runtime import run_in_thread
+from src.tracing import registry
+
+logger = logging.getLogger(__name__)
+
+# Load env variables
+load_dotenv()
+LLM_CACHE = os.getenv("LLM_CACHE", "0") == "1"  # opt-in
+LLM_CACHE_BYPASS = os.getenv("LLM_CACHE_BYPASS", "0") == "1"  # skip lookups, still store fresh responses
+LLM_CACHE_PATH = os.getenv(
+    "LLM_CACHE_PATH", str(Path.home() / ".cache" / "code-agent-demo" / "llm_responses.sqlite3")
+)
+LLM_CACHE_MB = float(os.getenv("LLM_CACHE_MB", "256"))
+
+REPLAY_CHARS = 16  # characters per delta when a stored response is replayed as a stream
+
+# Sampling settings of the wrapped LLM that change its output
+SAMPLING_FIELDS = ("temperature", "top_p", "top_k", "max_tokens", "presence_penalty", "frequency_penalty", "seed")
+
+cache_requests = registry.counter("llm_cache_requests_total", "LLM response cache lookups by result")
+
+
+class ResponseStore:
+    """
+    SQLite store of LLM responses, evicting the least recently used ones past a size limit.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, max_bytes: int = int(LLM_CACHE_MB * 2**20)):
+        """
+        Initialize the response store.
+        Args:
+            path: SQLite file (":memory:" for a throwaway store)
+            max_bytes: Max total size of the stored responses
+        """
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, response TEXT NOT NULL, bytes INTEGER NOT NULL,"
+            " created REAL NOT NULL, last_used REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._db.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                "UPDATE responses SET last_used = ?, hits = hits + 1 WHERE key = ?", (time.time(), key)
+            )
+            self._db.commit()
+            return row[0]
+
+    def put(self, key: str, response: str):
+        size = len(response.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, response, bytes, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, response, size, now, now),
+            )
+            total = self._db.execute("SELECT COALESCE(SUM(bytes), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                # Oldest first, until the store fits again
+                excess = total - self.max_bytes
+                freed = 0
+                for old_key, old_size in self._db.execute(
+                    "SELECT key, bytes FROM responses WHERE key != ? ORDER BY last_used", (key,)
+                ).fetchall():
+                    if freed >= excess:
+                        break
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (old_key,))
+                    freed += old_size
+            self._db.commit()
+
+    def size(self) -> int:
+        """Total bytes stored."""
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(bytes), 0) FROM responses").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+
+
+def cache_key(model: str, messages: Sequence[ChatMessage], params: Dict[str, Any]) -> str:
+    """
+    Key of a chat request: model, hash of the system prompt, the other messages and
+    the sampling parameters.
+    """
+    system = "\n".join(m.content or "" for m in messages if m.role == MessageRole.SYSTEM)
+    payload = {
+        "model": model,
+        "system": hashlib.sha256(system.encode("utf-8")).hexdigest(),
+        "messages": [(m.role.value, m.content or "") for m in messages if m.role != MessageRole.SYSTEM],
+        "params": params,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class CachingLLM(LLM):
+    """
+    Wraps an LLM with a local response cache.
+    Chat requests (plain and streaming, sync and async) are looked up by `cache_key`;
+    a stored response is replayed as a stream of small deltas, so callers see the
+    same events as with a live model. Misses go to the wrapped LLM and are stored
+    once the response is complete. With `bypass`, lookups are skipped but fresh
+    responses still refresh the store. The async paths access the (blocking) store
+    from a worker thread, off the event loop. Completion calls are passed through.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    llm: Any = Field(description="The wrapped LLM")
+    bypass: bool = Field(default=LLM_CACHE_BYPASS, description="Skip lookups (responses are still stored)")
+
+    _store: ResponseStore = PrivateAttr()
+    _stats: Dict[str, int] = PrivateAttr()
+    _stats_lock: Any = PrivateAttr()
+
+    def __init__(self, llm: LLM, store: Optional[ResponseStore] = None, **kwargs: Any):
+        super().__init__(llm=llm, **kwargs)
+        self._store = store or get_response_store()
+        self._stats = {"hits": 0, "misses": 0, "bypassed": 0}
+        self._stats_lock = threading.Lock()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachingLLM"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return self.llm.metadata
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """Lookups by result and the hit rate of the non-bypassed ones."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    # Cache plumbing
+
+    def _key(self, messages: Sequence[ChatMessage], kwargs: Dict[str, Any]) -> str:
+        # Sampling settings live on the innermost LLM (e.g. under a ScheduledLLM)
+        model = self.llm
+        while isinstance(getattr(model, "llm", None), LLM):
+            model = model.llm
+        params = {name: getattr(model, name) for name in SAMPLING_FIELDS if getattr(model, name, None) is not None}
+        params.update(getattr(model, "additional_kwargs", None) or {})
+        params.update(kwargs)
+        return cache_key(self.metadata.model_name, messages, params)
+
+    def _record(self, key: str, response: Optional[str]):
+        if self.bypass:
+            result = "bypassed"
+        else:
+            result = "hits" if response is not None else "misses"
+        with self._stats_lock:
+            self._stats[result] += 1
+        cache_requests.inc(result=result)
+        logger.debug("LLM cache %s for %s", result, key[:12])
+
+    def _lookup(self, key: str) -> Optional[str]:
+        response = None if self.bypass else self._store.get(key)
+        self._record(key, response)
+        return response
+
+    async def _alookup(self, key: str) -> Optional[str]:
+        response = None if self.bypass else await run_in_thread(self._store.get, key)
+        self._record(key, response)
+        return response
+
+    @staticmethod
+    def _response(text: str, delta: Optional[str] = None) -> ChatResponse:
+        return ChatResponse(message=ChatMessage(role=MessageRole.ASSISTANT, content=text), delta=delta)
+
+    @staticmethod
+    def _replay(text: str) -> Generator[ChatResponse, None, None]:
+        content = ""
+        for i in range(0, len(text), REPLAY_CHARS):
+            delta = text[i:i + REPLAY_CHARS]
+            content += delta
+            yield CachingLLM._response(content, delta)
+
+    # Chat
+
+    def chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        key = self._key(messages, kwargs)
+        cached = self._lookup(key)
+        if cached is not None:
+            return self._response(cached)
+        response = self.llm.chat(messages, **kwargs)
+        self._store.put(key, response.message.content or "")
+        return response
+
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        key = self._key(messages, kwargs)
+        cached = await self._alookup(key)
+        if cached is not None:
+            return self._response(cached)
+        response = await self.llm.achat(messages, **kwargs)
+        await run_in_thread(self._store.put, key, response.message.content or "")
+        return response
+
+    def stream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> Generator[ChatResponse, None, None]:
+        key = self._key(messages, kwargs)
+        cached = self._lookup(key)
+        if cached is not None:
+            return self._replay(cached)
+
+        def gen():
+            parts: List[str] = []
+            for response in self.llm.stream_chat(messages, **kwargs):
+                parts.append(response.delta or "")
+                yield response
+            # Only complete responses are stored
+            self._store.put(key, "".join(parts))
+
+        return gen()
+
+    async def astream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> AsyncGenerator[ChatResponse, None]:
+        key = self._key(messages, kwargs)
+        cached = await self._alookup(key)
+        if cached is not None:
+            async def replay():
+                for response in self._replay(cached):
+                    yield response
+            return replay()
+
+        stream = await self.llm.astream_chat(messages, **kwargs)
+
+        async def gen():
+            parts: List[str] = []
+            async for response in stream:
+                parts.append(response.delta or "")
+                yield response
+            await run_in_thread(self._store.put, key, "".join(parts))
+
+        return gen()
+
+    # Completion (not cached)
+
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        return self.llm.complete(prompt, formatted=formatted, **kwargs)
+
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        return await self.llm.acomplete(prompt, formatted=formatted, **kwargs)
+
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        return self.llm.stream_complete(prompt, formatted=formatted, **kwargs)
+
+    async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        return await self.llm.astream_complete(prompt, formatted=formatted, **kwargs)
+
+
+@functools.lru_cache(maxsize=None)
+def get_response_store() -> ResponseStore:
+    """Process-wide response store, opened on first use."""
+    return ResponseStore()
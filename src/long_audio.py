@@ -0,0 +1,341 @@
+# long_audio.py
+
+from typing import Awaitable, Callable, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+import contextvars
+import asyncio
+import threading
+import subprocess
+import hashlib
+import shutil
+import wave
+import re
+import io
+import os
+
+from dotenv import load_dotenv
+
+from src.async_runtime import run_in_thread
+from src.lazy_imports import lazy_import
+
+# Only needed once long audio is split
+np = lazy_import("numpy")
+
+# Load env variables
+load_dotenv()
+STT_SEGMENT_SECONDS = float(os.getenv("STT_SEGMENT_SECONDS", "300"))  # target segment length
+STT_OVERLAP_SECONDS = float(os.getenv("STT_OVERLAP_SECONDS", "2"))  # audio shared by neighbouring segments
+STT_SILENCE_SEARCH_SECONDS = float(os.getenv("STT_SILENCE_SEARCH_SECONDS", "15"))  # how far to look for a pause
+STT_MAX_WORKERS = int(os.getenv("STT_MAX_WORKERS", "4"))  # concurrent transcription requests
+STT_CACHE_SIZE = int(os.getenv("STT_CACHE_SIZE", "128"))  # transcripts kept
+STT_MAX_UPLOAD_MB = float(os.getenv("STT_MAX_UPLOAD_MB", "25"))  # largest file the STT API accepts
+
+WINDOW_SECONDS = 0.05  # RMS window used to find silence
+RMS_BLOCK_SECONDS = 30  # audio decoded to samples at a time when measuring loudness
+UPLOAD_HEADROOM = 0.98  # share of the upload limit a WAV segment's frames may fill (the rest covers headers)
+MAX_OVERLAP_WORDS = 40  # words compared when merging neighbouring transcripts
+
+# Transcribes one audio file given as (file name, bytes)
+TranscribeFn = Callable[[str, bytes], str]
+AsyncTranscribeFn = Callable[[str, bytes], Awaitable[str]]
+
+
+class AudioDecodeError(ValueError):
+    """Raised when audio too large to send whole can't be decoded for splitting."""
+
+
+def _words(text: str) -> List[str]:
+    return [re.sub(r"[^\w']", "", word).lower() for word in text.split()]
+
+
+def merge_overlap(left: str, right: str, max_words: int = MAX_OVERLAP_WORDS) -> str:
+    """
+    Join two transcripts whose audio overlaps, dropping the words repeated at the seam.
+    Args:
+        left: Transcript of the earlier segment
+        right: Transcript of the later segment
+        max_words: Max words of each side compared
+    Returns:
+        Merged transcript
+    """
+    if not left:
+        return right
+    if not right:
+        return left
+    tail = _words(left)[-max_words:]
+    right_words = right.split()
+    head = _words(" ".join(right_words[:max_words]))
+
+    # Longest suffix of `left` that is a prefix of `right`
+    for size in range(min(len(tail), len(head)), 0, -1):
+        if tail[-size:] == head[:size] and any(tail[-size:]):
+            right_words = right_words[size:]
+            break
+    return " ".join([left] + right_words) if right_words else left
+
+
+def _to_wav(data: bytes) -> Tuple[Optional[bytes], str]:
+    """Decode any format to 16 kHz mono WAV with ffmpeg. Returns (WAV, "") or (None, why not)."""
+    if shutil.which("ffmpeg") is None:
+        return None, "ffmpeg is not installed"
+    result = subprocess.run(
+        ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", "pipe:0",
+         "-ac", "1", "-ar", "16000", "-f", "wav", "pipe:1"],
+        input=data, capture_output=True,
+    )
+    if result.returncode != 0:
+        return None, f"ffmpeg could not decode it: {result.stderr.decode('utf-8', 'replace').strip()}"
+    return result.stdout, ""
+
+
+def _samples(raw: bytes, sampwidth: int, nchannels: int) -> "np.ndarray":
+    """Mono samples of raw PCM frames (8, 16, 24 or 32 bit)."""
+    if sampwidth == 3:
+        # Little-endian 24-bit, sign-extended to 32
+        bytes_ = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        values = bytes_[:, 0] | (bytes_[:, 1] << 8) | (bytes_[:, 2] << 16)
+        samples = np.where(values & 0x800000, values - (1 << 24), values)
+    else:
+        samples = np.frombuffer(raw, dtype={1: np.uint8, 2: np.int16, 4: np.int32}[sampwidth])
+    mono = samples.reshape(-1, nchannels).mean(axis=1)
+    return mono - 128 if sampwidth == 1 else mono
+
+
+def _rms(source: wave.Wave_read, window: int) -> Tuple["np.ndarray", int]:
+    """
+    Loudness of every `window` frames of a WAV, read a block at a time so that only
+    one block is ever held as samples. Returns (RMS per window, frames read).
+    """
+    params = source.getparams()
+    frame_bytes = params.sampwidth * params.nchannels
+    block = window * max(1, int(RMS_BLOCK_SECONDS * params.framerate) // window)
+    parts, frames = [], 0
+    source.rewind()
+    while True:
+        raw = source.readframes(block)
+        if not raw:
+            break
+        frames += len(raw) // frame_bytes
+        count = len(raw) // frame_bytes // window
+        if count:
+            mono = _samples(raw[:count * window * frame_bytes], params.sampwidth, params.nchannels)
+            windows = mono.astype(np.float32).reshape(count, window)
+            parts.append(np.sqrt(np.mean(windows ** 2, axis=1)))
+    rms = np.concatenate(parts) if parts else np.zeros(0, dtype=np.float32)
+    return rms, frames
+
+
+class LongAudioTranscriber:
+    """
+    Transcribes long recordings as overlapping segments, in parallel.
+    WAV audio longer than one segment is cut near the quietest point around each
+    segment boundary, every segment also covers `overlap` seconds of the next (segments
+    are shortened so that none is larger than the upload limit), and
+    segments are transcribed by a bounded thread pool; the transcripts are merged
+    by removing the words repeated across each overlap. Other formats are sent as
+    they are when they fit the upload limit; larger files are decoded with ffmpeg
+    to be split, and rejected with AudioDecodeError without it. Transcripts are
+    cached by audio hash.
+    """
+
+    def __init__(
+        self,
+        transcribe_fn: TranscribeFn,
+        atranscribe_fn: Optional[AsyncTranscribeFn] = None,
+        segment_seconds: float = STT_SEGMENT_SECONDS,
+        overlap_seconds: float = STT_OVERLAP_SECONDS,
+        search_seconds: float = STT_SILENCE_SEARCH_SECONDS,
+        max_workers: int = STT_MAX_WORKERS,
+        cache_size: int = STT_CACHE_SIZE,
+        max_upload_bytes: int = int(STT_MAX_UPLOAD_MB * 1024 * 1024),
+    ):
+        """
+        Initialize the transcriber.
+        Args:
+            transcribe_fn: Function transcribing one (file name, bytes) request
+            atranscribe_fn: Async version of `transcribe_fn`, used by `atranscribe`
+                (defaults to running `transcribe` in a thread)
+            segment_seconds: Target length of a segment
+            overlap_seconds: Audio shared by neighbouring segments
+            search_seconds: How far before a boundary to look for silence
+            max_workers: Max concurrent transcription requests
+            cache_size: Max transcripts kept in memory
+            max_upload_bytes: Largest file sent in one request
+        """
+        self.transcribe_fn = transcribe_fn
+        self.atranscribe_fn = atranscribe_fn
+        self.segment_seconds = segment_seconds
+        self.overlap_seconds = overlap_seconds
+        self.search_seconds = min(search_seconds, segment_seconds / 2)
+        self.max_workers = max_workers
+        self.cache_size = cache_size
+        self.max_upload_bytes = max_upload_bytes
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stt")
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "segments": 0}
+
+    def _cached(self, digest: str) -> Optional[str]:
+        with self._lock:
+            text = self._cache.get(digest)
+            if text is not None:
+                self._cache.move_to_end(digest)
+                self.stats["hits"] += 1
+            return text
+
+    def _store(self, digest: str, text: str):
+        with self._lock:
+            self.stats["misses"] += 1
+            self._cache[digest] = text
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _split(
+        self, rms: "np.ndarray", total: int, rate: int, window: int, segment_seconds: float
+    ) -> List[Tuple[int, int]]:
+        # Segment boundaries of `total` samples, given the loudness of each `window` samples
+        segment = int(segment_seconds * rate)
+        if total <= segment:
+            return [(0, total)]
+
+        overlap = int(self.overlap_seconds * rate)
+        search = int(min(self.search_seconds, segment_seconds / 2) * rate)
+        bounds = []
+        start = 0
+        while total - start > segment:
+            # Cut at the quietest window shortly before the target boundary (the latest one on ties)
+            lo = (start + segment - search) // window
+            hi = max(lo + 1, (start + segment) // window)
+            quietest = hi - 1 - int(np.argmin(rms[lo:hi][::-1]))
+            cut = quietest * window + window // 2
+            bounds.append((start, min(total, cut + overlap)))
+            start = max(cut - overlap, start + 1)
+        bounds.append((start, total))
+        return bounds
+
+    def _segment_seconds(self, rate: int, frame_bytes: int) -> float:
+        # Target length keeping every segment, overlap included, within the upload limit
+        fits = self.max_upload_bytes * UPLOAD_HEADROOM / (rate * frame_bytes) - self.overlap_seconds
+        if fits <= self.overlap_seconds:
+            raise ValueError(
+                f"The upload limit ({self.max_upload_bytes / 2**20:.1f} MB) is too small for segments "
+                f"of {rate} Hz audio with {self.overlap_seconds:g} s of overlap."
+            )
+        return min(self.segment_seconds, fits)
+
+    def _segments(self, data: bytes) -> Optional[List[bytes]]:
+        """
+        WAV segments of the audio, or None if it's not WAV but small enough to send as it is.
+        Raises:
+            AudioDecodeError: if it's not WAV, too large to send whole, and can't be decoded
+        """
+        try:
+            source = wave.open(io.BytesIO(data), "rb")
+        except (wave.Error, EOFError):
+            # Compressed audio that fits is sent as it is: as WAV, it would only be larger
+            if len(data) <= self.max_upload_bytes:
+                return None
+            wav, problem = _to_wav(data)
+            if wav is None:
+                raise AudioDecodeError(
+                    f"The audio ({len(data) / 2**20:.1f} MB) is larger than the "
+                    f"{self.max_upload_bytes / 2**20:.0f} MB upload limit and can't be split: {problem}. "
+                    "Install ffmpeg, or convert the recording to WAV."
+                )
+            data = wav
+            source = wave.open(io.BytesIO(data), "rb")
+
+        with source:
+            params = source.getparams()
+            segment_seconds = self._segment_seconds(params.framerate, params.sampwidth * params.nchannels)
+            if params.nframes <= segment_seconds * params.framerate:
+                return [data]
+
+            # The frames read, not the header's count: piped WAV output may not know its length
+            window = max(1, int(WINDOW_SECONDS * params.framerate))
+            rms, total = _rms(source, window)
+            segments = []
+            for start, end in self._split(rms, total, params.framerate, window, segment_seconds):
+                source.setpos(start)
+                out = io.BytesIO()
+                with wave.open(out, "wb") as sink:
+                    sink.setparams(params)
+                    sink.writeframes(source.readframes(end - start))
+                segments.append(out.getvalue())
+        return segments
+
+    def _requests(self, data: bytes, name: str) -> List[Tuple[str, bytes]]:
+        # (file name, bytes) of every transcription request the audio needs
+        segments = self._segments(data)
+        base = os.path.splitext(name)[0]
+        if segments is None:
+            return [(name, data)]
+        if len(segments) == 1:
+            # Audio decoded with ffmpeg is sent as the WAV it was decoded to
+            whole = segments[0]
+            return [(name if whole is data else f"{base}.wav", whole)]
+        return [(f"{base}.{i:03d}.wav", segment) for i, segment in enumerate(segments)]
+
+    def _prepare(self, data: bytes, name: str) -> Tuple[str, Optional[str], List[Tuple[str, bytes]]]:
+        # (audio hash, cached transcript, requests to send when not cached)
+        digest = hashlib.sha256(data).hexdigest()
+        cached = self._cached(digest)
+        if cached is not None:
+            return digest, cached, []
+        return digest, None, self._requests(data, name)
+
+    def _merge(self, digest: str, texts: List[str]) -> str:
+        if len(texts) > 1:
+            with self._lock:
+                self.stats["segments"] += len(texts)
+        text = ""
+        for part in texts:
+            text = merge_overlap(text, part.strip())
+        self._store(digest, text)
+        return text
+
+    def transcribe(self, data: bytes, name: str = "audio.wav") -> str:
+        """
+        Transcribe audio of any length.
+        Args:
+            data: Audio file content
+            name: File name, used for the format of audio sent whole
+        Returns:
+            The transcript
+        """
+        digest, cached, requests = self._prepare(data, name)
+        if cached is not None:
+            return cached
+
+        if len(requests) == 1:
+            texts = [self.transcribe_fn(*requests[0])]
+        else:
+            # Segments are sent in the caller's context (its request priority and trace)
+            futures = [
+                self._pool.submit(contextvars.copy_context().run, self.transcribe_fn, segment_name, segment)
+                for segment_name, segment in requests
+            ]
+            texts = [future.result() for future in futures]
+        return self._merge(digest, texts)
+
+    async def atranscribe(self, data: bytes, name: str = "audio.wav") -> str:
+        """
+        Async version of `transcribe`. Hashing and splitting run in a thread; the
+        requests are sent with `atranscribe_fn`, at most `max_workers` at a time.
+        """
+        if self.atranscribe_fn is None:
+            return await run_in_thread(self.transcribe, data, name)
+
+        digest, cached, requests = await run_in_thread(self._prepare, data, name)
+        if cached is not None:
+            return cached
+
+        limit = asyncio.Semaphore(self.max_workers)
+
+        async def send(segment_name: str, segment: bytes) -> str:
+            async with limit:
+                return await self.atranscribe_fn(segment_name, segment)
+
+        texts = await asyncio.gather(*(send(segment_name, segment) for segment_name, segment in requests))
+        return self._merge(digest, list(texts))
@@ -1,28 +1,64 @@
 # multimodal.py
 
-from groq import Groq as GroqClient
-
 from dotenv import load_dotenv
+import sys
 import os
 
+# Add the parent directory (project root) to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import functools
+import hashlib
+
+from src.groq_clients import get_async_groq_client, get_groq_client
+from src.long_audio import LongAudioTranscriber
+from src.scheduler import get_scheduler
+from src.tracing import span
+
 load_dotenv()
-GROK_API_KEY = os.getenv("GROK_API_KEY")
 STT = os.getenv("STT")
 
+def _transcribe(name: str, data: bytes) -> str:
+    # One transcription request (rate limited; the same audio in flight is sent once)
+    with span("stt.request", model=STT, bytes=len(data)):
+        return get_scheduler(STT).call(
+            lambda: get_groq_client().audio.transcriptions.create(
+                file=(name, data),
+                model=STT,
+                response_format="text",
+                temperature=0.1
+            ),
+            key=("stt", hashlib.sha256(data).hexdigest()),
+        )
+
+async def _atranscribe(name: str, data: bytes) -> str:
+    # Async version of `_transcribe`, on the event loop's pooled AsyncGroq client
+    with span("stt.request", model=STT, bytes=len(data)):
+        return await get_scheduler(STT).acall(
+            lambda: get_async_groq_client().audio.transcriptions.create(
+                file=(name, data),
+                model=STT,
+                response_format="text",
+                temperature=0.1
+            ),
+            key=("stt", hashlib.sha256(data).hexdigest()),
+        )
+
+@functools.lru_cache(maxsize=None)
+def get_transcriber() -> LongAudioTranscriber:
+    """Process-wide transcriber: long audio is split and transcribed in parallel, results are cached."""
+    return LongAudioTranscriber(_transcribe, _atranscribe)
+
 def stt(audio_file) -> str:
     """Converts speech from an audio file into text."""
+    audio_file.seek(0)
+    name = os.path.basename(getattr(audio_file, "name", "audio.wav"))
+    return get_transcriber().transcribe(audio_file.read(), name)
 
-	# Initialize the Groq client
-    client = GroqClient(api_key=GROK_API_KEY)
-    
-    # Create a transcription of the audio file
-    transcription = client.audio.transcriptions.create(
-        file=audio_file,
-        model=STT,
-        response_format="text",
-        temperature=0.1
-    )
-
-    return transcription.strip()
+async def stt_async(audio_file) -> str:
+    """Async version of `stt`."""
+    audio_file.seek(0)
+    name = os.path.basename(getattr(audio_file, "name", "audio.wav"))
+    return await get_transcriber().atranscribe(audio_file.read(), name)
 
-# TODO: def tts(message: str):
\ No newline at end of file
+# TODO: def tts(message: str):
@@ -0,0 +1,77 @@
+# prompt_builder.py
+
+from typing import Callable, Dict, List, Optional
+import threading
+
+
+def get_token_counter() -> Callable[[str], int]:
+    """Token counter based on LlamaIndex's global tokenizer, or ~4 chars per token."""
+    try:
+        from llama_index.core.utils import get_tokenizer
+        tokenizer = get_tokenizer()
+        return lambda text: len(tokenizer(text))
+    except Exception:
+        return lambda text: len(text) // 4
+
+
+class PromptBuilder:
+    """
+    Assembles a system prompt from named sections, in a fixed order.
+    Sections that never change go first so every turn sends the same prefix,
+    which lets the provider reuse its prompt cache; volatile sections (such as the
+    list of uploaded files) go last. The prompt is only re-rendered, and section
+    token counts only recomputed, when a section actually changes.
+    """
+
+    def __init__(self, order: List[str], token_counter: Optional[Callable[[str], int]] = None):
+        """
+        Initialize the prompt builder.
+        Args:
+            order: Section names, from most to least stable
+            token_counter: Callable returning the number of tokens in a string
+        """
+        self.order = list(order)
+        self._sections: Dict[str, str] = {name: "" for name in self.order}
+        self._tokens: Dict[str, int] = {name: 0 for name in self.order}
+        self._token_counter = token_counter
+        self._prompt: Optional[str] = None
+        self._lock = threading.Lock()
+
+        # Number of times the prompt was rendered; useful to confirm it's not rebuilt every turn
+        self.builds = 0
+
+    def _count(self, text: str) -> int:
+        if self._token_counter is None:
+            self._token_counter = get_token_counter()
+        return self._token_counter(text) if text else 0
+
+    def set(self, name: str, text: str) -> bool:
+        """
+        Set the content of a section.
+        Returns:
+            True if the content changed (and the prompt will be rebuilt)
+        """
+        if name not in self._sections:
+            raise KeyError(f"Unknown prompt section: {name}")
+        with self._lock:
+            if self._sections[name] == text:
+                return False
+            self._sections[name] = text
+            self._tokens[name] = self._count(text)
+            self._prompt = None
+            return True
+
+    def build(self) -> str:
+        """Return the assembled prompt, rendering it only if a section changed."""
+        with self._lock:
+            if self._prompt is None:
+                self._prompt = "\n".join(
+                    self._sections[name] for name in self.order if self._sections[name]
+                )
+                self.builds += 1
+            return self._prompt
+
+    def token_counts(self) -> Dict[str, int]:
+        """Token count of each section, in prompt order."""
+        with self._lock:
+            return {name: self._tokens[name] for name in self.order}
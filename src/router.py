@@ -0,0 +1,139 @@
+# router.py
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+import threading
+import logging
+import re
+import os
+
+from dotenv import load_dotenv
+
+from src.tracing import current_span, registry
+
+logger = logging.getLogger(__name__)
+
+# Load env variables
+load_dotenv()
+FAST_LLM = os.getenv("FAST_LLM")  # small model for light turns; unset = no routing
+ROUTER_MAX_FAST_CHARS = int(os.getenv("ROUTER_MAX_FAST_CHARS", "160"))  # longer queries go to the large model
+ROUTER_FILES_TO_LARGE = os.getenv("ROUTER_FILES_TO_LARGE", "1") == "1"  # turns with uploaded files go to the large model
+ROUTER_CODE_PATTERN = os.getenv(
+    "ROUTER_CODE_PATTERN",
+    r"\b(plot|chart|graph|histogram|calculat|comput|analy[sz]|statistic|average|mean|median|sum of|"
+    r"regress|forecast|simulat|csv|excel|parquet|dataframe|dataset|file|load|code|python|script|"
+    r"leasing|offer|categori[sz]e|zone|population|image|photo|picture|audio|recording|transcri)",
+)  # queries matching this likely need code execution or tools
+
+# Arithmetic in the query, e.g. "what is 17 * 23"
+ARITHMETIC = re.compile(r"\d\s*[-+*/^%]\s*\d")
+
+decision_total = registry.counter("router_decisions_total", "Routing decisions by model and reason")
+turn_seconds = registry.histogram("router_turn_seconds", "Turn latency by routed model")
+ttft_seconds = registry.histogram("router_ttft_seconds", "Time to first token by routed model")
+
+
+@dataclass
+class RouteDecision:
+    """The model chosen for a turn, why, and the features it was based on."""
+    model: str
+    fast: bool
+    reason: str
+    features: Dict[str, Any] = field(default_factory=dict)
+
+
+class ModelRouter:
+    """
+    Chooses between a small fast model and the large model for each turn.
+    Cheap features of the turn decide: queries that are long, come with uploaded
+    files, or look like they need code execution or tools go to the large model;
+    short conversational follow-ups go to the fast one. Every decision is logged,
+    and turn latencies are kept per model so the thresholds can be tuned.
+    """
+
+    def __init__(
+        self,
+        fast_llm: Any,
+        max_fast_chars: int = ROUTER_MAX_FAST_CHARS,
+        files_to_large: bool = ROUTER_FILES_TO_LARGE,
+        code_pattern: str = ROUTER_CODE_PATTERN,
+    ):
+        """
+        Initialize the router.
+        Args:
+            fast_llm: The small, fast model
+            max_fast_chars: Longest query sent to the fast model
+            files_to_large: Send turns with uploaded files to the large model
+            code_pattern: Regex (case-insensitive) of queries likely to need code execution
+        """
+        self.fast_llm = fast_llm
+        self.fast_model = fast_llm.metadata.model_name
+        self.max_fast_chars = max_fast_chars
+        self.files_to_large = files_to_large
+        self.code_pattern = re.compile(code_pattern, re.IGNORECASE)
+        self._lock = threading.Lock()
+        # model -> turns, total seconds, ttft seconds
+        self.latency: Dict[str, Dict[str, float]] = {}
+
+    def features(self, query: str, has_files: bool) -> Dict[str, Any]:
+        """The features a decision is based on."""
+        return {
+            "query_chars": len(query),
+            "has_files": has_files,
+            "code_likely": bool(self.code_pattern.search(query) or ARITHMETIC.search(query) or "```" in query),
+        }
+
+    def route(self, query: str, has_files: bool, large_model: str) -> RouteDecision:
+        """
+        Choose the model for a turn.
+        Args:
+            query: User query
+            has_files: Whether the user has uploaded files
+            large_model: Name of the large model (the agent's own)
+        Returns:
+            The RouteDecision
+        """
+        features = self.features(query, has_files)
+        if features["query_chars"] > self.max_fast_chars:
+            reason = "long_query"
+        elif has_files and self.files_to_large:
+            reason = "files"
+        elif features["code_likely"]:
+            reason = "code_likely"
+        else:
+            reason = "light_turn"
+        fast = reason == "light_turn"
+        decision = RouteDecision(model=self.fast_model if fast else large_model, fast=fast, reason=reason, features=features)
+
+        decision_total.inc(model=decision.model, reason=reason)
+        logger.info("Routed turn to %s (%s): %s", decision.model, reason, features)
+        span = current_span()
+        if span is not None:
+            span.set(model=decision.model, route_reason=reason)
+        return decision
+
+    def record(self, model: str, total: float, ttft: Optional[float] = None):
+        """Record the latency of a finished turn."""
+        turn_seconds.observe(total, model=model)
+        if ttft is not None:
+            ttft_seconds.observe(ttft, model=model)
+        with self._lock:
+            stats = self.latency.setdefault(model, {"turns": 0, "total_seconds": 0.0, "ttft_seconds": 0.0})
+            stats["turns"] += 1
+            stats["total_seconds"] += total
+            stats["ttft_seconds"] += ttft or 0.0
+            mean = stats["total_seconds"] / stats["turns"]
+        logger.info("Turn on %s took %.2fs (ttft %s, mean %.2fs)", model, total,
+                    f"{ttft:.2f}s" if ttft is not None else "n/a", mean)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Turns and mean latency per model."""
+        with self._lock:
+            return {
+                model: {
+                    "turns": stats["turns"],
+                    "mean_total": stats["total_seconds"] / stats["turns"],
+                    "mean_ttft": stats["ttft_seconds"] / stats["turns"],
+                }
+                for model, stats in self.latency.items()
+            }
@@ -0,0 +1,151 @@
+# scheduled_llm.py
+
+from typing import Any, AsyncGenerator, Generator, Optional, Sequence
+
+from llama_index.core.base.llms.types import ChatMessage, ChatResponse, CompletionResponse, LLMMetadata
+from llama_index.core.llms import LLM
+from pydantic import ConfigDict, Field
+
+from src.scheduler import CHARS_PER_TOKEN, RequestScheduler, estimate_tokens, get_scheduler
+
+
+def _usage(response: Any) -> Optional[int]:
+    # Total tokens reported by an OpenAI-compatible response, if any
+    usage = getattr(getattr(response, "raw", None), "usage", None)
+    if isinstance(usage, dict):
+        return usage.get("total_tokens")
+    return getattr(usage, "total_tokens", None)
+
+
+class ScheduledLLM(LLM):
+    """
+    Sends the requests of an LLM through its model's RequestScheduler.
+    Calls wait for the rate limits (at the priority of the calling context) and are
+    retried on transient errors; streams are retried only until their first delta, and
+    their token usage is settled from the streamed text. Identical non-streaming
+    requests in flight are sent once.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    llm: Any = Field(description="The wrapped LLM")
+
+    def __init__(self, llm: LLM, **kwargs: Any):
+        super().__init__(llm=llm, **kwargs)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ScheduledLLM"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return self.llm.metadata
+
+    @property
+    def scheduler(self) -> RequestScheduler:
+        return get_scheduler(self.metadata.model_name)
+
+    def _tokens(self, text_chars: int) -> int:
+        return estimate_tokens(text_chars, getattr(self.llm, "max_tokens", None))
+
+    @staticmethod
+    def _chars(messages: Sequence[ChatMessage]) -> int:
+        return sum(len(m.content or "") for m in messages)
+
+    @staticmethod
+    def _key(kind: str, payload: Any, kwargs: dict) -> tuple:
+        return (kind, repr(payload), repr(sorted(kwargs.items())))
+
+    # Chat
+
+    def chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        return self.scheduler.call(
+            lambda: self.llm.chat(messages, **kwargs),
+            tokens=self._tokens(self._chars(messages)),
+            key=self._key("chat", [(m.role.value, m.content) for m in messages], kwargs),
+            usage=_usage,
+        )
+
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        return await self.scheduler.acall(
+            lambda: self.llm.achat(messages, **kwargs),
+            tokens=self._tokens(self._chars(messages)),
+            key=self._key("chat", [(m.role.value, m.content) for m in messages], kwargs),
+            usage=_usage,
+        )
+
+    def stream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> Generator[ChatResponse, None, None]:
+        scheduler = self.scheduler
+        prompt_chars = self._chars(messages)
+        tokens = self._tokens(prompt_chars)
+
+        def start():
+            # Errors before the first delta are retried
+            stream = self.llm.stream_chat(messages, **kwargs)
+            return stream, next(stream, None)
+
+        stream, first = scheduler.call(start, tokens=tokens)
+
+        def gen():
+            chars = 0
+            if first is not None:
+                chars += len(first.delta or "")
+                yield first
+                for response in stream:
+                    chars += len(response.delta or "")
+                    yield response
+            scheduler.settle(tokens, estimate_tokens(prompt_chars, max(1, chars // CHARS_PER_TOKEN)))
+
+        return gen()
+
+    async def astream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> AsyncGenerator[ChatResponse, None]:
+        scheduler = self.scheduler
+        prompt_chars = self._chars(messages)
+        tokens = self._tokens(prompt_chars)
+
+        async def start():
+            stream = await self.llm.astream_chat(messages, **kwargs)
+            try:
+                return stream, await stream.__anext__()
+            except StopAsyncIteration:
+                return stream, None
+
+        stream, first = await scheduler.acall(start, tokens=tokens)
+
+        async def gen():
+            chars = 0
+            if first is not None:
+                chars += len(first.delta or "")
+                yield first
+                async for response in stream:
+                    chars += len(response.delta or "")
+                    yield response
+            scheduler.settle(tokens, estimate_tokens(prompt_chars, max(1, chars // CHARS_PER_TOKEN)))
+
+        return gen()
+
+    # Completion
+
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        return self.scheduler.call(
+            lambda: self.llm.complete(prompt, formatted=formatted, **kwargs),
+            tokens=self._tokens(len(prompt)),
+            key=self._key("complete", prompt, kwargs),
+            usage=_usage,
+        )
+
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        return await self.scheduler.acall(
+            lambda: self.llm.acomplete(prompt, formatted=formatted, **kwargs),
+            tokens=self._tokens(len(prompt)),
+            key=self._key("complete", prompt, kwargs),
+            usage=_usage,
+        )
+
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        self.scheduler.acquire(self._tokens(len(prompt)))
+        return self.llm.stream_complete(prompt, formatted=formatted, **kwargs)
+
+    async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        await self.scheduler.aacquire(self._tokens(len(prompt)))
+        return await self.llm.astream_complete(prompt, formatted=formatted, **kwargs)
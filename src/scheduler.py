@@ -0,0 +1,491 @@
+# scheduler.py
+
+from concurrent.futures import Future
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+import contextlib
+import contextvars
+import functools
+import threading
+import itertools
+import asyncio
+import logging
+import random
+import heapq
+import time
+import json
+import os
+
+from dotenv import load_dotenv
+
+from src.tracing import current_span, registry
+
+logger = logging.getLogger(__name__)
+
+# Load env variables
+load_dotenv()
+GROQ_RPM = int(os.getenv("GROQ_RPM", "0"))  # requests per minute and model; 0 = unlimited
+GROQ_TPM = int(os.getenv("GROQ_TPM", "0"))  # tokens per minute and model; 0 = unlimited
+GROQ_RATE_LIMITS = json.loads(os.getenv("GROQ_RATE_LIMITS", "{}"))  # per model, e.g. {"llama3-8b-8192": {"rpm": 30, "tpm": 6000}}
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "4"))
+GROQ_BACKOFF_SECONDS = float(os.getenv("GROQ_BACKOFF_SECONDS", "0.5"))  # first retry delay, doubled on each retry
+GROQ_MAX_BACKOFF_SECONDS = float(os.getenv("GROQ_MAX_BACKOFF_SECONDS", "30"))
+
+# Request priorities: lower values are served first
+INTERACTIVE, TOOL, BATCH = 0, 1, 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", TOOL: "tool", BATCH: "batch"}
+
+# Rough token estimate for rate limiting (the actual count is settled after the response)
+CHARS_PER_TOKEN = 4
+EXPECTED_COMPLETION_TOKENS = 512
+
+# HTTP statuses worth retrying: timeouts, conflicts, rate limits and server errors
+RETRY_STATUSES = (408, 409, 429)
+# Transport errors worth retrying (Groq/OpenAI SDK and httpx class names)
+RETRY_ERRORS = {"APIConnectionError", "APITimeoutError", "TimeoutException", "ConnectError", "RemoteProtocolError"}
+
+queue_depth = registry.gauge("groq_queue_depth", "Requests waiting for a rate limit slot")
+queue_wait_seconds = registry.histogram("groq_queue_wait_seconds", "Time requests waited for a rate limit slot")
+request_total = registry.counter("groq_requests_total", "Scheduled requests by outcome")
+retry_total = registry.counter("groq_retries_total", "Retried requests by reason")
+coalesced_total = registry.counter("groq_coalesced_total", "Requests served by an identical in-flight request")
+
+# Priority of the requests made in this context (thread or asyncio task)
+_priority: contextvars.ContextVar[int] = contextvars.ContextVar("request_priority", default=INTERACTIVE)
+
+
+@contextlib.contextmanager
+def request_priority(priority: int):
+    """Give the requests made inside the block a priority: `with request_priority(BATCH): ...`"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> int:
+    """Priority of the requests made in this context."""
+    return _priority.get()
+
+
+def estimate_tokens(text_chars: int, max_tokens: Optional[int] = None) -> int:
+    """Tokens a request is expected to use: its prompt plus the completion."""
+    return text_chars // CHARS_PER_TOKEN + (max_tokens or EXPECTED_COMPLETION_TOKENS)
+
+
+def _status(exc: BaseException) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Whether a failed request may succeed if sent again."""
+    status = _status(exc)
+    if status is not None:
+        return status in RETRY_STATUSES or status >= 500
+    return any(cls.__name__ in RETRY_ERRORS for cls in type(exc).__mro__)
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds to wait before retrying, as requested by the provider (retry-after headers)."""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Refills continuously up to `per_minute` units; 0 means no limit."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        if self.capacity:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available (a full bucket for requests larger than it)."""
+        if not self.capacity:
+            return 0.0
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+    def take(self, amount: float):
+        # May go below zero: the debt delays the following requests
+        if self.capacity:
+            self.level -= amount
+
+    def give_back(self, amount: float):
+        if self.capacity:
+            self.level = min(self.capacity, self.level + amount)
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "tokens", "wake", "granted", "cancelled")
+
+    def __init__(self, priority: int, seq: int, tokens: int, wake: Callable[[], None]):
+        self.priority = priority
+        self.seq = seq
+        self.tokens = tokens
+        self.wake = wake
+        self.granted = False
+        self.cancelled = False
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class RequestScheduler:
+    """
+    Admission control for the requests of one model (sync and async callers alike).
+    Requests wait in a priority queue until both token buckets, requests per minute
+    and tokens per minute, have room; interactive requests go before tool and batch
+    requests. Failed requests are retried with jittered exponential backoff, or after
+    the provider's retry-after delay, which also pauses the whole queue on a 429.
+    Identical requests in flight at the same time are sent once and share the result.
+    Limits are per process: with the process executor backend, each worker has its own.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rpm: int = GROQ_RPM,
+        tpm: int = GROQ_TPM,
+        max_retries: int = GROQ_MAX_RETRIES,
+        backoff: float = GROQ_BACKOFF_SECONDS,
+        max_backoff: float = GROQ_MAX_BACKOFF_SECONDS,
+    ):
+        """
+        Initialize the scheduler.
+        Args:
+            name: Model name (metrics label)
+            rpm: Requests per minute (0 for no limit)
+            tpm: Tokens per minute (0 for no limit)
+            max_retries: Retries of a failed request
+            backoff: Delay before the first retry, doubled on each retry (jittered)
+            max_backoff: Max delay between retries
+        """
+        self.name = name
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+
+        self._queue: List[_Waiter] = []
+        self._depth = {priority: 0 for priority in PRIORITY_NAMES}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._paused_until = 0.0
+        self._dispatcher: Optional[threading.Thread] = None
+        self._inflight: Dict[Hashable, Future] = {}
+        self.stats = {"requests": 0, "retries": 0, "coalesced": 0, "failures": 0, "wait_seconds": 0.0}
+
+    # Admission
+
+    def _wait_time(self, tokens: int, now: float) -> float:
+        self.requests.refill(now)
+        self.tokens.refill(now)
+        return max(self._paused_until - now, self.requests.wait_time(1), self.tokens.wait_time(tokens))
+
+    def _grant(self, tokens: int):
+        self.requests.take(1)
+        self.tokens.take(tokens)
+
+    def _set_depth(self, priority: int, change: int):
+        self._depth[priority] += change
+        queue_depth.set(self._depth[priority], model=self.name, priority=PRIORITY_NAMES[priority])
+
+    def _start_dispatcher(self):
+        # Called with the lock held
+        self._dispatcher = threading.Thread(target=self._dispatch, name=f"scheduler-{self.name}", daemon=True)
+        self._dispatcher.start()
+
+    def _dispatch(self):
+        # Grants the head of the queue as soon as the buckets allow
+        try:
+            with self._cond:
+                while True:
+                    while self._queue and self._queue[0].cancelled:
+                        heapq.heappop(self._queue)
+                    if not self._queue:
+                        self._cond.wait()
+                        continue
+                    head = self._queue[0]
+                    wait = self._wait_time(head.tokens, time.monotonic())
+                    if wait > 0:
+                        self._cond.wait(wait)  # also woken by new requests and settled tokens
+                        continue
+                    heapq.heappop(self._queue)
+                    self._grant(head.tokens)
+                    head.granted = True
+                    self._set_depth(head.priority, -1)
+                    try:
+                        head.wake()
+                    except Exception as e:
+                        # e.g. the waiter's event loop was closed: nobody will use the grant
+                        logger.warning("Dropped a %s request that could not be woken: %s", self.name, e)
+                        self.requests.give_back(1)
+                        self.tokens.give_back(head.tokens)
+        finally:
+            # A dispatcher that died is replaced, so queued requests don't wait forever
+            with self._cond:
+                if self._dispatcher is threading.current_thread():
+                    self._dispatcher = None
+                    if self._queue:
+                        self._start_dispatcher()
+
+    def _enqueue(self, tokens: int, priority: int, wake: Callable[[], None]) -> Optional[_Waiter]:
+        with self._cond:
+            # Fast path: nothing queued and room in the buckets
+            if not self._queue and self._wait_time(tokens, time.monotonic()) <= 0:
+                self._grant(tokens)
+                return None
+            if self._dispatcher is None:
+                self._start_dispatcher()
+            waiter = _Waiter(priority, next(self._seq), tokens, wake)
+            heapq.heappush(self._queue, waiter)
+            self._set_depth(priority, 1)
+            self._cond.notify()
+            return waiter
+
+    def _waited(self, start: float, priority: int) -> float:
+        waited = time.monotonic() - start
+        queue_wait_seconds.observe(waited, model=self.name, priority=PRIORITY_NAMES[priority])
+        with self._cond:
+            self.stats["wait_seconds"] += waited
+        span = current_span()
+        if span is not None:
+            span.set(queue_wait=span.attributes.get("queue_wait", 0.0) + waited)
+        return waited
+
+    def acquire(self, tokens: int = 0, priority: Optional[int] = None) -> float:
+        """
+        Block until the request may be sent.
+        Args:
+            tokens: Tokens the request is expected to use
+            priority: INTERACTIVE, TOOL or BATCH (defaults to the context's priority)
+        Returns:
+            Seconds waited
+        """
+        priority = current_priority() if priority is None else priority
+        start = time.monotonic()
+        granted = threading.Event()
+        if self._enqueue(tokens, priority, granted.set) is not None:
+            granted.wait()
+        return self._waited(start, priority)
+
+    async def aacquire(self, tokens: int = 0, priority: Optional[int] = None) -> float:
+        """Async version of `acquire`."""
+        priority = current_priority() if priority is None else priority
+        start = time.monotonic()
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+        waiter = self._enqueue(tokens, priority, wake)
+        if waiter is not None:
+            try:
+                await granted
+            except asyncio.CancelledError:
+                with self._cond:
+                    if not waiter.granted and not waiter.cancelled:
+                        waiter.cancelled = True
+                        self._set_depth(priority, -1)
+                raise
+        return self._waited(start, priority)
+
+    def settle(self, estimated: int, actual: Optional[int]):
+        """Correct the tokens taken for a request once its actual usage is known."""
+        if actual is None or actual == estimated:
+            return
+        with self._cond:
+            if actual < estimated:
+                self.tokens.give_back(estimated - actual)
+            else:
+                self.tokens.take(actual - estimated)
+            self._cond.notify()
+
+    def pause(self, seconds: float):
+        """Hold every queued request for `seconds` (the provider reported a rate limit)."""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._cond.notify()
+
+    def queue_depth(self) -> Dict[str, int]:
+        """Requests waiting, by priority."""
+        with self._cond:
+            return {PRIORITY_NAMES[priority]: depth for priority, depth in self._depth.items()}
+
+    # Retries
+
+    def _retry_delay(self, exc: BaseException, attempt: int) -> Optional[float]:
+        # None when the request shouldn't be retried
+        if attempt >= self.max_retries or not is_retryable(exc):
+            return None
+        status = _status(exc)
+        after = retry_after(exc)
+        if after is not None:
+            delay = after + random.uniform(0, min(1.0, 0.1 * after + 0.05))
+        else:
+            cap = min(self.max_backoff, self.backoff * 2 ** attempt)
+            delay = cap / 2 + random.uniform(0, cap / 2)
+        if status == 429:
+            self.pause(delay)
+        reason = str(status) if status is not None else type(exc).__name__
+        retry_total.inc(model=self.name, reason=reason)
+        with self._cond:
+            self.stats["retries"] += 1
+        return delay
+
+    def _finish(self, outcome: str):
+        request_total.inc(model=self.name, outcome=outcome)
+        with self._cond:
+            self.stats["requests"] += 1
+            if outcome == "error":
+                self.stats["failures"] += 1
+
+    def _send(self, fn: Callable[[], Any], tokens: int, priority: Optional[int], usage) -> Any:
+        for attempt in itertools.count():
+            self.acquire(tokens, priority)
+            try:
+                result = fn()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    self._finish("error")
+                    raise
+                time.sleep(delay)
+                continue
+            if usage is not None:
+                self.settle(tokens, usage(result))
+            self._finish("ok")
+            return result
+
+    async def _asend(self, fn: Callable[[], Awaitable], tokens: int, priority: Optional[int], usage) -> Any:
+        for attempt in itertools.count():
+            await self.aacquire(tokens, priority)
+            try:
+                result = await fn()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    self._finish("error")
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            if usage is not None:
+                self.settle(tokens, usage(result))
+            self._finish("ok")
+            return result
+
+    # Coalescing
+
+    def _join(self, key: Optional[Hashable]):
+        # (future, leader): the leader sends the request, the others wait for its result
+        if key is None:
+            return None, True
+        with self._cond:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.stats["coalesced"] += 1
+                coalesced_total.inc(model=self.name)
+                return future, False
+            future = self._inflight[key] = Future()
+            return future, True
+
+    def _done(self, key: Hashable, future: Future, result: Any = None, exc: Optional[BaseException] = None):
+        with self._cond:
+            self._inflight.pop(key, None)
+        if future.done():
+            return
+        if exc is not None:
+            future.set_exception(exc)
+        else:
+            future.set_result(result)
+
+    def call(
+        self,
+        fn: Callable[[], Any],
+        tokens: int = 0,
+        priority: Optional[int] = None,
+        key: Optional[Hashable] = None,
+        usage: Optional[Callable[[Any], Optional[int]]] = None,
+    ) -> Any:
+        """
+        Send a request when the limits allow, retrying transient failures.
+        Args:
+            fn: Sends the request and returns its result
+            tokens: Tokens the request is expected to use
+            priority: INTERACTIVE, TOOL or BATCH (defaults to the context's priority)
+            key: Identifies the request; identical requests in flight share one call
+            usage: Returns the tokens actually used, from the result
+        Returns:
+            The result of `fn`
+        """
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+        try:
+            result = self._send(fn, tokens, priority, usage)
+        except BaseException as e:
+            if future is not None:
+                self._done(key, future, exc=e)
+            raise
+        if future is not None:
+            self._done(key, future, result)
+        return result
+
+    async def acall(
+        self,
+        fn: Callable[[], Awaitable],
+        tokens: int = 0,
+        priority: Optional[int] = None,
+        key: Optional[Hashable] = None,
+        usage: Optional[Callable[[Any], Optional[int]]] = None,
+    ) -> Any:
+        """Async version of `call`: `fn` returns an awaitable."""
+        future, leader = self._join(key)
+        if not leader:
+            # Shielded: a cancelled follower must not cancel the result shared with the others
+            return await asyncio.shield(asyncio.wrap_future(future))
+        try:
+            result = await self._asend(fn, tokens, priority, usage)
+        except BaseException as e:
+            if future is not None:
+                self._done(key, future, exc=e)
+            raise
+        if future is not None:
+            self._done(key, future, result)
+        return result
+
+
+@functools.lru_cache(maxsize=None)
+def get_scheduler(model: Optional[str]) -> RequestScheduler:
+    """Process-wide scheduler of a model (limits from GROQ_RATE_LIMITS, else GROQ_RPM/GROQ_TPM)."""
+    limits = GROQ_RATE_LIMITS.get(model or "", {})
+    return RequestScheduler(
+        model or "default",
+        rpm=limits.get("rpm", GROQ_RPM),
+        tpm=limits.get("tpm", GROQ_TPM),
+    )
@@ -0,0 +1,305 @@
+# spillable_namespace.py
+
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import collections
+import tempfile
+import weakref
+import pickle
+import shutil
+import types
+import sys
+import os
+
+from dotenv import load_dotenv
+
+# Load env variables
+load_dotenv()
+EXECUTOR_MEMORY_BUDGET_MB = float(os.getenv("EXECUTOR_MEMORY_BUDGET_MB", "1024"))  # per session; 0 = unlimited
+EXECUTOR_SPILL_MIN_MB = float(os.getenv("EXECUTOR_SPILL_MIN_MB", "16"))  # smaller objects stay in memory
+EXECUTOR_SPILL_DIR = os.getenv("EXECUTOR_SPILL_DIR", tempfile.gettempdir())
+
+
+def estimate_size(value: Any) -> int:
+    """
+    Approximate memory held by a value, in bytes.
+    DataFrames/Series and arrays report their own buffers; containers add the
+    shallow size of their items. Modules, functions and classes count as 0.
+    """
+    if isinstance(value, (types.ModuleType, types.FunctionType, types.BuiltinFunctionType, type)):
+        return 0
+    memory_usage = getattr(value, "memory_usage", None)
+    if callable(memory_usage):
+        try:
+            usage = memory_usage(deep=True)
+            return int(usage.sum() if hasattr(usage, "sum") else usage)
+        except Exception:
+            pass
+    nbytes = getattr(value, "nbytes", None)
+    if isinstance(nbytes, int):
+        return nbytes
+    size = sys.getsizeof(value, 0)
+    if isinstance(value, dict):
+        size += sum(sys.getsizeof(k, 0) + sys.getsizeof(v, 0) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(sys.getsizeof(item, 0) for item in value)
+    return size
+
+
+def code_names(code: types.CodeType) -> Set[str]:
+    """Names a code object (and the functions/comprehensions it defines) may read or assign."""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= code_names(const)
+    return names
+
+
+def _fingerprint(value: Any) -> Any:
+    # Cheap stand-in for in-place changes to an object whose size is cached
+    shape = getattr(value, "shape", None)
+    if shape is not None:
+        return shape
+    if isinstance(value, (list, tuple, dict, set, frozenset, str, bytes, bytearray)):
+        return len(value)
+    return None
+
+
+def _spill_kind(value: Any) -> Optional[str]:
+    # Only the types that can be written efficiently are spilled. Frames are pickled:
+    # a Parquet round-trip can change dtypes (object columns of ints), column names and the index
+    pd = sys.modules.get("pandas")
+    np = sys.modules.get("numpy")
+    if pd is not None and isinstance(value, pd.DataFrame):
+        return "pickle"
+    if np is not None and isinstance(value, np.ndarray) and not value.dtype.hasobject:
+        return "npy"
+    return None
+
+
+class SpillableNamespace(dict):
+    """
+    Executor locals with a memory budget.
+    The size of every object is measured once and cached by identity (re-measured if its
+    shape or length changes); an object bound to several names counts once. When the
+    total exceeds the budget, the least recently used large DataFrames and arrays are
+    written to disk (pickle for frames, `np.save` for arrays) and dropped from memory.
+    Objects bound to more than one name stay in memory, so aliases keep sharing them.
+    A spilled variable is reloaded transparently the next time code reads it (arrays
+    memory-mapped, copy-on-write).
+    """
+
+    def __init__(
+        self,
+        data: Iterable = (),
+        budget_mb: float = EXECUTOR_MEMORY_BUDGET_MB,
+        min_spill_mb: float = EXECUTOR_SPILL_MIN_MB,
+        spill_dir: str = EXECUTOR_SPILL_DIR,
+    ):
+        """
+        Initialize the namespace.
+        Args:
+            data: Initial variables
+            budget_mb: Memory budget for the variables, in MB (0 for no limit)
+            min_spill_mb: Objects smaller than this are never spilled
+            spill_dir: Directory under which the session's spill folder is created
+        """
+        super().__init__(data)
+        self.budget_bytes = int(budget_mb * 2**20)
+        self.min_spill_bytes = int(min_spill_mb * 2**20)
+        self.spill_dir = spill_dir
+        self._folder: Optional[str] = None
+        self._cleanup = None
+
+        # name -> (path, kind, size)
+        self._spilled: Dict[str, Tuple[str, str, int]] = {}
+        # name -> (id of the measured object, size)
+        self._sizes: Dict[str, Tuple[int, int]] = {}
+        # id of a live object -> (fingerprint when measured, size)
+        self._measured: Dict[int, Tuple[Any, int]] = {}
+        # name -> execution count when last used
+        self._last_used: Dict[str, int] = {}
+        self._clock = 0
+        self.stats = {"spills": 0, "reloads": 0, "bytes_spilled": 0}
+
+    # Mapping protocol: spilled names behave as if they were still here
+
+    def __missing__(self, name: str) -> Any:
+        if name in self._spilled:
+            return self._reload(name)
+        raise KeyError(name)
+
+    def __setitem__(self, name: str, value: Any):
+        if name in self._spilled:
+            self._discard(name)
+        super().__setitem__(name, value)
+
+    def __delitem__(self, name: str):
+        if name in self._spilled:
+            self._discard(name)
+            self._sizes.pop(name, None)
+            return
+        super().__delitem__(name)
+        self._sizes.pop(name, None)
+
+    def get(self, name: str, default: Any = None) -> Any:
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    # Budget
+
+    def touch(self, names: Iterable[str]):
+        """Mark names used by the code about to run (call once per execution)."""
+        self._clock += 1
+        for name in names:
+            if super().__contains__(name) or name in self._spilled:
+                self._last_used[name] = self._clock
+
+    def _measure(self) -> Dict[str, Tuple[int, int]]:
+        sizes, measured = {}, {}
+        for name, value in list(self.items()):
+            key = id(value)
+            if key not in measured:
+                fingerprint = _fingerprint(value)
+                cached = self._measured.get(key)
+                if cached is None or cached[0] != fingerprint:
+                    cached = (fingerprint, estimate_size(value))
+                measured[key] = cached
+            sizes[name] = (key, measured[key][1])
+        # Only live objects are kept, so a recycled id is never matched with a stale size
+        self._measured = measured
+        self._sizes = sizes
+        return sizes
+
+    def enforce_budget(self, used: Iterable[str] = ()) -> List[str]:
+        """
+        Spill the coldest large objects until the namespace fits its budget.
+        Args:
+            used: Names used by the last execution (not spilled)
+        Returns:
+            Names spilled
+        """
+        used = set(used)
+        for name in used:  # Includes names the execution just created
+            if dict.__contains__(self, name):
+                self._last_used[name] = self._clock
+        sizes = self._measure()
+        if not self.budget_bytes:
+            return []
+        total = sum(size for _, size in self._measured.values())
+        if total <= self.budget_bytes:
+            return []
+
+        names_per_object = collections.Counter(key for key, _ in sizes.values())
+        candidates = sorted(
+            (
+                name for name, (key, size) in sizes.items()
+                if size >= self.min_spill_bytes and name not in used and names_per_object[key] == 1
+                and _spill_kind(dict.__getitem__(self, name)) is not None
+            ),
+            # Coldest first; among equally cold objects, the largest first
+            key=lambda name: (self._last_used.get(name, 0), -sizes[name][1]),
+        )
+        spilled = []
+        for name in candidates:
+            if total <= self.budget_bytes:
+                break
+            key, size = sizes[name]
+            if self._spill(name, size):
+                self._measured.pop(key, None)
+                total -= size
+                spilled.append(name)
+        return spilled
+
+    def _path(self, name: str, suffix: str) -> str:
+        if self._folder is None:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            self._folder = tempfile.mkdtemp(prefix="executor-spill-", dir=self.spill_dir)
+            self._cleanup = weakref.finalize(self, shutil.rmtree, self._folder, True)
+        # A fresh file per spill: an earlier file of the same name may still be memory-mapped
+        return os.path.join(self._folder, f"{name}.{self.stats['spills']}{suffix}")
+
+    def _spill(self, name: str, size: int) -> bool:
+        value = dict.__getitem__(self, name)
+        kind = _spill_kind(value)
+        try:
+            if kind == "pickle":
+                path = self._path(name, ".pkl")
+                with open(path, "wb") as f:
+                    pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            else:
+                path = self._path(name, ".npy")
+                sys.modules["numpy"].save(path, value, allow_pickle=False)
+        except Exception:
+            return False
+
+        super().__delitem__(name)
+        self._sizes.pop(name, None)
+        self._spilled[name] = (path, kind, size)
+        self.stats["spills"] += 1
+        self.stats["bytes_spilled"] += size
+        return True
+
+    def _reload(self, name: str) -> Any:
+        path, kind, _ = self._spilled.pop(name)
+        if kind == "npy":
+            # Copy-on-write mapping: pages are read on demand, changes stay in memory
+            value = sys.modules["numpy"].load(path, mmap_mode="c")
+        else:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        try:
+            os.remove(path)  # A memory-mapped file stays readable until it's unmapped
+        except OSError:
+            pass
+        super().__setitem__(name, value)
+        self._last_used[name] = self._clock
+        self.stats["reloads"] += 1
+        return value
+
+    def _discard(self, name: str):
+        path, _, _ = self._spilled.pop(name)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    # Inspection
+
+    def heaviest(self, n: int = 10) -> List[Dict[str, Any]]:
+        """
+        The largest variables, in memory or spilled (modules and functions are left out).
+        Args:
+            n: Max number of variables listed
+        Returns:
+            Dicts with `name`, `type`, `bytes`, `spilled` and `idle` (executions since last use)
+        """
+        rows = [
+            {"name": name, "type": type(dict.get(self, name)).__name__, "bytes": size, "spilled": False}
+            for name, (_, size) in list(self._sizes.items())
+            if size and dict.__contains__(self, name)
+        ]
+        rows += [
+            {"name": name, "type": "DataFrame" if kind != "npy" else "ndarray", "bytes": size, "spilled": True}
+            for name, (_, kind, size) in list(self._spilled.items())
+        ]
+        for row in rows:
+            row["idle"] = self._clock - self._last_used.get(row["name"], 0)
+        return sorted(rows, key=lambda row: row["bytes"], reverse=True)[:n]
+
+    def usage(self) -> Dict[str, int]:
+        """Bytes held in memory and on disk, the budget, and spill/reload counts."""
+        return {
+            "in_memory_bytes": sum(size for _, size in list(self._measured.values())),
+            "spilled_bytes": sum(size for _, _, size in list(self._spilled.values())),
+            "budget_bytes": self.budget_bytes,
+            **self.stats,
+        }
+
+    def close(self):
+        """Delete the spill files."""
+        for name in list(self._spilled):
+            self._discard(name)
+        if self._cleanup is not None:
+            self._cleanup()
@@ -0,0 +1,110 @@
+# stream_parser.py
+
+from dataclasses import dataclass
+from typing import List
+
+OPEN_TAG = "<execute>"
+CLOSE_TAG = "</execute>"
+
+
+@dataclass
+class ChunkEvent:
+    """
+    A piece of an agent response.
+    `type` is "text", "code" or "tool". Events with `done=False` carry the next
+    raw piece of a chunk still being streamed; the `done=True` event carries the
+    whole chunk, stripped, once it's complete.
+    """
+    type: str
+    content: str
+    done: bool = False
+
+    def to_dict(self) -> dict:
+        return {"type": self.type, "content": self.content}
+
+
+class ExecuteStreamParser:
+    """
+    Incremental parser splitting streamed LLM output into text and <execute> code chunks.
+    Each delta is scanned once: only the few characters that may start a tag split
+    across deltas are carried over to the next one, and a chunk's pieces are joined
+    a single time when it completes, so the work per delta is proportional to its size.
+    """
+
+    def __init__(self):
+        self.state = "text"
+        self._parts: List[str] = []
+        self._pending = ""
+
+    @property
+    def _tag(self) -> str:
+        return OPEN_TAG if self.state == "text" else CLOSE_TAG
+
+    def _piece(self, events: List[ChunkEvent], piece: str):
+        if piece:
+            self._parts.append(piece)
+            events.append(ChunkEvent(self.state, piece))
+
+    def _finish(self, events: List[ChunkEvent]):
+        content = "".join(self._parts).strip()
+        self._parts = []
+        # Blank text between blocks is dropped; code blocks are kept even if empty
+        if content or self.state == "code":
+            events.append(ChunkEvent(self.state, content, done=True))
+
+    def feed(self, delta: str) -> List[ChunkEvent]:
+        """
+        Consume the next delta of the stream.
+        Args:
+            delta: Newly streamed text
+        Returns:
+            Events produced by this delta, in order
+        """
+        events: List[ChunkEvent] = []
+        data = self._pending + delta
+        self._pending = ""
+        start = 0
+
+        while True:
+            tag = self._tag
+            index = data.find(tag, start)
+            if index < 0:
+                break
+            self._piece(events, data[start:index])
+            self._finish(events)
+            self.state = "code" if self.state == "text" else "text"
+            start = index + len(tag)
+
+        # Hold back a suffix that could be the start of the next tag
+        tag = self._tag
+        end = len(data)
+        lt = data.find("<", max(start, end - len(tag) + 1))
+        while lt >= 0:
+            if tag.startswith(data[lt:]):
+                end = lt
+                break
+            lt = data.find("<", lt + 1)
+        self._piece(events, data[start:end])
+        self._pending = data[end:]
+        return events
+
+    def tool_result(self, output: str) -> List[ChunkEvent]:
+        """
+        Close the current chunk and add the output of an executed code block.
+        Args:
+            output: Tool output text
+        Returns:
+            Events produced, ending with the tool chunk
+        """
+        events = self.close()
+        events.append(ChunkEvent("tool", output.strip(), done=True))
+        return events
+
+    def close(self) -> List[ChunkEvent]:
+        """Flush whatever is buffered as a completed chunk; the parser is reset to text."""
+        events: List[ChunkEvent] = []
+        self._piece(events, self._pending)
+        self._pending = ""
+        self._finish(events)
+        self.state = "text"
+        return events
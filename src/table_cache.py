@@ -0,0 +1,267 @@
+# table_cache.py
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from collections import OrderedDict
+import functools
+import threading
+import os
+
+from dotenv import load_dotenv
+
+from src.file_hashes import FileHashes
+from src.lazy_imports import lazy_import
+from src.spillable_namespace import estimate_size
+
+# Only imported once a table is read
+pd = lazy_import("pandas")
+
+# Load env variables
+load_dotenv()
+TABLE_CACHE_MB = float(os.getenv("TABLE_CACHE_MB", "512"))  # parsed frames kept, shared by all sessions
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", "200000"))  # rows per chunk when pyarrow isn't available
+
+CHUNK_SIZE = 1024 * 1024
+PREVIEW_ROWS = 5
+SNIFF_ROWS = 1000  # rows read to infer CSV dtypes in a preview
+CATEGORY_RATIO = 0.5  # text columns with fewer distinct values than this share become categories
+MAX_PREVIEWS = 256  # previews kept
+
+CacheKey = Tuple[str, Optional[Tuple[str, ...]], Optional[str], bool]
+
+
+def _format(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".parquet", ".pq"):
+        return "parquet"
+    if ext in (".xlsx", ".xlsm", ".xls"):
+        return "excel"
+    if ext in (".csv", ".tsv", ".txt"):
+        return "csv"
+    raise ValueError(f"Unsupported table format '{ext}'. Use CSV, Parquet or Excel files.")
+
+
+def _has_pyarrow() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def shrink_dtypes(df: "pd.DataFrame") -> "pd.DataFrame":
+    """
+    Infer compact dtypes in place: integers are downcast and repetitive text
+    columns become categoricals. Values are kept, but the frame behaves differently:
+    arithmetic on a downcast column can overflow, and a categorical column rejects
+    values that aren't among its categories.
+    """
+    for name in df.columns:
+        column = df[name]
+        if pd.api.types.is_integer_dtype(column) and not isinstance(column.dtype, pd.CategoricalDtype):
+            df[name] = pd.to_numeric(column, downcast="integer")
+        elif pd.api.types.is_object_dtype(column) or pd.api.types.is_string_dtype(column):
+            # A sample rules out mostly-unique columns before counting the whole column
+            sample = column.iloc[:SNIFF_ROWS * 10]
+            if len(sample) and sample.nunique(dropna=True) >= CATEGORY_RATIO * len(sample):
+                continue
+            if len(column) and column.nunique(dropna=True) < CATEGORY_RATIO * len(column):
+                df[name] = column.astype("category")
+    return df
+
+
+def _remember(cache: "OrderedDict", key: Any, value: Any, limit: int):
+    # Least recently used entries are dropped past `limit`
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > limit:
+        cache.popitem(last=False)
+
+
+def _copy(df: "pd.DataFrame") -> "pd.DataFrame":
+    # Cached frames are shared: hand out copies (cheap with copy-on-write, pandas >= 3)
+    copy_on_write = int(pd.__version__.split(".")[0]) >= 3 or pd.options.mode.copy_on_write is True
+    return df.copy(deep=not copy_on_write)
+
+
+class TableCache:
+    """
+    Loads tabular files (CSV, Parquet, Excel) once and shares the parsed frames.
+    Frames are keyed by (file hash, columns, sheet, compact) in a size-bounded LRU; a column
+    subset is cut from a cached full frame when there is one. CSVs are parsed with
+    the multithreaded pyarrow engine (or in chunks), Parquet is memory-mapped and
+    only the requested columns are read. Previews give the schema and row count
+    without loading the whole file. Previews and file hashes are kept in small LRUs.
+    """
+
+    def __init__(self, max_bytes: int = int(TABLE_CACHE_MB * 2**20)):
+        """
+        Initialize the table cache.
+        Args:
+            max_bytes: Max memory held by cached frames
+        """
+        self.max_bytes = max_bytes
+        self._frames: "OrderedDict[CacheKey, Tuple[pd.DataFrame, int]]" = OrderedDict()
+        self._previews: "OrderedDict[Tuple[str, Optional[str]], Dict[str, Any]]" = OrderedDict()
+        self._hashes = FileHashes()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def file_hash(self, path: str) -> str:
+        """SHA-256 of a file, reused while its size and mtime don't change."""
+        return self._hashes.hash(path)
+
+    def _get(self, key: CacheKey) -> Optional["pd.DataFrame"]:
+        with self._lock:
+            entry = self._frames.get(key)
+            if entry is not None:
+                self._frames.move_to_end(key)
+                return entry[0]
+            return None
+
+    def _put(self, key: CacheKey, df: "pd.DataFrame"):
+        size = estimate_size(df)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._frames:
+                return
+            self._frames[key] = (df, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._frames.popitem(last=False)
+                self._bytes -= evicted
+                self.stats["evictions"] += 1
+
+    def _read(self, path: str, kind: str, columns: Optional[List[str]], sheet: Optional[str]) -> "pd.DataFrame":
+        if kind == "parquet":
+            return pd.read_parquet(path, columns=columns, memory_map=True)
+        if kind == "excel":
+            return pd.read_excel(path, sheet_name=sheet or 0, usecols=columns)
+
+        sep = "\t" if path.lower().endswith(".tsv") else ","
+        if _has_pyarrow():
+            return pd.read_csv(path, sep=sep, usecols=columns, engine="pyarrow")
+        chunks = pd.read_csv(path, sep=sep, usecols=columns, chunksize=CSV_CHUNK_ROWS, low_memory=True)
+        return pd.concat(chunks, ignore_index=True)
+
+    def load(
+        self,
+        path: str,
+        columns: Optional[Sequence[str]] = None,
+        sheet: Optional[str] = None,
+        compact: bool = False,
+    ) -> "pd.DataFrame":
+        """
+        Load a table, from the cache when possible.
+        Args:
+            path: CSV, TSV, Parquet or Excel file
+            columns: Only load these columns (all if None)
+            sheet: Excel sheet name (first sheet if None)
+            compact: Shrink the dtypes to save memory (see `shrink_dtypes`)
+        Returns:
+            The parsed DataFrame (a copy the caller may modify)
+        """
+        kind = _format(path)
+        digest = self.file_hash(path)
+        columns = list(dict.fromkeys(columns)) if columns else None
+        key = (digest, tuple(columns) if columns else None, sheet, compact)
+
+        df = self._get(key)
+        if df is None and columns:
+            full = self._get((digest, None, sheet, compact))
+            if full is not None:
+                df = full[columns]
+        if df is not None:
+            with self._lock:
+                self.stats["hits"] += 1
+            return _copy(df)
+
+        with self._lock:
+            self.stats["misses"] += 1
+        df = self._read(path, kind, columns, sheet)
+        if compact:
+            df = shrink_dtypes(df)
+        self._put(key, df)
+        return _copy(df)
+
+    def _count_rows(self, path: str, kind: str, sheet: Optional[str]) -> Optional[int]:
+        if kind == "parquet":
+            import pyarrow.parquet as pq
+            return pq.ParquetFile(path).metadata.num_rows
+        if kind == "excel":
+            try:
+                import openpyxl
+            except ImportError:
+                return None
+            book = openpyxl.load_workbook(path, read_only=True)
+            try:
+                worksheet = book[sheet] if sheet else book.worksheets[0]
+                return max(0, (worksheet.max_row or 1) - 1)
+            finally:
+                book.close()
+
+        # Count line breaks in binary chunks (quoted multi-line fields are counted as rows)
+        lines = 0
+        last = b"\n"
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                lines += chunk.count(b"\n")
+                last = chunk[-1:]
+        if last != b"\n":
+            lines += 1
+        return max(0, lines - 1)  # header
+
+    def preview(self, path: str, sheet: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Schema, row count and first rows of a table, without loading it in full.
+        Args:
+            path: CSV, TSV, Parquet or Excel file
+            sheet: Excel sheet name (first sheet if None)
+        Returns:
+            Dict with `rows`, `columns` (name -> dtype as inferred from the first rows),
+            `head` (records) and `file_bytes`
+        """
+        kind = _format(path)
+        key = (self.file_hash(path), sheet)
+        with self._lock:
+            cached = self._previews.get(key)
+            if cached is not None:
+                self._previews.move_to_end(key)
+        if cached is not None:
+            return dict(cached)
+
+        if kind == "parquet":
+            import pyarrow.parquet as pq
+            parquet = pq.ParquetFile(path, memory_map=True)
+            batch = next(parquet.iter_batches(batch_size=SNIFF_ROWS), None)
+            sample = (batch if batch is not None else parquet.schema_arrow.empty_table()).to_pandas()
+        elif kind == "excel":
+            sample = pd.read_excel(path, sheet_name=sheet or 0, nrows=SNIFF_ROWS)
+        else:
+            sep = "\t" if path.lower().endswith(".tsv") else ","
+            sample = pd.read_csv(path, sep=sep, nrows=SNIFF_ROWS)
+
+        preview = {
+            "rows": self._count_rows(path, kind, sheet),
+            "columns": {str(name): str(dtype) for name, dtype in sample.dtypes.items()},
+            "head": sample.head(PREVIEW_ROWS).to_dict(orient="records"),
+            "file_bytes": os.path.getsize(path),
+        }
+        with self._lock:
+            _remember(self._previews, key, preview, MAX_PREVIEWS)
+        return dict(preview)
+
+    def clear(self):
+        """Drop all cached frames, previews and file hashes."""
+        with self._lock:
+            self._frames.clear()
+            self._previews.clear()
+            self._hashes.clear()
+            self._bytes = 0
+
+
+@functools.lru_cache(maxsize=None)
+def get_table_cache() -> TableCache:
+    """Process-wide table cache, created on first use."""
+    return TableCache()
@@ -0,0 +1,367 @@
+# tracing.py
+
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+from logging.handlers import RotatingFileHandler
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import contextvars
+import functools
+import asyncio
+import threading
+import logging
+import inspect
+import bisect
+import json
+import time
+import uuid
+import os
+
+from dotenv import load_dotenv
+
+# Load env variables
+load_dotenv()
+TRACE_FILE = os.getenv("TRACE_FILE", "")  # JSONL file spans are written to; unset = none
+TRACE_MAX_MB = float(os.getenv("TRACE_MAX_MB", "10"))  # size of a trace file before it's rotated
+TRACE_BACKUPS = int(os.getenv("TRACE_BACKUPS", "3"))  # rotated files kept
+METRICS_PORT = os.getenv("METRICS_PORT")  # e.g. 9464; unset = no endpoint
+
+# Histogram buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Counter:
+    """Prometheus counter with labels."""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: Any):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            for key, value in self._values.items():
+                yield f"{self.name}{_labels(key)} {value}"
+
+
+class Gauge:
+    """Prometheus gauge with labels."""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, **labels: Any):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            self._values[key] = value
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        with self._lock:
+            for key, value in self._values.items():
+                yield f"{self.name}{_labels(key)} {value}"
+
+
+class Histogram:
+    """Prometheus histogram with labels."""
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [bucket counts..., sum, count]
+        self._values: Dict[Labels, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: Any):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            if index < len(self.buckets):
+                row[index] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            for key, row in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets, row):
+                    cumulative += count
+                    yield f"{self.name}_bucket{_labels(key + (('le', repr(float(bound))),))} {cumulative}"
+                yield f"{self.name}_bucket{_labels(key + (('le', '+Inf'),))} {row[-1]}"
+                yield f"{self.name}_sum{_labels(key)} {row[-2]}"
+                yield f"{self.name}_count{_labels(key)} {row[-1]}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(key: Labels) -> str:
+    if not key:
+        return ""
+    escaped = (f'{k}="{_escape(v)}"' for k, v in key)
+    return "{" + ",".join(escaped) + "}"
+
+
+class Registry:
+    """The process's metrics, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str) -> Counter:
+        with self._lock:
+            return self._metrics.setdefault(name, Counter(name, help))
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        with self._lock:
+            return self._metrics.setdefault(name, Gauge(name, help))
+
+    def histogram(self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        with self._lock:
+            return self._metrics.setdefault(name, Histogram(name, help, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+registry = Registry()
+span_seconds = registry.histogram("agent_span_seconds", "Duration of traced spans")
+span_total = registry.counter("agent_spans_total", "Finished spans by status")
+
+# Span currently open in this context (thread or asyncio task)
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+# JSONL trace writer (a logger, so writes are thread-safe and files rotate)
+_trace_logger = logging.getLogger("code_agent_demo.traces")
+_trace_logger.propagate = False
+_trace_lock = threading.Lock()
+_trace_enabled = bool(TRACE_FILE)
+
+
+class _PrivateRotatingFileHandler(RotatingFileHandler):
+    # Trace files are created readable by their owner only (rotated ones keep the mode)
+    def _open(self):
+        opener = lambda path, flags: os.open(path, flags, 0o600)
+        return open(self.baseFilename, self.mode, encoding=self.encoding, errors=self.errors, opener=opener)
+
+
+def configure(path: Optional[str] = TRACE_FILE, max_mb: float = TRACE_MAX_MB, backups: int = TRACE_BACKUPS):
+    """
+    (Re)configure the trace file.
+    Args:
+        path: JSONL file spans are appended to, or None/"" to stop writing spans
+        max_mb: Size at which the file is rotated
+        backups: Rotated files kept
+    """
+    global _trace_enabled
+    with _trace_lock:
+        for handler in list(_trace_logger.handlers):
+            _trace_logger.removeHandler(handler)
+            handler.close()
+        _trace_enabled = bool(path)
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            handler = _PrivateRotatingFileHandler(path, maxBytes=int(max_mb * 2**20), backupCount=backups, delay=True)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            _trace_logger.addHandler(handler)
+            _trace_logger.setLevel(logging.INFO)
+
+
+def disable():
+    """Stop writing spans (metrics are still recorded)."""
+    configure(None)
+
+
+class Span:
+    """
+    A timed operation. Spans opened while another is current become its children and
+    share its trace id; the finished span is written as one JSON line and its duration
+    observed in `agent_span_seconds`. Attributes must not carry user or customer data;
+    spans around such data are opened with `redact=True`, so their errors are recorded
+    by exception type only (messages may quote the data, e.g. in a URL).
+    """
+
+    def __init__(self, name: str, redact: bool = False, **attributes: Any):
+        parent = _current_span.get()
+        self.name = name
+        self.redact = redact
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes: Dict[str, Any] = dict(attributes)
+        self.status = "ok"
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration: Optional[float] = None
+        self._token = None
+        # Ended by a future instead of the `with` block (see end_with)
+        self._deferred = False
+        self._watcher: Optional[asyncio.Future] = None
+
+    def set(self, **attributes: Any) -> "Span":
+        """Add attributes to the span."""
+        self.attributes.update(attributes)
+        return self
+
+    def elapsed(self) -> float:
+        """Seconds since the span started."""
+        return time.perf_counter() - self._start
+
+    def error(self, exc: BaseException):
+        """Mark the span as failed."""
+        self.status = "error"
+        self.attributes["error"] = type(exc).__name__ if self.redact else f"{type(exc).__name__}: {exc}"
+
+    def end_with(self, future: Any):
+        """
+        Finish the span when `future` completes rather than when its `with` block exits,
+        for work that keeps running after the call that started it (e.g. a workflow run).
+        Args:
+            future: A future, or an awaitable such as a workflow handler (watched from a
+                task on the running event loop)
+        """
+        self._deferred = True
+        if not hasattr(future, "add_done_callback"):
+            future = self._watcher = asyncio.ensure_future(_wait(future))
+
+        def done(future):
+            if future.cancelled():
+                self.status = "cancelled"
+            elif future.exception() is not None:
+                self.error(future.exception())
+            self.end()
+
+        future.add_done_callback(done)
+
+    def end(self):
+        """Finish the span (only the first call counts)."""
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._start
+        span_seconds.observe(self.duration, span=self.name)
+        span_total.inc(span=self.name, status=self.status)
+        if _trace_enabled:
+            record = {
+                "trace_id": self.trace_id,
+                "span_id": self.span_id,
+                "parent_id": self.parent_id,
+                "name": self.name,
+                "start": self.start_time,
+                "duration": self.duration,
+                "status": self.status,
+                "attributes": self.attributes,
+            }
+            _trace_logger.info(json.dumps(record, default=str))
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.error(exc)
+        _current_span.reset(self._token)
+        if exc is not None or not self._deferred:
+            self.end()
+        return False
+
+
+async def _wait(awaitable: Any) -> Any:
+    return await awaitable
+
+
+def span(name: str, redact: bool = False, **attributes: Any) -> Span:
+    """Open a span as a context manager: `with span("executor.run", chars=len(code)) as s: ...`"""
+    return Span(name, redact=redact, **attributes)
+
+
+def current_span() -> Optional[Span]:
+    """The span open in this context, if any."""
+    return _current_span.get()
+
+
+def traced(name: Optional[str] = None, redact: bool = False) -> Callable[[Callable], Callable]:
+    """
+    Decorator tracing every call of a (sync or async) function as a span.
+    The wrapper keeps the function's name, docstring and signature, so decorated
+    tools are still discovered and described the same way.
+    Args:
+        name: Span name (defaults to the function name)
+        redact: Record errors by type only (see `Span`), for functions whose
+            error messages may carry user data
+    """
+    def decorator(fn: Callable) -> Callable:
+        span_name = name or fn.__name__
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with Span(span_name, redact=redact):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with Span(span_name, redact=redact):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@functools.lru_cache(maxsize=None)
+def start_metrics_server(port: Optional[int] = None, host: str = "127.0.0.1") -> Optional[ThreadingHTTPServer]:
+    """
+    Serve `/metrics` in the Prometheus text format from a daemon thread (once per process).
+    Args:
+        port: Port to listen on (defaults to METRICS_PORT; nothing is started if neither is set)
+        host: Interface to bind
+    Returns:
+        The running server, or None
+    """
+    port = port if port is not None else (int(METRICS_PORT) if METRICS_PORT else None)
+    if port is None:
+        return None
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+configure()
@@ -0,0 +1,124 @@
+# upload_store.py
+
+from typing import BinaryIO, Iterable, List, Optional, Tuple
+from pathlib import Path
+import functools
+import threading
+import tempfile
+import hashlib
+import shutil
+import os
+
+from dotenv import load_dotenv
+
+# Load env variables
+load_dotenv()
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "code-agent-demo-uploads"))
+UPLOAD_MAX_MB = int(os.getenv("UPLOAD_MAX_MB", "1024"))
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class UploadStore:
+    """
+    Content-addressed store for uploaded files, shared by all sessions.
+    A file is written once, in chunks, to `<root>/<sha256>/<name>`; uploading the
+    same content again (on a rerun or from another session) reuses it. When the
+    store grows past its size limit, the least recently used files are removed.
+    """
+
+    def __init__(self, root: str = UPLOAD_DIR, max_bytes: int = UPLOAD_MAX_MB * 1024 * 1024):
+        """
+        Initialize the upload store.
+        Args:
+            root: Directory holding the stored files
+            max_bytes: Size limit of the store before old files are evicted
+        """
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def put(self, file: BinaryIO, name: Optional[str] = None) -> str:
+        """
+        Store a file-like object.
+        Args:
+            file: Binary file object, e.g. a Streamlit UploadedFile
+            name: File name to store it under (defaults to `file.name`)
+        Returns:
+            Path of the stored file
+        """
+        name = os.path.basename(name or getattr(file, "name", "upload"))
+
+        # Hash while copying to a temporary file, so the content is read only once
+        digest = hashlib.sha256()
+        file.seek(0)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=".incoming-")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                    tmp.write(chunk)
+
+            folder = self.root / digest.hexdigest()
+            path = folder / name
+            with self._lock:
+                if path.exists():
+                    os.utime(path)
+                else:
+                    folder.mkdir(exist_ok=True)
+                    os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        self.cleanup(keep=[path])
+        return str(path)
+
+    def touch(self, path: str) -> bool:
+        """Mark a stored file as recently used. Returns False if it was evicted."""
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _entries(self) -> List[Tuple[float, int, Path]]:
+        entries = []
+        for folder in self.root.iterdir():
+            if not folder.is_dir():
+                continue
+            for path in folder.iterdir():
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:  # Evicted by another process
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def size(self) -> int:
+        """Total bytes currently stored."""
+        with self._lock:
+            return sum(size for _, size, _ in self._entries())
+
+    def cleanup(self, keep: Iterable[Path] = ()):
+        """Evict least recently used files until the store fits its size limit."""
+        keep = {Path(p) for p in keep}
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                if path in keep:
+                    continue
+                path.unlink(missing_ok=True)
+                total -= size
+                if not any(path.parent.iterdir()):
+                    shutil.rmtree(path.parent, ignore_errors=True)
+
+
+@functools.lru_cache(maxsize=None)
+def get_upload_store() -> UploadStore:
+    """Process-wide upload store, created on first use."""
+    return UploadStore()
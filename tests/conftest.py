@@ -0,0 +1,15 @@
+# conftest.py
+
+import tempfile
+import sys
+import os
+
+# Offline settings, before any module reads them: no API keys, throwaway caches
+os.environ.setdefault("GROK_API_KEY", "test")
+os.environ["CITY_CACHE_PATH"] = ":memory:"
+os.environ["LLM_CACHE"] = "0"
+os.environ["TRACE_FILE"] = ""
+os.environ["FIGURE_DIR"] = tempfile.mkdtemp(prefix="code-agent-demo-test-figures-")
+
+# Add the project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
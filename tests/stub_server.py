@@ -0,0 +1,73 @@
+# stub_server.py
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Tuple
+from urllib.parse import parse_qs, urlparse
+import threading
+import json
+
+
+class StubServer:
+    """
+    Local HTTP server standing in for an external API in tests.
+    Every request is passed to `handler(method, path, query, body)`, which returns
+    (status, JSON payload) or (status, payload, headers). Requests and the client
+    ports they came from are recorded, so tests can check connection reuse.
+    """
+
+    def __init__(self, handler: Callable[[str, str, Dict[str, List[str]], Any], Tuple]):
+        self.handler = handler
+        self.requests: List[Dict[str, Any]] = []
+        self.ports = set()
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive
+
+            def _handle(self):
+                url = urlparse(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                try:
+                    body = json.loads(raw) if raw else None
+                except ValueError:
+                    body = raw
+                query = parse_qs(url.query)
+                with stub._lock:
+                    stub.requests.append({"method": self.command, "path": url.path, "query": query, "body": body})
+                    stub.ports.add(self.client_address[1])
+                status, payload, *rest = stub.handler(self.command, url.path, query, body)
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (rest[0] if rest else {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = _handle
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            daemon_threads = True
+            request_queue_size = 128
+
+        self._server = Server(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> "StubServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,154 @@
+# test_agent_factory.py
+
+import threading
+import time
+
+import pytest
+
+import src.agent_factory as agent_factory
+from src.agent_factory import AgentFactory
+from src.tracing import registry
+
+
+class FakeExecutor:
+    def namespace_bytes(self):
+        return 100
+
+
+class FakeAgent:
+    """Stands in for DemoAgent; `gate` lets a test hold its construction."""
+    built = []
+    gate = None
+
+    def __init__(self, llm=None, tools=None, router=None):
+        if FakeAgent.gate is not None:
+            FakeAgent.gate.wait(timeout=5)
+        self.code_executor = FakeExecutor()
+        self.closed = False
+        FakeAgent.built.append(self)
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture(autouse=True)
+def fake_agent(monkeypatch):
+    FakeAgent.built, FakeAgent.gate = [], None
+    monkeypatch.setattr(agent_factory, "DemoAgent", FakeAgent)
+    for name in ("get_llm", "get_function_tools", "get_router"):
+        monkeypatch.setattr(agent_factory, name, lambda: None)
+
+
+def test_idle_sessions_are_evicted_but_not_busy_ones():
+    factory = AgentFactory(idle_ttl=10)
+    idle, busy = factory.get("idle"), factory.get("busy")
+    factory.begin_turn(busy)
+
+    assert factory.evict_idle(now=time.time() + 60) == 1
+    assert idle.agent.closed and not busy.agent.closed
+    assert factory.get("busy") is busy
+
+    factory.end_turn(busy)
+    assert factory.evict_idle(now=time.time() + 60) == 1
+    assert busy.agent.closed
+
+
+def test_over_capacity_skips_busy_sessions():
+    factory = AgentFactory(max_sessions=2)
+    first = factory.get("first")
+    factory.begin_turn(first)
+    second = factory.get("second")
+    factory.get("third")
+
+    assert not first.agent.closed
+    assert second.agent.closed
+    assert len(factory) == 2
+
+
+def test_over_capacity_with_only_busy_sessions_keeps_them_all():
+    factory = AgentFactory(max_sessions=1)
+    first = factory.get("first")
+    factory.begin_turn(first)
+    factory.get("second")
+    assert len(factory) == 2
+    assert not first.agent.closed
+
+
+def test_finished_turn_refreshes_last_used():
+    factory = AgentFactory(idle_ttl=10)
+    session = factory.get("session")
+    factory.begin_turn(session)
+    session.last_used -= 60  # a long turn
+    factory.end_turn(session)
+    assert factory.evict_idle() == 0
+
+
+def test_release_while_busy_closes_after_the_turn():
+    factory = AgentFactory()
+    session = factory.get("session")
+    factory.begin_turn(session)
+    factory.release("session")
+    assert len(factory) == 0
+    assert not session.agent.closed
+    factory.end_turn(session)
+    assert session.agent.closed
+
+
+def test_slow_construction_does_not_block_other_sessions():
+    factory = AgentFactory()
+    factory.get("existing")
+    FakeAgent.gate = threading.Event()
+    slow = threading.Thread(target=factory.get, args=("slow",))
+    slow.start()
+    time.sleep(0.05)
+
+    start = time.monotonic()
+    factory.get("existing")
+    factory.evict_idle()
+    assert time.monotonic() - start < 1
+
+    FakeAgent.gate.set()
+    slow.join()
+    assert len(factory) == 2
+
+
+def test_concurrent_gets_build_one_agent_per_session():
+    factory = AgentFactory()
+    FakeAgent.gate = threading.Event()
+    sessions = []
+    threads = [threading.Thread(target=lambda: sessions.append(factory.get("same"))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    FakeAgent.gate.set()
+    for thread in threads:
+        thread.join()
+    assert len(FakeAgent.built) == 1
+    assert all(session is sessions[0] for session in sessions)
+
+
+
+def test_failed_construction_leaves_nothing_behind(monkeypatch):
+    factory = AgentFactory()
+
+    def broken(**kwargs):
+        raise RuntimeError("no API key")
+
+    monkeypatch.setattr(agent_factory, "DemoAgent", broken)
+    with pytest.raises(RuntimeError):
+        factory.get("broken")
+    assert factory._building == {} and len(factory) == 0
+
+    # The next request builds the agent again
+    monkeypatch.setattr(agent_factory, "DemoAgent", FakeAgent)
+    assert factory.get("broken").agent is FakeAgent.built[0]
+    assert factory._building == {}
+
+def test_memory_is_published_as_metrics():
+    factory = AgentFactory()
+    session = factory.get("session")
+    factory.begin_turn(session)
+    factory.end_turn(session)
+    metrics = registry.render()
+    assert 'agent_sessions{state="idle"} 1' in metrics
+    assert 'agent_session_bytes{kind="executor"} 100' in metrics
@@ -0,0 +1,30 @@
+# test_async_runtime.py
+
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import threading
+import asyncio
+
+from src.async_runtime import get_background_loop, run_in_thread
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+
+def current(suffix=""):
+    return request_id.get(), threading.current_thread().name + suffix
+
+
+def test_run_in_thread_keeps_the_callers_context():
+    async def main():
+        request_id.set("r1")
+        return await run_in_thread(current, suffix="!")
+
+    value, thread = asyncio.run(main())
+    assert value == "r1"
+    assert thread != threading.current_thread().name and thread.endswith("!")
+
+
+def test_run_in_thread_uses_the_given_executor():
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="probe") as pool:
+        future = get_background_loop().submit(run_in_thread(current, executor=pool))
+        assert future.result(timeout=10)[1].startswith("probe")
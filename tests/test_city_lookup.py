@@ -0,0 +1,120 @@
+# test_city_lookup.py
+
+import threading
+import time
+
+import pytest
+import requests
+
+from src.city_lookup import CityLookup
+from tests.stub_server import StubServer
+
+POPULATIONS = {("Santiago", "DO"): 691262, ("La Romana", "DO"): 139671}
+
+
+def city_api(method, path, query, body):
+    if query.get("name") == ["Broken"]:
+        return 500, {"error": "unavailable"}
+    population = POPULATIONS.get((query["name"][0], query["country"][0]))
+    return 200, ([{"name": query["name"][0], "population": population}] if population else [])
+
+
+@pytest.fixture
+def server():
+    with StubServer(city_api) as server:
+        yield server
+
+
+@pytest.fixture
+def lookup(server):
+    return CityLookup(api_key="test", url=server.url + "/v1/city", db_path=None)
+
+
+def test_fetches_then_serves_from_memory(lookup, server):
+    assert lookup.population("Santiago", "DO") == 691262
+    assert lookup.population(" santiago ", "do") == 691262
+    assert len(server.requests) == 1
+    assert lookup.stats == {"memory_hits": 1, "disk_hits": 0, "misses": 1}
+
+
+def test_persistent_cache_survives_a_new_lookup(server, tmp_path):
+    db_path = str(tmp_path / "cities.sqlite3")
+    CityLookup(url=server.url, db_path=db_path).population("Santiago", "DO")
+    fresh = CityLookup(url=server.url, db_path=db_path)
+    assert fresh.population("Santiago", "DO") == 691262
+    assert fresh.stats["disk_hits"] == 1
+    assert len(server.requests) == 1
+
+
+def test_connections_are_reused(lookup, server):
+    for _ in range(5):
+        lookup.population("Atlantis", "DO")
+        lookup.clear()
+    assert len(server.requests) == 5
+    assert len(server.ports) == 1
+
+
+def test_concurrent_lookups(lookup, server):
+    results = []
+    threads = [
+        threading.Thread(target=lambda city=city: results.append(lookup.population(city, "DO")))
+        for city in ["Santiago", "La Romana"] * 10
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(set(results)) == [139671, 691262]
+
+
+def test_api_errors_are_raised_and_not_cached(lookup, server):
+    for _ in range(2):
+        with pytest.raises(requests.HTTPError):
+            lookup.population("Broken", "DO")
+    assert len(server.requests) == 2
+
+
+def test_no_data_is_cached_for_the_miss_ttl_only(server):
+    lookup = CityLookup(url=server.url, db_path=None, ttl=3600, miss_ttl=0.2)
+    assert lookup.population("Atlantis", "DO") is None
+    assert lookup.population("Santiago", "DO") == 691262
+    assert lookup.population("Atlantis", "DO") is None
+    assert len(server.requests) == 2
+
+    time.sleep(0.3)
+    assert lookup.population("Atlantis", "DO") is None
+    assert lookup.population("Santiago", "DO") == 691262
+    assert len(server.requests) == 3
+
+
+def test_preload_accepts_float_strings_and_skips_bad_rows(lookup, server, caplog):
+    loaded = lookup.preload([
+        ("Bani", "DO", "48000.0"),
+        ("Jarabacoa", "DO", 29000),
+        ("Nowhere", "DO", ""),
+        ("Bad", "DO", "many"),
+        ("Worse", "DO", "nan"),
+    ])
+    assert loaded == 3
+    assert lookup.population("Bani", "DO") == 48000
+    assert lookup.population("Jarabacoa", "DO") == 29000
+    assert lookup.population("Nowhere", "DO") is None
+    assert len(server.requests) == 0
+    assert "Bad, DO: invalid population 'many'" in caplog.text
+    assert "Worse" in caplog.text
+
+
+def test_preload_csv(lookup, server, tmp_path):
+    path = tmp_path / "cities.csv"
+    path.write_text("city,country,population\nSantiago,DO,1.0e3\nLa Romana,DO,\n", encoding="utf-8")
+    assert lookup.preload_csv(str(path)) == 2
+    assert lookup.population("Santiago", "DO") == 1000
+    assert lookup.population("La Romana", "DO") is None
+    assert len(server.requests) == 0
+
+
+def test_snapshot_and_restore(lookup):
+    lookup.preload([("Bani", "DO", 48000)])
+    other = CityLookup(url="http://127.0.0.1:9", db_path=None)
+    other.restore(lookup.snapshot())
+    assert other.population("Bani", "DO") == 48000
@@ -0,0 +1,167 @@
+# test_code_executor.py
+
+import threading
+import sys
+
+import pytest
+
+from src.code_executor import RESULT_NAME, OutputCapture, SimpleCodeExecutor, compile_code
+
+
+def run(code, namespace=None):
+    namespace = {} if namespace is None else namespace
+    compiled, has_result, _ = compile_code(code)
+    exec(compiled, {"__builtins__": __builtins__}, namespace)
+    return has_result, namespace
+
+
+@pytest.fixture
+def executor():
+    executor = SimpleCodeExecutor(locals={}, globals={"__builtins__": __builtins__})
+    yield executor
+    executor.close()
+
+
+# compile_code: last-expression rewrite
+
+def test_trailing_expression_is_captured():
+    has_result, namespace = run("x = 2\nx * 21")
+    assert has_result
+    assert namespace[RESULT_NAME] == 42
+
+
+@pytest.mark.parametrize("code", ["x = 1", "print('hi')\nx = 1", "def f():\n    return 1", "", "# comment only"])
+def test_statements_are_not_captured(code):
+    has_result, namespace = run(code)
+    assert not has_result
+    assert RESULT_NAME not in namespace
+
+
+def test_only_the_last_expression_is_rewritten():
+    has_result, namespace = run("calls = []\ncalls.append(1)\ncalls.append(2)\nlen(calls)")
+    assert has_result
+    assert namespace["calls"] == [1, 2]
+    assert namespace[RESULT_NAME] == 2
+
+
+def test_expression_inside_a_block_is_not_captured():
+    has_result, namespace = run("for i in range(3):\n    i")
+    assert not has_result
+
+
+def test_line_numbers_are_kept_in_tracebacks(executor):
+    output = executor.execute("x = 1\n\n1 / 0")
+    assert "ZeroDivisionError" in output
+    assert 'File "<string>", line 3' in output
+
+
+def test_cached_code_object_is_reused():
+    code = "sum(range(10))  # test_cached_code_object_is_reused"
+    first, _, hit = compile_code(code)
+    second, _, second_hit = compile_code(code)
+    assert second is first
+    assert second_hit
+
+
+def test_syntax_errors_are_reported(executor):
+    output = executor.execute("x = (")
+    assert output.startswith("Error: SyntaxError")
+
+
+def test_return_value_is_appended_to_the_output(executor):
+    assert executor.execute("print('a')\n6 * 7") == "a\n\n\n42"
+    assert executor.execute("None") == ""
+
+
+# OutputCapture: head/tail truncation and streaming
+
+def test_short_output_is_kept_whole():
+    capture = OutputCapture(max_bytes=100)
+    capture.write("hello\n")
+    capture.write("world\n")
+    assert capture.getvalue() == "hello\nworld\n"
+    assert capture.dropped_bytes == 0
+
+
+def test_long_output_keeps_head_and_tail():
+    capture = OutputCapture(max_bytes=20)
+    for i in range(100):
+        capture.write(f"{i:02d}\n")
+    value = capture.getvalue()
+    head, _, rest = value.partition("\n... [")
+    tail = rest.partition("] ...\n")[2]
+    assert head == "00\n01\n02\n0"
+    assert tail == "\n97\n98\n99\n"
+    assert capture.dropped_bytes == 300 - 20
+    assert f"[{capture.dropped_bytes} bytes truncated]" in value
+
+
+def test_retained_size_is_bounded_for_single_large_writes():
+    capture = OutputCapture(max_bytes=64)
+    capture.write("x" * 10_000)
+    capture.write("y" * 10_000)
+    assert capture._head_size + capture._tail_size == 64
+    assert capture.dropped_bytes == 20_000 - 64
+    assert capture.getvalue().endswith("y" * 32)
+
+
+def test_multibyte_output_is_dropped_whole_not_split():
+    capture = OutputCapture(max_bytes=8)
+    capture.write("abcd")
+    for _ in range(10):
+        capture.write("é")
+    assert capture._tail_size <= capture.tail_limit
+    assert capture.getvalue().startswith("abcd")
+    assert capture.dropped_bytes + capture._head_size + capture._tail_size == 4 + 20
+
+
+def test_sink_receives_complete_lines_then_the_rest_on_flush():
+    chunks = []
+    capture = OutputCapture(sink=chunks.append)
+    capture.write("first line\nsecond")
+    assert chunks == ["first line\n"]
+    capture.write(" half")
+    capture.flush()
+    assert chunks == ["first line\n", "second half"]
+    # The sink sees everything, even when the retained output is truncated
+    assert "".join(chunks) == capture.getvalue()
+
+
+# Output of sessions running at the same time
+
+def test_concurrent_executions_keep_their_output_apart(executor):
+    other = SimpleCodeExecutor(locals={}, globals={"__builtins__": __builtins__})
+    streamed = {"a": [], "b": []}
+    executor.output_sink = streamed["a"].append
+    other.output_sink = streamed["b"].append
+    barrier = threading.Barrier(2)
+    outputs = {}
+
+    def session(name, runner):
+        # Both sessions print while the other one is running
+        runner.locals["barrier"] = barrier
+        outputs[name] = runner.execute(
+            f"import time\nfor i in range(20):\n    print('{name}', i)\n    time.sleep(0.002)\n    "
+            f"barrier.wait() if i == 0 else None"
+        )
+
+    threads = [threading.Thread(target=session, args=args) for args in (("a", executor), ("b", other))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    other.close()
+
+    for name in ("a", "b"):
+        expected = "".join(f"{name} {i}\n" for i in range(20))
+        assert outputs[name] == expected
+        assert "".join(streamed[name]) == expected
+
+
+def test_output_outside_executions_goes_to_the_process_stream(executor, capsys):
+    executor.execute("print('inside')")
+    print("outside")
+    sys.stderr.write("err\n")
+    captured = capsys.readouterr()
+    assert captured.out == "outside\n"
+    assert captured.err == "err\n"
@@ -0,0 +1,154 @@
+# test_concurrency.py
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.concurrency import ParallelCallError, async_tool, parallel_map, run_async
+
+
+def fail_on(*bad):
+    def fn(x):
+        if x in bad:
+            raise ValueError(f"bad item {x}")
+        return x * 10
+    return fn
+
+
+# parallel_map
+
+def test_results_are_in_item_order():
+    def fn(x):
+        time.sleep(0.01 * (5 - x))
+        return x * 10
+    assert parallel_map(fn, range(5)) == [0, 10, 20, 30, 40]
+    assert parallel_map(fn, []) == []
+
+
+def test_star_unpacks_tuples_and_dicts():
+    def fn(a, b=0):
+        return a - b
+    assert parallel_map(fn, [(5, 2), {"a": 1, "b": 3}, (4,)], star=True) == [3, -2, 4]
+
+
+def test_failures_are_aggregated_with_their_items():
+    with pytest.raises(ParallelCallError) as info:
+        parallel_map(fail_on(1, 3), range(5))
+    error = info.value
+    assert [(index, item) for index, item, _ in error.errors] == [(1, 1), (3, 3)]
+    assert error.results == [0, None, 20, None, 40]
+    message = str(error)
+    assert message.startswith("2 of 5 calls failed")
+    assert "[1] 1: ValueError: bad item 1" in message and "[3] 3: ValueError: bad item 3" in message
+
+
+def test_return_exceptions_puts_them_in_the_results():
+    results = parallel_map(fail_on(2), range(4), return_exceptions=True)
+    assert results[:2] == [0, 10] and results[3] == 30
+    assert isinstance(results[2], ValueError)
+
+
+def test_slow_call_times_out_alone():
+    release = threading.Event()
+
+    def fn(x):
+        if x == "slow":
+            release.wait(5)
+        return x
+
+    start = time.monotonic()
+    try:
+        results = parallel_map(fn, ["a", "slow", "b"], timeout=0.2, return_exceptions=True)
+    finally:
+        release.set()
+    assert time.monotonic() - start < 2
+    assert results[0] == "a" and results[2] == "b"
+    assert isinstance(results[1], TimeoutError)
+
+
+def test_timeout_counts_from_when_a_call_starts():
+    # Two workers, three 0.15s calls: the last one waits for a worker but doesn't time out
+    assert parallel_map(lambda x: time.sleep(0.15) or x, range(3), max_workers=2, timeout=0.3) == [0, 1, 2]
+
+
+def test_concurrency_is_bounded():
+    lock = threading.Lock()
+    running = [0]
+    peak = [0]
+
+    def fn(x):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        return x
+
+    assert parallel_map(fn, range(12), max_workers=3) == list(range(12))
+    assert peak[0] == 3
+
+
+# run_async
+
+def test_run_async_gathers_in_order():
+    async def value(x, delay):
+        await asyncio.sleep(delay)
+        return x
+    assert run_async(value("a", 0.03), value("b", 0.01), value("c", 0)) == ["a", "b", "c"]
+
+
+def test_run_async_failures():
+    async def value(x):
+        if x == "bad":
+            raise KeyError(x)
+        return x
+
+    with pytest.raises(ParallelCallError) as info:
+        run_async(value("a"), value("bad"))
+    assert [index for index, _, _ in info.value.errors] == [1]
+    assert info.value.results == ["a", None]
+
+    results = run_async(value("a"), value("bad"), return_exceptions=True)
+    assert results[0] == "a" and isinstance(results[1], KeyError)
+
+
+def test_run_async_from_a_coroutine():
+    async def value():
+        return 1
+
+    async def main():
+        return run_async(value(), value())
+
+    assert asyncio.run(main()) == [1, 1]
+
+
+# async_tool
+
+def test_async_tool_runs_sync_tools_on_the_tool_executor():
+    def lookup(city: str, country: str = "DO") -> str:
+        """Look a city up."""
+        return f"{city}, {country}: {threading.current_thread().name}"
+
+    lookup_async = async_tool(lookup)
+    assert lookup_async.__name__ == "lookup_async"
+    assert lookup_async.__doc__ == "Look a city up."
+    result = run_async(lookup_async("Santiago"))[0]
+    assert result.startswith("Santiago, DO: async-tool")
+
+
+def test_async_tool_prefers_the_native_implementation():
+    async def native(x):
+        return "native"
+    assert run_async(async_tool(lambda x: "thread", native=native)(1)) == ["native"]
+
+
+def test_async_tool_times_out():
+    async def native():
+        await asyncio.sleep(5)
+
+    with pytest.raises(ParallelCallError) as info:
+        run_async(async_tool(lambda: None, native=native, timeout=0.05)())
+    assert isinstance(info.value.errors[0][2], asyncio.TimeoutError)
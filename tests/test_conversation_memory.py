@@ -0,0 +1,137 @@
+# test_conversation_memory.py
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+from llama_index.core.llms import ChatMessage
+
+from src.conversation_memory import EXECUTION_RESULT_PREFIX, ConversationMemory
+
+
+def words(text):
+    return len(text.split())
+
+
+def memory(**kwargs):
+    kwargs.setdefault("token_budget", 100)
+    kwargs.setdefault("max_tool_output_tokens", 10)
+    return ConversationMemory(token_counter=words, **kwargs)
+
+
+def turn(i, answer_words=1):
+    return [
+        ChatMessage(role="user", content=f"question {i}"),
+        ChatMessage(role="assistant", content=" ".join([f"answer{i}"] * answer_words)),
+    ]
+
+
+# Budget
+
+def test_turns_within_budget_are_kept_in_full():
+    mem = memory()
+    mem.record_turn(turn(1))
+    mem.record_turn(turn(2))
+    assert [m.content for m in mem.window()] == ["question 1", "answer1", "question 2", "answer2"]
+
+
+def test_turns_out_of_budget_are_folded_into_the_summary():
+    mem = memory(token_budget=25)
+    for i in range(4):
+        mem.record_turn(turn(i, answer_words=8))  # 10 tokens per turn
+
+    # Only the latest two turns are held; the older ones were released
+    assert len(mem) == 2 and len(mem.deltas) == 2
+    assert mem.total_bytes == sum(len(delta) for delta in mem.deltas)
+
+    history = mem.window()
+    assert history[0].content.startswith("Summary of 2 earlier turn(s)")
+    assert "- user: question 0" in history[0].content and "question 1" in history[0].content
+    assert [m.content for m in history[1:]][::2] == ["question 2", "question 3"]
+    assert [s["turn"] for s in mem.stats] == [1, 2, 3, 4]
+
+
+def test_summary_quotes_only_the_latest_turns():
+    mem = memory(token_budget=1)
+    for i in range(15):
+        mem.record_turn(turn(i))
+    summary = mem.window()[0].content
+    assert summary.startswith("Summary of 14 earlier turn(s)")
+    assert "question 3\n" not in summary and "question 4\n" in summary
+
+
+def test_turn_larger_than_the_budget_is_still_kept():
+    mem = memory(token_budget=5)
+    mem.record_turn(turn(1, answer_words=20))
+    assert len(mem) == 1 and len(mem.window()) == 2
+
+
+# Stubbing
+
+def test_large_tool_outputs_are_stubbed():
+    mem = memory()
+    output = " ".join(["x"] * 50)
+    mem.record_turn([
+        ChatMessage(role="user", content="run it"),
+        ChatMessage(role="tool", content=output),
+        ChatMessage(role="user", content=f"{EXECUTION_RESULT_PREFIX} {output}"),
+        ChatMessage(role="tool", content="short"),
+        ChatMessage(role="assistant", content=output),
+    ])
+    contents = [m.content for m in mem.window()]
+    assert "output truncated, 50 tokens in total" in contents[1]
+    assert len(contents[1]) < len(output)
+    assert "output truncated, 56 tokens in total" in contents[2]
+    assert contents[3] == "short"
+    assert contents[4] == output  # only outputs are stubbed
+
+
+# Serialization
+
+def test_state_round_trips():
+    mem = memory(token_budget=12)
+    for i in range(3):
+        mem.record_turn(turn(i, answer_words=8))
+    data = json.loads(json.dumps(mem.to_dict()))
+    restored = ConversationMemory.from_dict(data, token_budget=12, token_counter=words)
+    assert restored.deltas == mem.deltas
+    assert restored.total_bytes == mem.total_bytes
+    assert [m.content for m in restored.window()] == [m.content for m in mem.window()]
+
+
+def test_restoring_with_a_smaller_budget_folds_turns():
+    mem = memory()
+    for i in range(3):
+        mem.record_turn(turn(i, answer_words=8))
+    restored = ConversationMemory.from_dict(mem.to_dict(), token_budget=12, token_counter=words)
+    assert len(restored) == 1
+    assert restored.window()[0].content.startswith("Summary of 2 earlier turn(s)")
+
+
+# Recording from the agent context
+
+class FakeContext:
+    """Context whose store holds a chat memory with the given messages."""
+
+    def __init__(self, messages):
+        async def aget_all():
+            return messages
+
+        async def get(key):
+            assert key == "memory"
+            return SimpleNamespace(aget_all=aget_all)
+
+        self.store = SimpleNamespace(get=get)
+
+
+def test_only_the_new_messages_of_a_turn_are_recorded():
+    mem = memory(token_budget=15)
+    for i in range(3):
+        mem.record_turn(turn(i, answer_words=8))
+    history = mem.window()
+    assert history[0].content.startswith("Summary")
+
+    new = turn(3)
+    asyncio.run(mem.arecord_from_context(FakeContext(history + new), window_size=len(history)))
+    assert json.loads(mem.deltas[-1]) == [m.model_dump(mode="json") for m in new]
+    assert mem.stats[-1]["turn"] == 4
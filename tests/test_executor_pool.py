@@ -0,0 +1,117 @@
+# test_executor_pool.py
+
+import threading
+import time
+import sys
+
+import pytest
+
+from src.city_lookup import get_city_lookup
+from src.executor_pool import PooledCodeExecutor, WorkerPool
+
+
+def empty_namespace():
+    return {}, {"__builtins__": __builtins__}
+
+
+@pytest.fixture
+def pool():
+    pool = WorkerPool(size=2, preload=())
+    yield pool
+    pool.shutdown()
+
+
+def wait_for_refill(pool, timeout=30):
+    deadline = time.monotonic() + timeout
+    while pool._refilling and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+
+def test_concurrent_acquires_do_not_overshoot(pool):
+    acquired = []
+    threads = [threading.Thread(target=lambda: acquired.append(pool.acquire())) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wait_for_refill(pool)
+
+    assert len(acquired) == 6
+    assert len(pool._idle) == pool.size
+    for worker in acquired:
+        worker.stop()
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="the address space cap is enforced on Linux")
+def test_huge_allocation_fails_inside_the_worker(pool):
+    executor = PooledCodeExecutor(empty_namespace, pool=pool, timeout=30, max_rss_mb=256)
+    try:
+        executor.execute("x = 1")
+        output = executor.execute("big = bytearray(8 * 1024 ** 3)")
+        assert "MemoryError" in output
+        # The worker survived, and so did the session
+        assert executor.execute("x + 1").strip() == "2"
+    finally:
+        executor.close()
+
+
+def test_workers_see_the_parents_in_memory_city_cache(pool):
+    get_city_lookup().preload([("Atlantis", "DO", 1234)])
+    executor = PooledCodeExecutor(empty_namespace, pool=pool, timeout=30, max_rss_mb=0)
+    try:
+        output = executor.execute(
+            "from src.city_lookup import get_city_lookup\n"
+            "lookup = get_city_lookup()\n"
+            "lookup.url = 'http://127.0.0.1:9/unreachable'\n"
+            "lookup.population('atlantis', 'do')"
+        )
+        assert output.strip() == "1234"
+    finally:
+        executor.close()
+
+
+def test_timed_out_execution_kills_the_worker_and_resets_the_session(pool):
+    executor = PooledCodeExecutor(empty_namespace, pool=pool, timeout=1, max_rss_mb=0)
+    try:
+        executor.execute("x = 1")
+        start = time.monotonic()
+        output = executor.execute("while True: pass")
+        assert time.monotonic() - start < 10
+        assert "TimeoutError" in output and "variables were reset" in output
+        assert "NameError" in executor.execute("x")
+    finally:
+        executor.close()
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="worker memory is polled from /proc on Linux")
+def test_worker_over_the_memory_limit_is_killed(pool):
+    executor = PooledCodeExecutor(empty_namespace, pool=pool, timeout=30, max_rss_mb=128)
+    try:
+        executor.execute("x = 1")
+        # Grows (and touches) memory a little at a time, so the RSS poll catches it
+        # before the address space cap does
+        output = executor.execute(
+            "import time\n"
+            "chunks = []\n"
+            "while True:\n"
+            "    chunks.append(b'x' * (4 * 1024 ** 2))\n"
+            "    time.sleep(0.01)"
+        )
+        assert "MemoryError: worker exceeded the 128 MB memory limit" in output
+        assert "variables were reset" in output
+        assert "NameError" in executor.execute("x")
+    finally:
+        executor.close()
+
+
+def test_crashed_worker_resets_the_session(pool):
+    executor = PooledCodeExecutor(empty_namespace, pool=pool, timeout=30, max_rss_mb=0)
+    try:
+        executor.execute("x = 1")
+        output = executor.execute("import os; os._exit(1)")
+        assert "WorkerError" in output and "variables were reset" in output
+        # A new worker takes over
+        assert "NameError" in executor.execute("x")
+        assert executor.execute("1 + 1").strip() == "2"
+    finally:
+        executor.close()
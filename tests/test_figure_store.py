@@ -0,0 +1,137 @@
+# test_figure_store.py
+
+import threading
+import os
+
+import matplotlib
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt  # noqa: E402
+import pytest  # noqa: E402
+
+from src.code_executor import SimpleCodeExecutor  # noqa: E402
+from src.figure_store import FigureStore, capture_figures, may_plot, track_figures  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def no_open_figures():
+    plt.close("all")
+    yield
+    plt.close("all")
+
+
+def executor(**variables):
+    return SimpleCodeExecutor(locals={}, globals={"__builtins__": __builtins__, **variables})
+
+
+def test_figures_of_a_run_are_captured_and_closed():
+    result = executor().run("import matplotlib.pyplot as plt\nplt.plot([1, 2, 3])\nplt.figure()\nplt.bar([1], [2])")
+    assert result.success
+    assert len(result.figures) == 2
+    assert result.figures[0]["mime"] == "image/png"
+    assert plt.get_fignums() == []
+
+
+def test_figures_opened_elsewhere_are_left_alone():
+    other = plt.figure()
+    plt.plot([1, 2])
+
+    result = executor().run("import matplotlib.pyplot as plt\nplt.figure()\nplt.plot([3, 2, 1])")
+    assert result.success
+    # Only the figure the run created is captured and closed
+    assert len(result.figures) == 1
+    assert plt.get_fignums() == [other.number]
+    assert len(other.axes[0].lines) == 1
+
+
+def test_empty_figures_are_skipped():
+    owned = []
+    with track_figures(owned):
+        plt.figure()
+    assert capture_figures(owned) == ([], [])
+    assert plt.get_fignums() == []
+
+
+def test_concurrent_runs_keep_their_figures_apart():
+    code = """
+import matplotlib.pyplot as plt
+import time
+fig = plt.figure()
+time.sleep(0.05)  # the other run would start meanwhile
+plt.plot(data)
+same = plt.gcf() is fig
+"""
+    executors = [executor(), executor()]
+    executors[0].locals["data"] = [1, 2, 3]
+    executors[1].locals["data"] = [3, 2, 1]
+    results = [None, None]
+
+    def run(i):
+        results[i] = executors[i].run(code)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for result, session in zip(results, executors):
+        assert result.success, result.output
+        assert session.locals["same"] is True
+        assert len(session.locals["fig"].axes[0].lines) == 1
+        assert len(result.figures) == 1
+    assert results[0].figures[0]["hash"] != results[1].figures[0]["hash"]
+    assert plt.get_fignums() == []
+
+
+# Which runs may plot
+
+def test_may_plot_follows_the_sessions_functions():
+    namespace = {}
+    exec("def draw(x):\n    plt.plot(x)\ndef report(x):\n    return draw(x)\ndef total(x):\n    return sum(x)", namespace)
+    assert may_plot({"plt"}, [namespace])
+    assert may_plot({"df", "plot"}, [namespace])  # df.plot()
+    assert may_plot({"report"}, [{}, namespace])
+    assert not may_plot({"total", "print"}, [namespace])
+
+
+def test_runs_that_dont_plot_leave_plotting_runs_figures_alone():
+    created, release = threading.Event(), threading.Event()
+    plotting = executor(created=created, release=release)
+    other = executor(created=created, release=release)
+    results = {}
+
+    def run():
+        results["plotting"] = plotting.run("plt = __import__('matplotlib.pyplot').pyplot\nplt.plot([1])\ncreated.set()\nrelease.wait(5)")
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    assert created.wait(5)
+    # Doesn't wait for the plotting run, and doesn't take its figure
+    results["other"] = other.run("x = 1")
+    release.set()
+    thread.join()
+
+    assert results["other"].success and results["other"].figures == []
+    assert len(results["plotting"].figures) == 1
+    assert plt.get_fignums() == []
+
+
+# Store
+
+def test_store_is_only_scanned_past_its_size_limit(tmp_path, monkeypatch):
+    store = FigureStore(root=str(tmp_path), max_bytes=25)
+    scans = []
+    entries = store._entries
+    monkeypatch.setattr(store, "_entries", lambda: scans.append(1) or entries())
+
+    first = store.put(b"1" * 10, "png", 1, 1)
+    store.put(b"2" * 10, "png", 1, 1)
+    store.put(b"2" * 10, "png", 1, 1)  # already stored: no bytes added
+    assert len(scans) == 1  # the first put learns the store's size
+    os.utime(first["path"], (1, 1))  # the least recently used
+
+    third = store.put(b"3" * 10, "png", 1, 1)
+    assert len(scans) == 2
+    assert not os.path.exists(first["path"]) and os.path.exists(third["path"])
+    assert store._total == 20
@@ -0,0 +1,45 @@
+# test_file_hashes.py
+
+import hashlib
+import os
+
+import src.file_hashes as file_hashes
+from src.file_hashes import FileHashes
+
+
+def write(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_chunked_hash_matches_a_one_shot_hash(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_hashes, "CHUNK_SIZE", 7)
+    data = bytes(range(256)) * 3
+    assert FileHashes().hash(write(tmp_path / "blob.bin", data)) == hashlib.sha256(data).hexdigest()
+
+
+def test_hash_is_reused_until_the_file_changes(tmp_path):
+    hashes = FileHashes()
+    path = write(tmp_path / "a.txt", b"first")
+    first = hashes.hash(path)
+    assert hashes.hash(path) == first
+    assert len(hashes) == 1
+
+    write(tmp_path / "a.txt", b"second!")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert hashes.hash(path) == hashlib.sha256(b"second!").hexdigest()
+
+
+def test_least_recently_used_hashes_are_dropped(tmp_path):
+    hashes = FileHashes(max_entries=2)
+    paths = [write(tmp_path / f"{i}.txt", bytes([i])) for i in range(3)]
+    hashes.hash(paths[0])
+    hashes.hash(paths[1])
+    hashes.hash(paths[0])  # now the most recently used
+    hashes.hash(paths[2])
+    assert len(hashes) == 2
+    assert [key[0] for key in hashes._hashes] == [paths[0], paths[2]]
+
+    hashes.clear()
+    assert len(hashes) == 0
@@ -0,0 +1,78 @@
+# test_groq_clients.py
+
+import asyncio
+
+import pytest
+
+import src.groq_clients as groq_clients
+from src.async_runtime import get_background_loop
+from src.concurrency import run_async
+from tests.stub_server import StubServer
+
+
+def chat_completions(method, path, query, body):
+    assert path.endswith("/chat/completions")
+    return 200, {
+        "id": "chatcmpl-test",
+        "object": "chat.completion",
+        "created": 0,
+        "model": body["model"],
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": f"echo: {body['messages'][-1]['content']}"},
+        }],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+    }
+
+
+@pytest.fixture
+def server(monkeypatch):
+    with StubServer(chat_completions) as server:
+        # Read by the Groq SDK when a client is created
+        monkeypatch.setenv("GROQ_BASE_URL", server.url)
+        groq_clients.get_groq_client.cache_clear()
+        groq_clients._async_clients.clear()
+        yield server
+        groq_clients.get_groq_client.cache_clear()
+        groq_clients._async_clients.clear()
+
+
+def ask(client, question):
+    return client.chat.completions.create(model="test", messages=[{"role": "user", "content": question}])
+
+
+async def ask_async(question):
+    response = await ask(groq_clients.get_async_groq_client(), question)
+    return response.choices[0].message.content
+
+
+def test_sync_client_is_shared_and_reuses_its_connection(server):
+    client = groq_clients.get_groq_client()
+    for i in range(5):
+        assert ask(groq_clients.get_groq_client(), str(i)).choices[0].message.content == f"echo: {i}"
+    assert groq_clients.get_groq_client() is client
+    assert len(server.requests) == 5
+    assert len(server.ports) == 1
+
+
+def test_run_async_reuses_the_background_loop_client(server):
+    assert run_async(*(ask_async(str(i)) for i in range(4))) == [f"echo: {i}" for i in range(4)]
+    ports = set(server.ports)
+    for _ in range(3):
+        run_async(ask_async("again"), ask_async("again"))
+
+    # One client, bound to the long-lived loop, whose pooled connections were reused
+    assert list(groq_clients._async_clients) == [get_background_loop().loop]
+    assert len(server.requests) == 10
+    assert server.ports == ports
+
+
+def test_clients_of_short_lived_loops_are_closed(server):
+    async def main():
+        await ask_async("hi")
+        return groq_clients.get_async_groq_client()
+
+    client = asyncio.run(main())
+    assert client.is_closed()
+    assert len(server.requests) == 1
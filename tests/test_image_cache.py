@@ -0,0 +1,175 @@
+# test_image_cache.py
+
+import base64
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import src.file_hashes as file_hashes
+import src.groq_clients as groq_clients
+import src.image_cache as image_cache
+from src.image_cache import ImageCache
+from tests.stub_server import StubServer
+
+
+def save(path, image, **options):
+    image.save(path, **options)
+    return str(path)
+
+
+def noise(size, mode="RGB"):
+    channels = {"RGB": 3, "RGBA": 4}[mode]
+    pixels = np.random.default_rng(0).integers(0, 256, (size[1], size[0], channels), dtype=np.uint8)
+    return Image.fromarray(pixels, mode)
+
+
+def decode(payload):
+    mime_type, data = payload
+    return mime_type, Image.open(io.BytesIO(base64.b64decode(data)))
+
+
+# Encoding
+
+def test_large_image_is_downscaled_and_reencoded_as_jpeg(tmp_path):
+    path = save(tmp_path / "photo.png", noise((1600, 800)))
+    cache = ImageCache(max_side=800, quality=70)
+    mime_type, image = decode(cache.payload(path))
+    assert mime_type == "image/jpeg"
+    assert image.size == (800, 400)
+    assert cache.stats["bytes_out"] < cache.stats["bytes_in"]
+
+
+def test_quality_sets_the_jpeg_size(tmp_path):
+    path = save(tmp_path / "photo.png", noise((800, 800)))
+    low = ImageCache(quality=30).payload(path)
+    high = ImageCache(quality=95).payload(path)
+    assert low[0] == high[0] == "image/jpeg"
+    assert len(low[1]) < len(high[1])
+
+
+def test_small_image_already_compact_is_sent_as_it_was(tmp_path):
+    path = save(tmp_path / "small.jpg", noise((64, 64)), quality=30)
+    with open(path, "rb") as f:
+        original = f.read()
+    mime_type, data = ImageCache(quality=95).payload(path)
+    assert mime_type == "image/jpeg"
+    assert base64.b64decode(data) == original
+
+
+@pytest.mark.parametrize("image", [noise((2000, 100), "RGBA"), Image.new("LA", (2000, 100), (128, 0))])
+def test_transparency_is_kept_as_png(tmp_path, image):
+    path = save(tmp_path / "logo.webp", image)
+    mime_type, decoded = decode(ImageCache(max_side=500).payload(path))
+    assert mime_type == "image/png"
+    assert decoded.size == (500, 25)
+    assert "A" in decoded.mode
+
+
+def test_palette_with_alpha_is_kept_as_png(tmp_path, monkeypatch):
+    # No file format opens as "PA": hand the encoder such an image directly
+    image = Image.new("RGBA", (40, 40), (255, 0, 0, 0)).convert("PA")
+    path = save(tmp_path / "logo.bmp", Image.new("RGB", (1, 1)))
+    open_image = Image.open
+    monkeypatch.setattr(image_cache.Image, "open", lambda *args: image.copy())
+    mime_type, encoded = ImageCache()._encode(path)
+    assert mime_type == "image/png"
+    assert open_image(io.BytesIO(encoded)).getpixel((0, 0))[3] == 0
+
+
+def test_not_an_image_is_rejected(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_text("hello")
+    with pytest.raises(ValueError, match="valid image"):
+        ImageCache().payload(str(path))
+
+
+# Caching
+
+def test_payload_is_cached_by_content(tmp_path):
+    image = noise((600, 600))
+    first = save(tmp_path / "a.png", image)
+    copy = save(tmp_path / "b.png", image)
+    cache = ImageCache(max_side=256)
+    assert cache.payload(first) == cache.payload(copy)
+    assert cache.stats["payload_misses"] == 1 and cache.stats["payload_hits"] == 1
+
+
+def test_changed_file_is_encoded_again(tmp_path):
+    path = save(tmp_path / "a.png", noise((100, 100)))
+    cache = ImageCache()
+    before = cache.payload(path)
+    save(tmp_path / "a.png", noise((120, 100)))
+    assert cache.payload(path) != before
+    assert cache.stats["payload_misses"] == 2
+
+
+def test_file_hashes_are_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_hashes, "MAX_HASHES", 3)
+    cache = ImageCache()
+    for i in range(5):
+        cache.file_hash(save(tmp_path / f"{i}.png", noise((4, 4))))
+    assert len(cache._hashes) == 3
+
+
+def test_answers_are_memoized_by_image_question_and_model(tmp_path):
+    image = noise((50, 50))
+    cache = ImageCache(answer_size=2)
+    key = cache.answer_key(save(tmp_path / "a.png", image), " What is it? ", "vlm-1")
+    assert key == cache.answer_key(save(tmp_path / "copy.png", image), "What is it?", "vlm-1")
+    assert key != cache.answer_key(str(tmp_path / "a.png"), "What is it?", "vlm-2")
+    assert key != cache.answer_key(str(tmp_path / "a.png"), "How big?", "vlm-1")
+
+    assert cache.get_answer(key) is None
+    cache.set_answer(key, "noise")
+    assert cache.get_answer(key) == "noise"
+    cache.set_answer(("x", "", ""), "1")
+    cache.set_answer(("y", "", ""), "2")
+    assert cache.get_answer(key) is None  # evicted
+    assert cache.stats["answer_hits"] == 1 and cache.stats["answer_misses"] == 2
+
+
+# analyze_image
+
+def vlm(method, path, query, body):
+    question = body["messages"][0]["content"][0]["text"]
+    return 200, {
+        "id": "chatcmpl-test",
+        "object": "chat.completion",
+        "created": 0,
+        "model": body["model"],
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": f"answer to {question}"},
+        }],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+    }
+
+
+@pytest.fixture
+def server(monkeypatch):
+    with StubServer(vlm) as server:
+        monkeypatch.setenv("GROQ_BASE_URL", server.url)
+        groq_clients.get_groq_client.cache_clear()
+        image_cache.get_image_cache.cache_clear()
+        yield server
+        groq_clients.get_groq_client.cache_clear()
+        image_cache.get_image_cache.cache_clear()
+
+
+def test_analyze_image_calls_the_vlm_once_per_question(server, tmp_path):
+    from tools.base_tools import analyze_image
+
+    path = save(tmp_path / "chart.png", noise((1000, 500)))
+    assert analyze_image(path, "What is shown?") == "answer to What is shown?"
+    assert analyze_image(path, "What is shown?") == "answer to What is shown?"
+    assert len(server.requests) == 1
+
+    # Another question about the same image needs the VLM, but not a new encoding
+    assert analyze_image(path, "Which colors?") == "answer to Which colors?"
+    assert len(server.requests) == 2
+    stats = image_cache.get_image_cache().stats
+    assert stats["payload_misses"] == 1 and stats["payload_hits"] == 1
+    assert stats["answer_hits"] == 1
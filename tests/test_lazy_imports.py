@@ -0,0 +1,69 @@
+# test_lazy_imports.py
+
+import subprocess
+import textwrap
+import sys
+import os
+
+from src.lazy_imports import LazyModule, lazy_import
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def run_python(code, **env):
+    """Run `code` in a fresh interpreter (from the project root) and return its stdout."""
+    result = subprocess.run(
+        [sys.executable, "-c", textwrap.dedent(code)],
+        cwd=ROOT, env={**os.environ, **env}, capture_output=True, text=True, timeout=120,
+    )
+    assert result.returncode == 0, result.stderr
+    return result.stdout.strip()
+
+
+# LazyModule
+
+def test_module_is_imported_on_first_use(tmp_path, monkeypatch):
+    (tmp_path / "lazy_probe.py").write_text("VALUE = 42\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, "lazy_probe", raising=False)
+
+    probe = lazy_import("lazy_probe")
+    assert isinstance(probe, LazyModule)
+    assert "lazy_probe" not in sys.modules
+
+    assert probe.VALUE == 42
+    assert "lazy_probe" in sys.modules
+    # Copied onto the proxy: later reads don't go through __getattr__
+    assert probe.__dict__["VALUE"] == 42
+
+
+def test_imported_modules_are_returned_as_is():
+    assert lazy_import("os") is os
+
+
+# Cold start
+
+def test_importing_the_tools_doesnt_import_heavy_libraries():
+    loaded = run_python("""
+        import sys
+        import tools.base_tools, tools.custom_tools_globalKyc
+        print(",".join(m for m in ("pandas", "numpy", "matplotlib") if m in sys.modules))
+    """)
+    assert loaded == ""
+
+
+def test_tools_are_discovered_once():
+    imports = run_python("""
+        import importlib
+        from src import demo_agent
+
+        calls = []
+        import_module = importlib.import_module
+        importlib.import_module = lambda name, *args: calls.append(name) or import_module(name, *args)
+
+        first = demo_agent.discover_tools()
+        assert demo_agent.discover_tools() is first
+        assert demo_agent.get_function_tools() is demo_agent.get_function_tools()
+        print(",".join(name for name in calls if name.startswith("tools.")))
+    """, AGENT_NAME="globalKyc")
+    assert imports.split(",") == ["tools.base_tools", "tools.custom_tools_globalKyc"]
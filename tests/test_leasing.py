@@ -0,0 +1,57 @@
+# test_leasing.py
+
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.bench_leasing import CITIES, make_portfolio, per_row, to_records
+from src.city_lookup import get_city_lookup
+from tools.custom_tools_globalKyc import _round_cents, design_leasing_offers
+
+
+def near_half_cents(magnitudes, per_magnitude=500, seed=0):
+    """Values at and a few ulps around x.xx5, positive and negative, across magnitudes."""
+    rng = random.Random(seed)
+    values = []
+    for exponent in magnitudes:
+        for _ in range(per_magnitude):
+            tie = rng.randrange(10 ** exponent, 10 ** (exponent + 1)) / 100 + 0.005
+            for steps in range(-3, 4):
+                value = tie
+                for _ in range(abs(steps)):
+                    value = np.nextafter(value, np.inf if steps > 0 else -np.inf)
+                values += [float(value), -float(value)]
+    return values
+
+
+@pytest.mark.parametrize("magnitudes", [range(0, 6), range(6, 12), range(12, 16)], ids=["small", "large", "huge"])
+def test_round_cents_matches_python_round(magnitudes):
+    values = near_half_cents(magnitudes)
+    expected = np.array([round(value, 2) for value in values])
+    assert np.array_equal(_round_cents(np.array(values)), expected)
+
+
+def test_round_cents_random_values():
+    rng = np.random.default_rng(0)
+    values = np.concatenate([rng.uniform(-1e3, 1e3, 10_000), rng.uniform(0, 1e12, 10_000), [0.0, 0.125, 2.675, 1.005]])
+    assert np.array_equal(_round_cents(values), np.array([round(value, 2) for value in values.tolist()]))
+
+
+@pytest.fixture(scope="module")
+def cities():
+    lookup = get_city_lookup()
+    lookup.preload((city, "DO", population) for city, population in CITIES.items())
+    lookup.preload([("Atlantis", "DO", None)])
+
+
+def test_batch_offers_match_the_single_customer_tool(cities):
+    customers = make_portfolio(2_000, seed=1)
+    assert to_records(design_leasing_offers(customers)) == per_row(customers)
+
+
+def test_batch_offers_accept_records(cities):
+    customers = make_portfolio(20, seed=2)
+    from_records = design_leasing_offers(customers.to_dict("records"))
+    pd.testing.assert_frame_equal(from_records, design_leasing_offers(customers))
@@ -0,0 +1,69 @@
+# test_llm_cache.py
+
+import asyncio
+import threading
+
+from llama_index.core.base.llms.types import ChatMessage, MessageRole
+from llama_index.core.llms import MockLLM
+
+from src.llm_cache import CachingLLM, ResponseStore
+
+MESSAGES = [
+    ChatMessage(role=MessageRole.SYSTEM, content="You are terse."),
+    ChatMessage(role=MessageRole.USER, content="What is the population of Santiago?"),
+]
+
+
+class ThreadRecordingStore(ResponseStore):
+    """In-memory store remembering which threads it was called from."""
+
+    def __init__(self):
+        super().__init__(":memory:")
+        self.threads = []
+
+    def get(self, key):
+        self.threads.append(threading.get_ident())
+        return super().get(key)
+
+    def put(self, key, response):
+        self.threads.append(threading.get_ident())
+        super().put(key, response)
+
+
+def test_sync_chat_is_stored_then_replayed():
+    llm = CachingLLM(MockLLM(), store=ResponseStore(":memory:"))
+    first = llm.chat(MESSAGES).message.content
+    assert llm.chat(MESSAGES).message.content == first
+    deltas = [r.delta for r in llm.stream_chat(MESSAGES)]
+    assert "".join(deltas) == first and len(deltas) > 1
+    assert llm.stats["hits"] == 2 and llm.stats["misses"] == 1
+
+
+def test_async_paths_keep_the_store_off_the_event_loop():
+    store = ThreadRecordingStore()
+    llm = CachingLLM(MockLLM(), store=store)
+
+    async def main():
+        loop_thread = threading.get_ident()
+        first = (await llm.achat(MESSAGES)).message.content
+        assert (await llm.achat(MESSAGES)).message.content == first
+
+        other = MESSAGES[:1] + [ChatMessage(role=MessageRole.USER, content="And of La Romana?")]
+        streamed = "".join([r.delta async for r in await llm.astream_chat(other)])
+        replayed = "".join([r.delta async for r in await llm.astream_chat(other)])
+        assert replayed == streamed
+        return loop_thread
+
+    loop_thread = asyncio.run(main())
+    # get + put, get, get + put after the stream, get
+    assert len(store.threads) == 6
+    assert loop_thread not in store.threads
+    assert llm.stats == {"hits": 2, "misses": 2, "bypassed": 0, "hit_rate": 0.5}
+
+
+def test_bypass_skips_lookups_but_stores():
+    store = ResponseStore(":memory:")
+    llm = CachingLLM(MockLLM(), store=store, bypass=True)
+    asyncio.run(llm.achat(MESSAGES))
+    assert llm.stats["bypassed"] == 1
+    assert store.size() > 0
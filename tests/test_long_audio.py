@@ -0,0 +1,246 @@
+# test_long_audio.py
+
+import asyncio
+import wave
+import io
+
+import numpy as np
+import pytest
+
+import src.long_audio as long_audio
+from src.long_audio import AudioDecodeError, LongAudioTranscriber, merge_overlap
+
+RATE = 1000
+WORD = 0.4  # seconds of "speech" per word
+GAP = 0.2  # seconds of silence after each word
+
+
+def speech(words, sampwidth=2):
+    """WAV where word i is a constant level 10 * (i + 1), followed by a short silence."""
+    gap = np.zeros(int(GAP * RATE), dtype=np.int32)
+    signal = np.concatenate([
+        part for i in range(words) for part in (np.full(int(WORD * RATE), 10 * (i + 1), dtype=np.int32), gap)
+    ])
+    out = io.BytesIO()
+    with wave.open(out, "wb") as sink:
+        sink.setnchannels(1)
+        sink.setsampwidth(sampwidth)
+        sink.setframerate(RATE)
+        if sampwidth == 3:
+            # Low three bytes of each little-endian int32
+            sink.writeframes(signal.astype("<i4").view(np.uint8).reshape(-1, 4)[:, :3].tobytes())
+        else:
+            sink.writeframes(signal.astype({1: np.uint8, 2: "<i2", 4: "<i4"}[sampwidth]).tobytes())
+    return out.getvalue()
+
+
+def fake_stt(requests):
+    """Transcribes `speech` segments: one word per run of non-silent samples, named after its level."""
+    def transcribe(name, data):
+        requests.append(name)
+        with wave.open(io.BytesIO(data), "rb") as source:
+            params = source.getparams()
+            raw = source.readframes(params.nframes)
+        samples = long_audio._samples(raw, params.sampwidth, params.nchannels)
+        words, previous = [], 0
+        for value in np.round(samples).astype(int):
+            if value and value != previous:
+                words.append(f"word{value // 10}")
+            previous = value
+        return " ".join(words)
+    return transcribe
+
+
+def transcriber(requests, **kwargs):
+    options = {"segment_seconds": 5, "overlap_seconds": 1, "search_seconds": 2, "max_workers": 4}
+    return LongAudioTranscriber(fake_stt(requests), **{**options, **kwargs})
+
+
+# merge_overlap
+
+def test_merge_drops_words_repeated_at_the_seam():
+    assert merge_overlap("one two three four", "three four five six") == "one two three four five six"
+
+
+def test_merge_ignores_case_and_punctuation():
+    assert merge_overlap("We went to the Park.", "the park, then home") == "We went to the Park. then home"
+
+
+def test_merge_without_overlap_concatenates():
+    assert merge_overlap("one two", "three four") == "one two three four"
+    assert merge_overlap("", "three") == "three"
+    assert merge_overlap("one", "") == "one"
+
+
+def test_merge_when_right_is_all_overlap():
+    assert merge_overlap("one two three", "two three") == "one two three"
+
+
+# Splitting
+
+def bounds_and_samples(stt, audio):
+    """Segment boundaries of a WAV, as `_segments` cuts it, and its samples."""
+    window = int(long_audio.WINDOW_SECONDS * RATE)
+    with wave.open(io.BytesIO(audio), "rb") as source:
+        samples = long_audio._samples(source.readframes(source.getnframes()), 2, 1)
+        rms, total = long_audio._rms(source, window)
+    return stt._split(rms, total, RATE, window, stt.segment_seconds), samples
+
+
+def test_split_cuts_in_silence_with_overlap():
+    stt = transcriber([])
+    audio = speech(30)
+    bounds, samples = bounds_and_samples(stt, audio)
+
+    assert bounds[0][0] == 0 and bounds[-1][1] == len(samples)
+    overlap = int(stt.overlap_seconds * RATE)
+    for (start, end), (next_start, _) in zip(bounds, bounds[1:]):
+        assert end - start <= int(stt.segment_seconds * RATE) + overlap
+        cut = next_start + overlap
+        assert end - cut == overlap
+        assert samples[cut] == 0  # at a pause, not inside a word
+
+    # The segments sent are the frames between the boundaries
+    segments = stt._segments(audio)
+    assert len(segments) == len(bounds)
+    for segment, (start, end) in zip(segments, bounds):
+        with wave.open(io.BytesIO(segment), "rb") as source:
+            assert source.getnframes() == end - start
+
+
+def test_loudness_is_measured_a_block_at_a_time(monkeypatch):
+    # Blocks that don't line up with the windows give the loudness of the whole signal
+    monkeypatch.setattr(long_audio, "RMS_BLOCK_SECONDS", 1.37)
+    window = int(long_audio.WINDOW_SECONDS * RATE)
+    with wave.open(io.BytesIO(speech(30)), "rb") as source:
+        samples = long_audio._samples(source.readframes(source.getnframes()), 2, 1)
+        rms, total = long_audio._rms(source, window)
+
+    assert total == len(samples)
+    count = len(samples) // window
+    whole = np.sqrt(np.mean(samples[:count * window].reshape(count, window) ** 2, axis=1))
+    np.testing.assert_allclose(rms, whole, rtol=1e-6)
+
+
+def test_short_audio_is_sent_whole():
+    requests = []
+    assert transcriber(requests).transcribe(speech(3), "short.wav") == "word1 word2 word3"
+    assert requests == ["short.wav"]
+
+
+@pytest.mark.parametrize("sampwidth", [2, 3, 4])
+def test_long_audio_is_split_transcribed_and_stitched(sampwidth):
+    requests = []
+    stt = transcriber(requests)
+    text = stt.transcribe(speech(40, sampwidth), "long.wav")
+    assert text == " ".join(f"word{i}" for i in range(1, 41))
+    assert len(requests) > 4
+    assert requests[0] == "long.000.wav"
+    assert stt.stats["segments"] == len(requests)
+
+
+def test_transcripts_are_cached():
+    requests = []
+    stt = transcriber(requests)
+    audio = speech(20)
+    assert stt.transcribe(audio) == stt.transcribe(audio)
+    assert stt.stats["hits"] == 1
+    assert len(requests) == stt.stats["segments"]
+
+
+def test_segments_of_high_rate_stereo_audio_fit_the_upload_limit():
+    rate, seconds = 48000, 20
+    tone = (1000 * np.sin(np.arange(rate * seconds) / 10)).astype("<i2")
+    out = io.BytesIO()
+    with wave.open(out, "wb") as sink:
+        sink.setnchannels(2)
+        sink.setsampwidth(2)
+        sink.setframerate(rate)
+        sink.writeframes(np.repeat(tone, 2).tobytes())
+    audio = out.getvalue()
+
+    sizes = []
+    limit = 1024 * 1024
+    # Long target segments: only the upload limit makes them shorter
+    stt = LongAudioTranscriber(
+        lambda name, data: sizes.append(len(data)) or "", segment_seconds=300, overlap_seconds=1, max_upload_bytes=limit
+    )
+    stt.transcribe(audio, "meeting.wav")
+    assert len(audio) > 3 * limit
+    assert len(sizes) >= 4
+    assert max(sizes) <= limit
+    # Every frame is sent (the overlap adds some more)
+    assert sum(sizes) >= len(audio)
+
+
+
+# Async
+
+def async_stt(requests, active):
+    """Async `fake_stt` recording the peak number of requests in flight."""
+    transcribe = fake_stt(requests)
+
+    async def atranscribe(name, data):
+        active.append(active[-1] + 1)
+        await asyncio.sleep(0.01)
+        active.append(active[-1] - 1)
+        return transcribe(name, data)
+    return atranscribe
+
+
+def test_async_transcription_splits_and_bounds_concurrency():
+    requests, active = [], [0]
+    stt = transcriber([], atranscribe_fn=async_stt(requests, active), max_workers=2)
+    text = asyncio.run(stt.atranscribe(speech(40), "long.wav"))
+    assert text == " ".join(f"word{i}" for i in range(1, 41))
+    assert len(requests) > 4 and stt.stats["segments"] == len(requests)
+    assert max(active) == 2
+
+    # Cached for sync and async callers alike
+    assert stt.transcribe(speech(40)) == text
+    assert asyncio.run(stt.atranscribe(speech(40))) == text
+    assert stt.stats["hits"] == 2
+
+
+def test_async_transcription_without_async_fn_runs_in_a_thread():
+    requests = []
+    stt = transcriber(requests)
+    assert asyncio.run(stt.atranscribe(speech(3), "short.wav")) == "word1 word2 word3"
+    assert requests == ["short.wav"]
+
+
+# Formats that need ffmpeg
+
+def test_compressed_audio_within_the_upload_limit_is_sent_as_is(monkeypatch):
+    monkeypatch.setattr(long_audio, "_to_wav", lambda data: pytest.fail("decoded audio that fits"))
+    calls = []
+    stt = LongAudioTranscriber(lambda name, data: calls.append((name, len(data))) or "hello", max_upload_bytes=1000)
+    assert stt.transcribe(b"ID3" + b"\0" * 100, "note.mp3") == "hello"
+    assert calls == [("note.mp3", 103)]
+
+
+def test_compressed_audio_over_the_upload_limit_is_decoded_and_split(monkeypatch):
+    wav = speech(40)
+    monkeypatch.setattr(long_audio, "_to_wav", lambda data: (wav, ""))
+    requests = []
+    stt = transcriber(requests, max_upload_bytes=20000)
+    text = stt.transcribe(b"ID3" + b"\0" * 25000, "note.mp3")
+    assert text == " ".join(f"word{i}" for i in range(1, 41))
+    assert requests[0] == "note.000.wav" and len(requests) > 4
+
+
+def test_undecodable_audio_within_the_upload_limit_is_sent_whole(monkeypatch):
+    monkeypatch.setattr(long_audio.shutil, "which", lambda name: None)
+    calls = []
+    stt = LongAudioTranscriber(lambda name, data: calls.append(name) or "hello", max_upload_bytes=1000)
+    assert stt.transcribe(b"\x1aE\xdf\xa3" + b"\0" * 100, "voice.webm") == "hello"
+    assert calls == ["voice.webm"]
+
+
+def test_undecodable_audio_over_the_upload_limit_fails_clearly(monkeypatch):
+    monkeypatch.setattr(long_audio.shutil, "which", lambda name: None)
+    calls = []
+    stt = LongAudioTranscriber(lambda name, data: calls.append(name) or "hello", max_upload_bytes=1000)
+    with pytest.raises(AudioDecodeError, match="ffmpeg is not installed"):
+        stt.transcribe(b"ID3" + b"\0" * 5000, "meeting.mp3")
+    assert calls == []
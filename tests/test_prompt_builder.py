@@ -0,0 +1,62 @@
+# test_prompt_builder.py
+
+import pytest
+
+from src.prompt_builder import PromptBuilder
+
+
+def words(text):
+    return len(text.split())
+
+
+def builder():
+    prompt = PromptBuilder(order=["codeact", "agent", "files"], token_counter=words)
+    prompt.set("codeact", "You can run code.")
+    prompt.set("agent", "Be concise.")
+    return prompt
+
+
+def test_prompt_is_built_once_while_nothing_changes():
+    prompt = builder()
+    first = prompt.build()
+    assert prompt.build() is first
+    assert prompt.builds == 1
+
+    # Setting a section to the same content isn't a change
+    assert prompt.set("agent", "Be concise.") is False
+    assert prompt.build() is first
+    assert prompt.builds == 1
+
+
+def test_prompt_is_rebuilt_when_a_section_changes():
+    prompt = builder()
+    prompt.build()
+    assert prompt.set("files", "Files: data.csv") is True
+    assert prompt.build() == "You can run code.\nBe concise.\nFiles: data.csv"
+    assert prompt.builds == 2
+
+
+def test_sections_keep_their_order_whatever_the_order_they_are_set_in():
+    prompt = PromptBuilder(order=["codeact", "agent", "files"], token_counter=words)
+    prompt.set("files", "Files: data.csv")
+    prompt.set("codeact", "You can run code.")
+    assert prompt.build() == "You can run code.\nFiles: data.csv"
+    prompt.set("agent", "Be concise.")
+    assert prompt.build() == "You can run code.\nBe concise.\nFiles: data.csv"
+
+    # An emptied section leaves no blank line behind
+    prompt.set("agent", "")
+    assert prompt.build() == "You can run code.\nFiles: data.csv"
+
+
+def test_token_counts_per_section():
+    prompt = builder()
+    assert prompt.token_counts() == {"codeact": 4, "agent": 2, "files": 0}
+    assert list(prompt.token_counts()) == prompt.order
+    prompt.set("files", "Files: data.csv, notes.txt")
+    assert prompt.token_counts()["files"] == 3
+
+
+def test_unknown_sections_are_rejected():
+    with pytest.raises(KeyError):
+        builder().set("other", "text")
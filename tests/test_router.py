@@ -0,0 +1,79 @@
+# test_router.py
+
+from types import SimpleNamespace
+
+import pytest
+
+from src.router import ModelRouter
+
+LARGE = "large-model"
+
+
+def router(**kwargs):
+    fast_llm = SimpleNamespace(metadata=SimpleNamespace(model_name="fast-model"))
+    return ModelRouter(fast_llm, **kwargs)
+
+
+# Decisions
+
+@pytest.mark.parametrize("query, has_files, reason", [
+    ("thanks, that's great", False, "light_turn"),
+    ("plot the monthly sales", False, "code_likely"),
+    ("what is 17 * 23?", False, "code_likely"),
+    ("what does this do? ```x = 1```", False, "code_likely"),
+    ("and the other one?", True, "files"),
+    ("tell me more " * 20, False, "long_query"),
+])
+def test_each_reason(query, has_files, reason):
+    decision = router().route(query, has_files, LARGE)
+    assert decision.reason == reason
+    assert decision.fast == (reason == "light_turn")
+    assert decision.model == ("fast-model" if decision.fast else LARGE)
+
+
+def test_reasons_take_precedence_in_order():
+    r = router(max_fast_chars=40)
+    long_code = "plot the monthly sales for every region please"
+    assert r.route(long_code, True, LARGE).reason == "long_query"
+    assert r.route("plot the monthly sales", True, LARGE).reason == "files"
+    assert r.route("plot the monthly sales", False, LARGE).reason == "code_likely"
+
+
+def test_features_are_reported():
+    decision = router().route("plot it", True, LARGE)
+    assert decision.features == {"query_chars": 7, "has_files": True, "code_likely": True}
+
+
+# Thresholds
+
+def test_max_fast_chars_changes_the_decision():
+    query = "could you say that again more briefly"
+    assert router().route(query, False, LARGE).reason == "light_turn"
+    assert router(max_fast_chars=10).route(query, False, LARGE).reason == "long_query"
+
+
+def test_files_can_stay_on_the_fast_model():
+    assert router(files_to_large=False).route("and the other one?", True, LARGE).reason == "light_turn"
+
+
+def test_code_pattern_changes_the_decision():
+    assert router().route("say hello in french", False, LARGE).reason == "light_turn"
+    assert router(code_pattern=r"\bfrench\b").route("say hello in French", False, LARGE).reason == "code_likely"
+    assert router(code_pattern=r"\bfrench\b").route("plot it", False, LARGE).reason == "light_turn"
+
+
+# Latency
+
+def test_latency_is_aggregated_per_model():
+    r = router()
+    r.record("fast-model", 1.0, 0.2)
+    r.record("fast-model", 3.0, 0.4)
+    r.record(LARGE, 5.0)
+
+    summary = r.summary()
+    assert summary["fast-model"] == {"turns": 2, "mean_total": 2.0, "mean_ttft": pytest.approx(0.3)}
+    assert summary[LARGE] == {"turns": 1, "mean_total": 5.0, "mean_ttft": 0.0}
+
+
+def test_summary_is_empty_before_any_turn():
+    assert router().summary() == {}
@@ -0,0 +1,321 @@
+# test_scheduler.py
+
+import asyncio
+import threading
+import time
+from email.utils import formatdate
+from types import SimpleNamespace
+
+import pytest
+
+from src.scheduler import RequestScheduler, is_retryable, retry_after
+
+
+class APIStatusError(Exception):
+    """Stand-in for an SDK error carrying the HTTP response."""
+
+    def __init__(self, status, headers=None):
+        super().__init__(f"HTTP {status}")
+        self.status_code = status
+        self.response = SimpleNamespace(status_code=status, headers=headers or {})
+
+
+class APIConnectionError(Exception):
+    pass
+
+
+@pytest.fixture
+def scheduler():
+    return RequestScheduler("test", rpm=0, tpm=0, max_retries=3, backoff=0.001, max_backoff=0.01)
+
+
+def failing(*errors, result="ok"):
+    """fn raising `errors` in turn, then returning `result`; counts its calls."""
+    calls = []
+
+    def fn():
+        calls.append(time.monotonic())
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+
+    return fn, calls
+
+
+# Retries
+
+@pytest.mark.parametrize("exc, expected", [
+    (APIStatusError(429), True),
+    (APIStatusError(408), True),
+    (APIStatusError(500), True),
+    (APIStatusError(503), True),
+    (APIStatusError(400), False),
+    (APIStatusError(401), False),
+    (APIStatusError(404), False),
+    (APIConnectionError(), True),
+    (ValueError(), False),
+])
+def test_is_retryable(exc, expected):
+    assert is_retryable(exc) is expected
+
+
+def test_retry_after_headers():
+    assert retry_after(APIStatusError(429, {"retry-after-ms": "250"})) == 0.25
+    assert retry_after(APIStatusError(429, {"retry-after": "2"})) == 2.0
+    assert 8 <= retry_after(APIStatusError(429, {"retry-after": formatdate(time.time() + 10, usegmt=True)})) <= 10
+    assert retry_after(APIStatusError(429, {"retry-after": "soon"})) is None
+    assert retry_after(APIStatusError(429)) is None
+    assert retry_after(ValueError()) is None
+
+
+def test_transient_failures_are_retried(scheduler):
+    fn, calls = failing(APIStatusError(503), APIConnectionError())
+    assert scheduler.call(fn) == "ok"
+    assert len(calls) == 3
+    assert scheduler.stats["retries"] == 2
+    assert scheduler.stats["requests"] == 1 and scheduler.stats["failures"] == 0
+
+
+def test_permanent_failures_are_not_retried(scheduler):
+    fn, calls = failing(APIStatusError(400))
+    with pytest.raises(APIStatusError):
+        scheduler.call(fn)
+    assert len(calls) == 1
+    assert scheduler.stats["retries"] == 0 and scheduler.stats["failures"] == 1
+
+
+def test_gives_up_after_max_retries(scheduler):
+    fn, calls = failing(*[APIStatusError(500)] * 10)
+    with pytest.raises(APIStatusError):
+        scheduler.call(fn)
+    assert len(calls) == scheduler.max_retries + 1
+    assert scheduler.stats["failures"] == 1
+
+
+def test_retry_after_is_honored_and_pauses_the_queue(scheduler):
+    limited = threading.Event()
+    errors = [APIStatusError(429, {"retry-after-ms": "300"})]
+    calls = []
+
+    def fn():
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            limited.set()
+            raise errors[0]
+        return "ok"
+
+    leader = threading.Thread(target=scheduler.call, args=(fn,))
+    leader.start()
+    assert limited.wait(5)
+    # Other requests wait for the pause too
+    waited = scheduler.acquire()
+    leader.join()
+
+    assert len(calls) == 2
+    assert calls[1] - calls[0] >= 0.3
+    assert waited >= 0.2
+
+
+def test_async_retries(scheduler):
+    attempts = []
+
+    async def fn():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise APIStatusError(502)
+        return "ok"
+
+    assert asyncio.run(scheduler.acall(fn)) == "ok"
+    assert len(attempts) == 3
+    assert scheduler.stats["retries"] == 2
+
+
+def test_settled_usage_is_given_back():
+    scheduler = RequestScheduler("test", tpm=1000)
+    scheduler.call(lambda: {"tokens": 100}, tokens=600, usage=lambda result: result["tokens"])
+    assert scheduler.tokens.level == pytest.approx(900, abs=5)
+
+
+# Coalescing
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_identical_requests_in_flight_are_sent_once(scheduler):
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return object()
+
+    results = [None] * 5
+
+    def call(i):
+        results[i] = scheduler.call(fn, key="same")
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(5)]
+    for thread in threads:
+        thread.start()
+    wait_for(lambda: scheduler.stats["coalesced"] == 4)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert scheduler.stats["requests"] == 1
+
+    # Completed requests aren't cached: the next one is sent again
+    scheduler.call(fn, key="same")
+    assert len(calls) == 2
+
+
+def test_coalesced_requests_share_the_failure(scheduler):
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        raise APIStatusError(400)
+
+    errors = []
+
+    def call():
+        try:
+            scheduler.call(fn, key="same")
+        except APIStatusError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    wait_for(lambda: scheduler.stats["coalesced"] == 2)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert len(errors) == 3 and errors[0] is errors[1] is errors[2]
+
+
+def test_requests_without_key_or_with_other_keys_are_not_coalesced(scheduler):
+    calls = []
+
+    async def fn(value):
+        calls.append(value)
+        await asyncio.sleep(0.02)
+        return value
+
+    async def main():
+        return await asyncio.gather(
+            scheduler.acall(lambda: fn("a"), key="a"),
+            scheduler.acall(lambda: fn("a"), key="a"),
+            scheduler.acall(lambda: fn("b"), key="b"),
+            scheduler.acall(lambda: fn("n")),
+            scheduler.acall(lambda: fn("n")),
+        )
+
+    assert asyncio.run(main()) == ["a", "a", "b", "n", "n"]
+    assert sorted(calls) == ["a", "b", "n", "n"]
+    assert scheduler.stats["coalesced"] == 1
+
+
+def test_coalesced_request_waits_for_the_leaders_retries(scheduler):
+    fn, calls = failing(APIStatusError(503), APIStatusError(503))
+    started = threading.Event()
+
+    def slow():
+        started.set()
+        time.sleep(0.05)
+        return fn()
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(scheduler.call(slow, key="k")))
+    leader.start()
+    assert started.wait(5)
+    results.append(scheduler.call(slow, key="k"))
+    leader.join()
+
+    assert results == ["ok", "ok"]
+    assert len(calls) == 3
+    assert scheduler.stats["coalesced"] == 1
+
+
+def test_cancelled_follower_doesnt_cancel_the_shared_result(scheduler):
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return "ok"
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        leader = loop.run_in_executor(None, lambda: scheduler.call(fn, key="same"))
+        await loop.run_in_executor(None, wait_for, lambda: len(calls) == 1)
+        followers = [asyncio.ensure_future(scheduler.acall(lambda: None, key="same")) for _ in range(3)]
+        await loop.run_in_executor(None, wait_for, lambda: scheduler.stats["coalesced"] == 3)
+        followers[0].cancel()
+        await asyncio.sleep(0.01)
+        release.set()
+        results = await asyncio.gather(leader, *followers, return_exceptions=True)
+        return results
+
+    results = asyncio.run(main())
+    assert isinstance(results[1], asyncio.CancelledError)
+    assert results[0] == results[2] == results[3] == "ok"
+    assert len(calls) == 1
+
+
+# Dispatcher
+
+def test_waiter_on_a_closed_loop_doesnt_stop_the_dispatcher():
+    scheduler = RequestScheduler("test", tpm=1000)
+    scheduler.pause(0.1)  # queue requests
+
+    # An async waiter (see aacquire) whose loop goes away while it's queued
+    loop = asyncio.new_event_loop()
+    scheduler._enqueue(300, 0, lambda: loop.call_soon_threadsafe(lambda: None))
+    assert scheduler.queue_depth()["interactive"] == 1
+    loop.close()
+    dispatcher = scheduler._dispatcher
+
+    # Granted after the pause; waking it fails, later requests are still served
+    done = threading.Event()
+    threading.Thread(target=lambda: (scheduler.acquire(), done.set()), daemon=True).start()
+    assert done.wait(5)
+    assert scheduler._dispatcher is dispatcher and dispatcher.is_alive()
+    # The grant that couldn't be delivered was given back
+    assert scheduler.tokens.level == pytest.approx(1000, abs=5)
+    assert scheduler.queue_depth()["interactive"] == 0
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_dead_dispatcher_is_replaced():
+    scheduler = RequestScheduler("test")
+    scheduler.pause(0.05)
+
+    class Crash(BaseException):
+        pass
+
+    def crash():
+        raise Crash()
+
+    # A wake failing in a way the dispatcher doesn't handle ends its thread
+    waiter = scheduler._enqueue(0, 0, crash)
+    first = scheduler._dispatcher
+    first.join(5)
+    assert not first.is_alive() and waiter.granted
+    assert scheduler._dispatcher is None
+
+    scheduler.pause(0.05)
+    assert scheduler.acquire() >= 0.03
+    assert scheduler._dispatcher is not None and scheduler._dispatcher is not first
@@ -0,0 +1,136 @@
+# test_spillable_namespace.py
+
+import os
+
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+
+from src import spillable_namespace
+from src.spillable_namespace import SpillableNamespace
+
+MB = 2**20
+
+
+@pytest.fixture
+def namespace(tmp_path):
+    # Budget of 1 MB, everything over 64 KB may be spilled
+    namespace = SpillableNamespace(budget_mb=1, min_spill_mb=1 / 16, spill_dir=str(tmp_path))
+    yield namespace
+    namespace.close()
+
+
+def frame(rows=100_000):
+    return pd.DataFrame({"a": np.arange(rows), "b": np.random.default_rng(0).random(rows)})
+
+
+def test_coldest_object_is_spilled_and_reloaded(namespace):
+    namespace["old"] = frame()
+    namespace.touch(["old"])
+    namespace.enforce_budget(used=["old"])
+    namespace["new"] = frame()
+    namespace.touch(["new"])
+
+    assert namespace.enforce_budget(used=["new"]) == ["old"]
+    assert not dict.__contains__(namespace, "old")
+    assert namespace.usage()["spills"] == 1
+
+    pdt.assert_frame_equal(namespace["old"], frame())
+    assert dict.__contains__(namespace, "old")
+    assert namespace.usage()["reloads"] == 1
+    assert not os.listdir(namespace._folder)
+
+
+def frames_parquet_changes():
+    rows = 20_000
+    index = pd.Index(np.arange(rows) * 2, name="key")
+    # Written as Parquet without an error, but the ints come back as int64
+    yield pd.DataFrame({"ints": pd.Series(list(range(rows)), dtype=object, index=index)})
+    # Column names Parquet can't store
+    yield pd.DataFrame(
+        {
+            0: pd.Series(list(range(rows)), dtype=object),
+            ("x", 1): pd.Categorical(["a", "b"] * (rows // 2)),
+            "mixed": [1, "a", None, 2.5] * (rows // 4),
+        },
+        index=index,
+    )
+
+
+@pytest.mark.parametrize("original", list(frames_parquet_changes()))
+def test_frames_round_trip_exactly(namespace, original):
+    namespace["df"] = original.copy()
+    namespace["hot"] = frame()
+    namespace.touch(["hot"])
+
+    assert namespace.enforce_budget(used=["hot"]) == ["df"]
+    reloaded = namespace["df"]
+    pdt.assert_frame_equal(reloaded, original)
+    assert type(reloaded.iloc[1, 0]) is int
+
+
+def test_arrays_reload_memory_mapped_and_copy_on_write(namespace):
+    namespace["array"] = np.arange(200_000, dtype=np.float64)
+    namespace["hot"] = frame()
+    namespace.touch(["hot"])
+    assert namespace.enforce_budget(used=["hot"]) == ["array"]
+
+    array = namespace["array"]
+    assert isinstance(array, np.memmap)
+    array[0] = -1
+    np.testing.assert_array_equal(array[1:], np.arange(1, 200_000))
+
+
+def test_reassigning_a_spilled_name_drops_its_file(namespace):
+    namespace["df"] = frame()
+    namespace["hot"] = frame()
+    namespace.touch(["hot"])
+    namespace.enforce_budget(used=["hot"])
+    assert os.listdir(namespace._folder)
+
+    namespace["df"] = 1
+    assert namespace["df"] == 1
+    assert not os.listdir(namespace._folder)
+
+
+def test_aliases_count_once_and_are_not_spilled(namespace):
+    df = frame(40_000)
+    namespace["df"] = df
+    namespace["alias"] = df
+    namespace.touch(["df"])
+
+    # ~0.6 MB counted once fits the 1 MB budget
+    assert namespace.enforce_budget() == []
+    assert namespace.usage()["in_memory_bytes"] == df.memory_usage(deep=True).sum()
+
+    namespace["hot"] = frame()
+    namespace.touch(["hot"])
+    assert namespace.enforce_budget(used=["hot"]) == []
+    assert namespace["df"] is namespace["alias"]
+
+
+def test_sizes_are_cached_per_object(namespace, monkeypatch):
+    calls = []
+    estimate_size = spillable_namespace.estimate_size
+    monkeypatch.setattr(spillable_namespace, "estimate_size", lambda value: calls.append(1) or estimate_size(value))
+
+    df = frame(1000)
+    namespace["df"] = df
+    namespace["alias"] = df
+    for _ in range(3):
+        namespace.touch(["df"])
+        namespace.enforce_budget(used=["df"])
+    assert len(calls) == 1
+
+    # A new column changes the shape, so the frame is measured again
+    df["c"] = 1.0
+    namespace.enforce_budget(used=["df"])
+    assert len(calls) == 2
+    assert namespace.usage()["in_memory_bytes"] == df.memory_usage(deep=True).sum()
+
+
+def test_unlimited_budget_never_spills(tmp_path):
+    namespace = SpillableNamespace({"df": frame()}, budget_mb=0, spill_dir=str(tmp_path))
+    assert namespace.enforce_budget() == []
+    assert namespace.usage()["in_memory_bytes"] > MB
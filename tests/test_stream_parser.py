@@ -0,0 +1,98 @@
+# test_stream_parser.py
+
+import random
+import re
+
+import pytest
+
+from src.stream_parser import CLOSE_TAG, OPEN_TAG, ExecuteStreamParser
+
+SAMPLES = [
+    "Let me compute that.\n<execute>\nx = 1 < 2\nprint(x)\n</execute>\nDone: a<b, </exec is not a tag.",
+    "<execute>print(1)</execute><execute></execute>trailing <execu",
+    "no code at all, just < and <e and </execute",
+    "text <execute>\nfor i in range(3):\n    print('<execute>' [:3])",
+    "",
+]
+
+
+def reference(text):
+    """Chunks of a complete response, parsed in one go."""
+    chunks = []
+    parts = re.split(f"({re.escape(OPEN_TAG)}|{re.escape(CLOSE_TAG)})", text)
+    state, buffer = "text", ""
+    for part in parts:
+        expected_tag = OPEN_TAG if state == "text" else CLOSE_TAG
+        if part == expected_tag:
+            if buffer.strip() or state == "code":
+                chunks.append((state, buffer.strip()))
+            state, buffer = ("code" if state == "text" else "text"), ""
+        else:
+            buffer += part
+    if buffer.strip() or state == "code":
+        chunks.append((state, buffer.strip()))
+    return chunks
+
+
+def parse(deltas):
+    parser = ExecuteStreamParser()
+    events = []
+    for delta in deltas:
+        events += parser.feed(delta)
+    events += parser.close()
+    return events
+
+
+def completed(events):
+    return [(event.type, event.content) for event in events if event.done]
+
+
+def split(text, cuts):
+    bounds = [0, *sorted(cuts), len(text)]
+    return [text[a:b] for a, b in zip(bounds, bounds[1:])]
+
+
+@pytest.mark.parametrize("text", SAMPLES)
+def test_every_single_split_point(text):
+    expected = reference(text)
+    for cut in range(len(text) + 1):
+        assert completed(parse(split(text, [cut]))) == expected, cut
+
+
+@pytest.mark.parametrize("text", SAMPLES)
+def test_character_by_character(text):
+    assert completed(parse(list(text))) == reference(text)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_splits(seed):
+    rng = random.Random(seed)
+    text = "".join(rng.choice(["a", "<", ">", "\n", OPEN_TAG, CLOSE_TAG, "<exe", "cute>", "</"]) for _ in range(60))
+    cuts = rng.sample(range(len(text) + 1), rng.randint(1, 10))
+    assert completed(parse(split(text, cuts))) == reference(text)
+
+
+def test_pieces_add_up_to_each_chunk():
+    text = SAMPLES[0]
+    events = parse(split(text, [5, 24, 27, 40, 60]))
+    pieces = ""
+    for event in events:
+        if event.done:
+            assert pieces.strip() == event.content
+            pieces = ""
+        else:
+            pieces += event.content
+
+
+def test_a_possible_tag_start_is_held_back_until_resolved():
+    parser = ExecuteStreamParser()
+    assert [(e.type, e.content) for e in parser.feed("hi <exec")] == [("text", "hi ")]
+    assert [(e.type, e.content) for e in parser.feed("ution")] == [("text", "<execution")]
+
+
+def test_tool_result_closes_the_open_chunk():
+    parser = ExecuteStreamParser()
+    parser.feed("<execute>print(1)")
+    events = parser.tool_result(" 1\n")
+    assert completed(events) == [("code", "print(1)"), ("tool", "1")]
+    assert parser.state == "text"
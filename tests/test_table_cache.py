@@ -0,0 +1,94 @@
+# test_table_cache.py
+
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+
+from src import file_hashes, table_cache
+from src.table_cache import TableCache
+
+
+@pytest.fixture
+def csv_file(tmp_path):
+    path = tmp_path / "customers.csv"
+    pd.DataFrame(
+        {"id": range(1000), "age": [30 + i % 40 for i in range(1000)], "country": ["DO", "CL"] * 500}
+    ).to_csv(path, index=False)
+    return path
+
+
+def test_load_keeps_the_parsed_dtypes_by_default(csv_file):
+    df = TableCache().load(str(csv_file))
+    assert df["age"].dtype == "int64"
+    assert not isinstance(df["country"].dtype, pd.CategoricalDtype)
+
+    # Arithmetic doesn't overflow and new values can be assigned
+    assert (df["age"] * 10_000).max() == 690_000
+    df.loc[0, "country"] = "AR"
+
+
+def test_compact_load_shrinks_dtypes(csv_file):
+    cache = TableCache()
+    compact = cache.load(str(csv_file), compact=True)
+    assert compact["age"].dtype == "int8"
+    assert isinstance(compact["country"].dtype, pd.CategoricalDtype)
+
+    # Cached apart from the full-width frame
+    assert cache.load(str(csv_file))["age"].dtype == "int64"
+    assert cache.stats == {"hits": 0, "misses": 2, "evictions": 0}
+    pdt.assert_frame_equal(cache.load(str(csv_file), compact=True), compact)
+
+
+def test_column_subset_is_cut_from_the_cached_frame(csv_file):
+    cache = TableCache()
+    cache.load(str(csv_file))
+    df = cache.load(str(csv_file), columns=["country", "age"])
+    assert list(df.columns) == ["country", "age"]
+    assert cache.stats["hits"] == 1
+
+    # A compact subset isn't cut from the plain frame
+    assert cache.load(str(csv_file), columns=["age"], compact=True)["age"].dtype == "int8"
+    assert cache.stats["misses"] == 2
+
+
+def test_copies_are_independent(csv_file):
+    cache = TableCache()
+    df = cache.load(str(csv_file))
+    df.loc[0, "age"] = -1
+    assert cache.load(str(csv_file)).loc[0, "age"] == 30
+
+
+def test_previews_and_hashes_are_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(table_cache, "MAX_PREVIEWS", 3)
+    monkeypatch.setattr(file_hashes, "MAX_HASHES", 4)
+    cache = TableCache()
+    paths = []
+    for i in range(6):
+        path = tmp_path / f"t{i}.csv"
+        pd.DataFrame({"x": [i]}).to_csv(path, index=False)
+        paths.append(str(path))
+        assert cache.preview(str(path))["head"] == [{"x": i}]
+
+    assert len(cache._previews) == 3
+    assert len(cache._hashes) == 4
+    # Most recently used entries are kept
+    assert cache.preview(paths[-1])["rows"] == 1
+    assert (cache.file_hash(paths[-1]), None) in cache._previews
+
+
+def test_clear_drops_frames_previews_and_hashes(csv_file):
+    cache = TableCache()
+    cache.load(str(csv_file))
+    cache.preview(str(csv_file))
+    cache.clear()
+    assert not cache._frames and not cache._previews and not cache._hashes
+
+    cache.load(str(csv_file))
+    assert cache.stats["misses"] == 2
+
+
+def test_changed_file_is_read_again(csv_file):
+    cache = TableCache()
+    cache.load(str(csv_file))
+    pd.DataFrame({"id": [1], "age": [2], "country": ["AR"]}).to_csv(csv_file, index=False)
+    assert cache.load(str(csv_file))["country"].tolist() == ["AR"]
@@ -0,0 +1,173 @@
+# test_tracing.py
+
+import asyncio
+import json
+import stat
+
+import pytest
+import requests
+
+from src import tracing
+from src.city_lookup import CityLookup
+from src.tracing import span
+from tests.stub_server import StubServer
+
+
+@pytest.fixture
+def trace_file(tmp_path):
+    path = tmp_path / "traces" / "spans.jsonl"
+    tracing.configure(str(path))
+    yield path
+    tracing.disable()
+
+
+def read_spans(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_trace_file_is_private(trace_file):
+    with span("test.private"):
+        pass
+    assert stat.S_IMODE(trace_file.stat().st_mode) == 0o600
+    assert [s["name"] for s in read_spans(trace_file)] == ["test.private"]
+
+
+def test_children_share_the_trace(trace_file):
+    with span("test.parent") as parent:
+        with span("test.child"):
+            pass
+    child, parent_record = read_spans(trace_file)
+    assert child["trace_id"] == parent_record["trace_id"] == parent.trace_id
+    assert child["parent_id"] == parent.span_id
+
+
+def test_redacted_span_keeps_only_the_error_type(trace_file):
+    with pytest.raises(ValueError):
+        with span("test.redacted", redact=True):
+            raise ValueError("customer 42 in Santiago")
+    (record,) = read_spans(trace_file)
+    assert record["status"] == "error"
+    assert record["attributes"] == {"error": "ValueError"}
+
+
+@pytest.mark.filterwarnings("ignore:.*no custom tools")
+def test_tool_spans_record_errors_by_type_only(trace_file):
+    from src.demo_agent import discover_tools
+
+    preview_table = discover_tools()["preview_table"]
+    with pytest.raises(Exception):
+        preview_table("/missing/customer 42 Santiago.csv")
+    assert "Santiago" not in trace_file.read_text()
+    record = read_spans(trace_file)[-1]
+    assert record["name"] == "tool.preview_table"
+    assert record["status"] == "error" and list(record["attributes"]) == ["error"]
+
+
+
+@pytest.mark.filterwarnings("ignore:.*no custom tools")
+def test_agent_call_span_records_errors_by_type_only(trace_file):
+    from benchmarks.scripted_llm import ScriptedLLM
+    from src.demo_agent import DemoAgent
+
+    class Router:
+        fast_llm = None
+
+        def route(self, query, **kwargs):
+            raise ValueError(f"can't route {query!r}")
+
+    agent = DemoAgent(llm=ScriptedLLM(), router=Router())
+    try:
+        with pytest.raises(ValueError):
+            agent("customer 42 in Santiago", ctx=None)
+    finally:
+        agent.close()
+    assert "Santiago" not in trace_file.read_text()
+    record = read_spans(trace_file)[-1]
+    assert record["name"] == "agent.call"
+    assert record["status"] == "error" and record["attributes"]["error"] == "ValueError"
+
+def test_city_fetch_span_carries_no_customer_data(trace_file):
+    def city_api(method, path, query, body):
+        if query["name"] == ["Broken"]:
+            return 500, {"error": "unavailable"}
+        return 200, [{"population": 691262}]
+
+    with StubServer(city_api) as server:
+        lookup = CityLookup(api_key="test", url=server.url + "/v1/city", db_path=None)
+        assert lookup.population("Santiago", "DO") == 691262
+        with pytest.raises(requests.HTTPError):
+            lookup.population("Broken", "DO")
+
+    text = trace_file.read_text()
+    assert "Santiago" not in text and "Broken" not in text
+    ok, failed = read_spans(trace_file)
+    assert ok["attributes"] == {}
+    assert failed["attributes"] == {"error": "HTTPError"}
+
+
+def test_end_with_lasts_until_the_work_is_done(trace_file):
+    async def work(release):
+        with span("test.inner"):
+            await release.wait()
+        return "done"
+
+    async def main():
+        release = asyncio.Event()
+        with span("test.call") as s:
+            task = asyncio.ensure_future(work(release))
+            s.end_with(task)
+        await asyncio.sleep(0.05)
+        assert s.duration is None
+        release.set()
+        assert await task == "done"
+        await asyncio.sleep(0)
+        return s
+
+    s = asyncio.run(main())
+    assert s.duration >= 0.05
+    inner, outer = read_spans(trace_file)
+    assert (inner["name"], outer["name"]) == ("test.inner", "test.call")
+    assert inner["parent_id"] == outer["span_id"]
+    assert outer["status"] == "ok"
+
+
+def test_end_with_records_failures_of_awaitables(trace_file):
+    class Handler:
+        # Awaitable without add_done_callback, like a workflow handler
+        def __init__(self, coro):
+            self.coro = coro
+
+        def __await__(self):
+            return self.coro.__await__()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("workflow failed")
+
+    async def main():
+        with span("test.call") as s:
+            s.end_with(Handler(fail()))
+        assert s.duration is None
+        await asyncio.sleep(0.05)
+        return s
+
+    s = asyncio.run(main())
+    assert s.duration is not None
+    (record,) = read_spans(trace_file)
+    assert record["status"] == "error"
+    assert record["attributes"]["error"] == "RuntimeError: workflow failed"
+
+
+def test_exception_in_block_ends_a_deferred_span(trace_file):
+    async def main():
+        future = asyncio.get_running_loop().create_future()
+        with pytest.raises(KeyError):
+            with span("test.call") as s:
+                s.end_with(future)
+                raise KeyError("x")
+        assert s.duration is not None
+        future.cancel()
+
+    asyncio.run(main())
+    (record,) = read_spans(trace_file)
+    assert record["status"] == "error"
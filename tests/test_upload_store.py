@@ -0,0 +1,97 @@
+# test_upload_store.py
+
+import hashlib
+import io
+import os
+
+import src.upload_store as upload_store
+from src.upload_store import UploadStore
+
+
+def upload(data, name):
+    file = io.BytesIO(data)
+    file.name = name
+    return file
+
+
+def stored_files(store):
+    return sorted(path for _, _, path in store._entries())
+
+
+def age(path, seconds_ago):
+    """Set a stored file's last use `seconds_ago`."""
+    when = os.path.getmtime(path) - seconds_ago
+    os.utime(path, (when, when))
+
+
+# Deduplication
+
+def test_identical_bytes_are_stored_once(tmp_path):
+    store = UploadStore(root=str(tmp_path))
+    first = store.put(upload(b"a,b\n1,2\n", "data.csv"))
+    second = store.put(upload(b"a,b\n1,2\n", "data.csv"))
+    assert first == second
+    assert len(stored_files(store)) == 1
+    assert open(first, "rb").read() == b"a,b\n1,2\n"
+
+    # Other content is stored apart, and no temporary files are left behind
+    other = store.put(upload(b"a,b\n3,4\n", "data.csv"))
+    assert other != first
+    assert len(stored_files(store)) == 2
+    assert not [name for name in os.listdir(tmp_path) if name.startswith(".incoming-")]
+
+
+def test_chunked_hash_matches_a_one_shot_hash(tmp_path, monkeypatch):
+    monkeypatch.setattr(upload_store, "CHUNK_SIZE", 7)
+    data = bytes(range(256)) * 3
+    path = UploadStore(root=str(tmp_path)).put(upload(data, "blob.bin"))
+    assert os.path.basename(os.path.dirname(path)) == hashlib.sha256(data).hexdigest()
+    assert open(path, "rb").read() == data
+
+
+def test_name_defaults_to_the_file_name(tmp_path):
+    store = UploadStore(root=str(tmp_path))
+    assert store.put(upload(b"x", "dir/report.txt")).endswith(os.sep + "report.txt")
+    assert store.put(upload(b"x", "report.txt"), name="renamed.txt").endswith(os.sep + "renamed.txt")
+
+
+# Eviction
+
+def test_least_recently_used_files_are_evicted_past_the_size_limit(tmp_path):
+    store = UploadStore(root=str(tmp_path), max_bytes=25)
+    old = store.put(upload(b"o" * 10, "old.txt"))
+    age(old, 30)
+    used = store.put(upload(b"u" * 10, "used.txt"))
+    age(used, 20)
+    assert store.touch(old)  # now the most recently used
+
+    new = store.put(upload(b"n" * 10, "new.txt"))
+    assert [os.path.exists(path) for path in (old, used, new)] == [True, False, True]
+    assert store.size() == 20
+    # The emptied content folder is removed too
+    assert not os.path.exists(os.path.dirname(used))
+
+
+def test_kept_files_are_not_evicted(tmp_path):
+    store = UploadStore(root=str(tmp_path), max_bytes=20)
+    old = store.put(upload(b"o" * 10, "old.txt"))
+    age(old, 30)
+    new = store.put(upload(b"n" * 10, "new.txt"))
+    age(new, 20)
+
+    # Over the limit, but the oldest file is kept: the next one goes instead
+    store.max_bytes = 10
+    store.cleanup(keep=[old])
+    assert os.path.exists(old) and not os.path.exists(new)
+
+    # A file just put is never evicted, even if it alone exceeds the limit
+    big = store.put(upload(b"b" * 20, "big.txt"))
+    assert os.path.exists(big) and not os.path.exists(old)
+
+
+def test_touch_reports_evicted_files(tmp_path):
+    store = UploadStore(root=str(tmp_path), max_bytes=10)
+    first = store.put(upload(b"1" * 10, "first.txt"))
+    age(first, 30)
+    store.put(upload(b"2" * 10, "second.txt"))
+    assert not store.touch(first)
@@ -1,19 +1,67 @@
 # base_tools.py
 
-from groq import Groq as GroqClient
-
+from typing import Any, List, Optional
 from dotenv import load_dotenv
+import sys
 import os
 
 from pathlib import Path
-import mimetypes
-import base64
+
+# Add the parent directory (project root) to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.async_runtime import run_in_thread
+from src.groq_clients import get_async_groq_client, get_groq_client
+from src.image_cache import get_image_cache
+from src.multimodal import get_transcriber
+from src.scheduler import estimate_tokens, get_scheduler
+from src.table_cache import get_table_cache
+from src.tracing import span
 
 load_dotenv()
-GROK_API_KEY = os.getenv("GROK_API_KEY")
-STT = os.getenv("STT")
 VLM = os.getenv("VLM")
 
+# Rough token cost of an image for rate limiting (settled with the reported usage)
+IMAGE_TOKENS = 1500
+
+
+def _audio_path(path_to_audio: str) -> Path:
+    # Validate path
+    path = Path(path_to_audio).expanduser().resolve()
+    if not path.is_file():
+        raise FileNotFoundError(f"No such audio file: {path}")
+    return path
+
+def _image_path(path_to_image: str) -> Path:
+    # Validate path
+    path = Path(path_to_image).expanduser().resolve()
+    if not path.is_file():
+        raise FileNotFoundError(f"No such image file: {path}")
+    return path
+
+def _image_messages(path: Path, question: str) -> list:
+    # Downscaled, re-encoded image, cached by content hash
+    mime_type, base64_image = get_image_cache().payload(str(path))
+
+    return [
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": question},
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": f"data:{mime_type};base64,{base64_image}",
+                    },
+                },
+            ],
+        }
+    ]
+
+def _usage(chat_completion) -> Optional[int]:
+    # Tokens reported by the API, to settle the rate limit estimate
+    usage = getattr(chat_completion, "usage", None)
+    return getattr(usage, "total_tokens", None)
 
 def transcribe_audio(path_to_audio: str) -> str:
     """
@@ -23,75 +71,108 @@ def transcribe_audio(path_to_audio: str) -> str:
     Returns:
         str: The transcribed text content of the audio.
     """
-    
-    # Validate path
-    path = Path(path_to_audio).expanduser().resolve()
-    if not path.is_file():
-        raise FileNotFoundError(f"No such audio file: {path}")
+    path = _audio_path(path_to_audio)
 
-    # Initialize the Groq client
-    client = GroqClient(api_key=GROK_API_KEY) 
-    
-    # Open the audio file
-    with open(path_to_audio, "rb") as audio_file:
-        # Create a transcription of the audio file
-        transcription = client.audio.transcriptions.create(
-            file=audio_file,
-            model=STT,
-            response_format="text",
-            temperature=0.1
-        )
+    # Long recordings are split into overlapping segments transcribed in parallel
+    return get_transcriber().transcribe(path.read_bytes(), path.name)
 
-    return transcription.strip()
+async def transcribe_audio_async(path_to_audio: str) -> str:
+    """Async version of `transcribe_audio`."""
+    path = _audio_path(path_to_audio)
+    data = await run_in_thread(path.read_bytes)
+    return await get_transcriber().atranscribe(data, path.name)
 
 def analyze_image(path_to_image: str, question: str) -> str:
     """
     Analyzes an image and generates a response to a given question based on the image's content.
-    
+
     Args:
         path_to_image (str): The path to the image file to be analyzed.
         question (str): The question to be answered, based on the contents of the image.
-        
+
     Returns:
         str: The response from a VLM, typically a textual analysis or description based on the image.
     """
+    path = _image_path(path_to_image)
 
-    # Validate path
-    path = Path(path_to_image).expanduser().resolve()
-    if not path.is_file():
-        raise FileNotFoundError(f"No such image file: {path}")
+    # Same question about the same image with the same model: reuse the answer
+    cache = get_image_cache()
+    key = cache.answer_key(str(path), question, VLM)
+    analysis = cache.get_answer(key)
+    if analysis is not None:
+        return analysis
 
-    def encode_image(image_path):
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
-    
-    # Get the MIME type (e.g., image/png, image/jpeg)
-    mime_type, _ = mimetypes.guess_type(path_to_image)
-    if mime_type is None:
-        raise ValueError("Unsupported file type. Please provide a valid image.")
-
-    base64_image = encode_image(path_to_image)
-
-    # Initialize the Groq client
-    client = GroqClient(api_key=GROK_API_KEY)
-    
-    chat_completion = client.chat.completions.create(
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": question},
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:{mime_type};base64,{base64_image}",
-                        },
-                    },
-                ],
-            }
-        ],
-        model=VLM,
-    )
-    
-    analysis = chat_completion.choices[0].message.content
-    return analysis.strip()
\ No newline at end of file
+    with span("vlm.request", model=VLM):
+        chat_completion = get_scheduler(VLM).call(
+            lambda: get_groq_client().chat.completions.create(
+                messages=_image_messages(path, question),
+                model=VLM,
+            ),
+            tokens=estimate_tokens(len(question)) + IMAGE_TOKENS,
+            key=key,
+            usage=_usage,
+        )
+
+    analysis = chat_completion.choices[0].message.content.strip()
+    cache.set_answer(key, analysis)
+    return analysis
+
+async def analyze_image_async(path_to_image: str, question: str) -> str:
+    """Async version of `analyze_image`."""
+    path = _image_path(path_to_image)
+
+    cache = get_image_cache()
+    key = cache.answer_key(str(path), question, VLM)
+    analysis = cache.get_answer(key)
+    if analysis is not None:
+        return analysis
+
+    with span("vlm.request", model=VLM):
+        chat_completion = await get_scheduler(VLM).acall(
+            lambda: get_async_groq_client().chat.completions.create(
+                messages=_image_messages(path, question),
+                model=VLM,
+            ),
+            tokens=estimate_tokens(len(question)) + IMAGE_TOKENS,
+            key=key,
+            usage=_usage,
+        )
+
+    analysis = chat_completion.choices[0].message.content.strip()
+    cache.set_answer(key, analysis)
+    return analysis
+
+def load_table(
+    path_to_file: str, columns: Optional[List[str]] = None, sheet: Optional[str] = None, compact: bool = False
+) -> Any:
+    """
+    Loads a CSV, TSV, Parquet or Excel file into a pandas DataFrame. Prefer this over
+    pd.read_csv/read_parquet/read_excel: files are parsed once and cached, so loading
+    the same file again is instant.
+
+    Args:
+        path_to_file (str): The path to the table file.
+        columns (list[str], optional): Only load these columns; loading just the columns you need is much faster.
+        sheet (str, optional): Excel sheet name (defaults to the first sheet).
+        compact (bool, optional): Use less memory for read-only analysis of a large table: integers are
+            downcast (arithmetic may overflow) and repetitive text columns become categories (new values
+            can't be assigned to them). Defaults to False.
+
+    Returns:
+        pd.DataFrame: The table.
+    """
+    return get_table_cache().load(path_to_file, columns=columns, sheet=sheet, compact=compact)
+
+def preview_table(path_to_file: str, sheet: Optional[str] = None) -> dict:
+    """
+    Returns the schema, row count and first rows of a CSV, TSV, Parquet or Excel file
+    without loading it in full. Use it to see which columns to load with `load_table`.
+
+    Args:
+        path_to_file (str): The path to the table file.
+        sheet (str, optional): Excel sheet name (defaults to the first sheet).
+
+    Returns:
+        dict: `rows` (row count), `columns` (name -> dtype), `head` (first rows as records) and `file_bytes`.
+    """
+    return get_table_cache().preview(path_to_file, sheet=sheet)
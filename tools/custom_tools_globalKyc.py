@@ -1,13 +1,28 @@
 # custom_tools_globalKyc.py
 
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
 from dotenv import load_dotenv
+import sys
 import os
 
 import datetime
 import requests
 
+# Add the parent directory (project root) to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.city_lookup import get_city_lookup
+from src.lazy_imports import lazy_import
+
+# Only imported when the batch tool is first used
+pd = lazy_import("pandas")
+np = lazy_import("numpy")
+
 load_dotenv()
-NINJAS_API_KEY = os.getenv("NINJAS_API_KEY")
+
+# Max concurrent zone lookups in batch mode
+ZONE_LOOKUP_WORKERS = 16
 
 def categorize_zone(city: str, country: str) -> str:
     """
@@ -20,23 +35,11 @@ def categorize_zone(city: str, country: str) -> str:
     Returns:
     - str: 'URBAN' if population > 50,000, else 'RURAL'.
     """
-    url = 'https://api.api-ninjas.com/v1/city'
-    headers = {'X-Api-Key': NINJAS_API_KEY}
-    params = {
-        'name': city,
-        'country': country
-    }
-
     try:
-        response = requests.get(url, headers=headers, params=params)
-        response.raise_for_status()
-        data = response.json()
-
-        if data:
-            print(data)
-            population = data[0].get('population')
-            if population is not None:
-                return 'URBAN' if population > 50000 else 'RURAL'
+        # Cached (memory, then SQLite) before going to the API
+        population = get_city_lookup().population(city, country)
+        if population is not None:
+            return 'URBAN' if population > 50000 else 'RURAL'
         # No match for request
         return f"NO data is available for {city}, {country}."
     except requests.exceptions.RequestException as e:
@@ -130,4 +133,96 @@ def design_leasing_offer(
         "contract_term_years": contract_term_years,
         "residual_value": round(residual_value, 2),
         "purchase_option": True
-    }
\ No newline at end of file
+    }
+
+def _round_cents(values: "np.ndarray") -> "np.ndarray":
+    """Vectorized round(x, 2) that agrees with Python's round() to the last bit."""
+    rounded = np.round(values, 2)
+    # np.round can only disagree when x * 100 sits within a few ulps of a half-cent;
+    # the window scales with the magnitude, as float spacing does
+    scaled = values * 100
+    near_half = np.isclose(scaled - np.floor(scaled), 0.5, rtol=0, atol=np.spacing(np.abs(scaled)) * 4)
+    rounded[near_half] = [round(v, 2) for v in values[near_half].tolist()]
+    return rounded
+
+# DataFrames are annotated as Any: tool schemas are built with pydantic, which can't model them
+def design_leasing_offers(customers: Any) -> Any:
+    """
+    Designs leasing offers for many customers at once. Use this instead of calling
+    `design_leasing_offer` in a loop; results are identical to the single-customer tool.
+
+    Parameters:
+    - customers (pd.DataFrame | list[dict] | dict[str, list]): One row (or record) per
+      customer with columns `customer_id` (str), `birthdate` (str, 'DD-MM-YYYY'),
+      `income` (float, monthly), `city` (str) and `vehicle_year` (int).
+      Anything else `pd.DataFrame(customers)` accepts works too.
+
+    Returns:
+    - pd.DataFrame: One row per customer with the same fields as `design_leasing_offer`.
+      Offer fields are empty for ineligible customers and `reason` is empty for eligible ones.
+    """
+    if not isinstance(customers, pd.DataFrame):
+        customers = pd.DataFrame(customers)
+    today = datetime.datetime.today()
+    current_year = datetime.datetime.now().year
+
+    vehicle_age = current_year - customers["vehicle_year"].to_numpy(dtype=np.int64)
+
+    birthdate = pd.to_datetime(customers["birthdate"], format="%d-%m-%Y")
+    birth_year = birthdate.dt.year.to_numpy()
+    birth_month = birthdate.dt.month.to_numpy()
+    birth_day = birthdate.dt.day.to_numpy()
+    before_birthday = (today.month < birth_month) | ((today.month == birth_month) & (today.day < birth_day))
+    customer_age = today.year - birth_year - before_birthday
+
+    # Eligibility Check (same order as the single-customer tool)
+    too_new = vehicle_age <= 5
+    bad_age = ~too_new & ((customer_age < 18) | (customer_age > 65))
+    eligible = ~too_new & ~bad_age
+    reason = np.select(
+        [too_new, bad_age],
+        ["vehicle is less than or equal to 5 years old.", "customer age must be between 18 and 65."],
+        default=None,
+    )
+
+    # Income Segmentation
+    income = customers["income"].to_numpy(dtype=float)
+    low = income < 10000
+    medium = (10000 <= income) & (income < 100000)
+    income_segment = np.select([low, medium], ["low", "medium"], default="high")
+    base_rate = np.select([low, medium], [0.10, 0.20], default=0.30)
+    contract_term_years = np.select([low, medium], [2, 3], default=5)
+
+    # Zone Classification, one lookup per distinct city of an eligible customer
+    cities = customers["city"].to_numpy(dtype=object)
+    unique_cities = pd.unique(cities[eligible])
+    with ThreadPoolExecutor(max_workers=max(1, min(ZONE_LOOKUP_WORKERS, len(unique_cities)))) as pool:
+        zones = dict(zip(unique_cities, pool.map(lambda city: categorize_zone(city, "DO").lower(), unique_cities)))
+    zone_type = np.array(
+        [zones[city] if zones[city] in ("urban", "rural") else "unknown" for city in cities[eligible]],
+        dtype=object,
+    )
+    base_rate[eligible] += np.where(zone_type == "urban", 0.05, 0.0)
+
+    # Monthly Payment Calculation and Residual Value Estimation
+    monthly_payment = base_rate[eligible] * income[eligible]
+    residual_value = np.maximum(0, 1 - (vehicle_age[eligible] * 0.10)) * 1_000_000
+
+    def only_eligible(values, dtype):
+        column = pd.Series(pd.NA, index=customers.index, dtype=dtype)
+        column[eligible] = values
+        return column
+
+    return pd.DataFrame({
+        "customer_id": customers["customer_id"].to_numpy(),
+        "eligible": eligible,
+        "reason": reason,
+        "customer_age": only_eligible(customer_age[eligible], "Int64"),
+        "vehicle_age": only_eligible(vehicle_age[eligible], "Int64"),
+        "income_segment": only_eligible(income_segment[eligible], "object"),
+        "zone_type": only_eligible(zone_type, "object"),
+        "monthly_payment": only_eligible(_round_cents(monthly_payment), "Float64"),
+        "contract_term_years": only_eligible(contract_term_years[eligible], "Int64"),
+        "residual_value": only_eligible(_round_cents(residual_value), "Float64"),
+        "purchase_option": only_eligible(True, "boolean"),
+    }, index=customers.index)